@@ -0,0 +1,12 @@
+"""
+Load and latency benchmarks for the REST api.
+
+Run from the project directory, e.g.:
+
+    python -m benchmarks run --users 5000 --packs 500 --output before.json
+    python -m benchmarks compare before.json after.json
+    python -m benchmarks catalog --packs 100
+
+The data is seeded in a throwaway test database, the real one is never
+touched.
+"""
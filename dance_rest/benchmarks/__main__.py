@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import sys
+from contextlib import nullcontext
+
+
+def main(argv=None):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dance_rest.settings')
+    import django
+    django.setup()
+    from django.test.utils import override_settings
+    from benchmarks import runner
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='seed the data and run the '
+                                          'benchmarks')
+    run.add_argument('--users', type=int, default=2000)
+    run.add_argument('--artists', type=int, default=200)
+    run.add_argument('--locations', type=int, default=30)
+    run.add_argument('--events', type=int, default=2000)
+    run.add_argument('--packs', type=int, default=500)
+    run.add_argument('--bookings', type=int, default=10000)
+    run.add_argument('--requests', type=int, default=200,
+                     help='requests per endpoint')
+    run.add_argument('--concurrency', type=int, default=8)
+    run.add_argument('--endpoint', action='append', dest='endpoints',
+                     help='benchmark only this endpoint, can be repeated')
+    run.add_argument('--database-file',
+                     help='sqlite file for the throwaway database, in '
+                          'memory by default')
+    run.add_argument('--no-cache', action='store_true',
+                     help='disable the django cache (catalog cache)')
+    run.add_argument('--output', help='write the json report to this file')
+
+    login = commands.add_parser('login', help='login throughput of the '
+                                              'sync and async token views')
+    login.add_argument('--users', type=int, default=200)
+    login.add_argument('--requests', type=int, default=64)
+    login.add_argument('--concurrency', type=int, default=16)
+    login.add_argument('--database-file')
+    login.add_argument('--output', help='write the json report to this file')
+
+    catalog = commands.add_parser('catalog', help='catalog rendering with '
+                                                  'the serializer and the '
+                                                  'projections')
+    catalog.add_argument('--packs', type=int, default=100,
+                         help='packs rendered per page')
+    catalog.add_argument('--repeat', type=int, default=50)
+    catalog.add_argument('--events', type=int, default=2000)
+    catalog.add_argument('--total-packs', type=int, default=500)
+    catalog.add_argument('--database-file')
+    catalog.add_argument('--output', help='write the json report to this '
+                                          'file')
+
+    diff = commands.add_parser('compare', help='compare two json reports')
+    diff.add_argument('old')
+    diff.add_argument('new')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        print(runner.compare(old, new))
+        return
+
+    if args.command == 'login':
+        from benchmarks import login as login_benchmark
+        sizes = {'users': args.users, 'artists': 0, 'locations': 0,
+                 'events': 0, 'packs': 0, 'bookings': 0}
+        report = login_benchmark.run(sizes, requests=args.requests,
+                                     concurrency=args.concurrency,
+                                     database_file=args.database_file,
+                                     stdout=sys.stderr)
+        print(runner.format_report(report))
+        if args.output:
+            runner.dump(report, args.output)
+        return
+
+    if args.command == 'catalog':
+        from benchmarks import catalog as catalog_benchmark
+        sizes = {'users': 10, 'artists': 200, 'locations': 30,
+                 'events': args.events, 'packs': args.total_packs,
+                 'bookings': 0}
+        report = catalog_benchmark.run(sizes, packs=args.packs,
+                                       repeat=args.repeat,
+                                       database_file=args.database_file,
+                                       stdout=sys.stderr)
+        print(runner.format_report(report))
+        print('identical output: %s' % report['meta']['identical'])
+        if args.output:
+            runner.dump(report, args.output)
+        return
+
+    sizes = {name: getattr(args, name) for name in
+             ('users', 'artists', 'locations', 'events', 'packs',
+              'bookings')}
+    caches = {'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }} if args.no_cache else None
+    with override_settings(CACHES=caches) if caches else nullcontext():
+        report = runner.run(sizes, requests=args.requests,
+                            concurrency=args.concurrency,
+                            endpoints=args.endpoints,
+                            database_file=args.database_file,
+                            stdout=sys.stderr)
+    report['meta']['cache'] = not args.no_cache
+
+    print(runner.format_report(report))
+    if args.output:
+        runner.dump(report, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# benchmarks/catalog.py
+# rendering time of a catalog page with PackListSerializers and with the
+# values() projections of booking.projections
+
+import time
+
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from benchmarks.runner import make_report, seeded_database, summarize
+from booking.views import BookingPackList
+from core.middleware import QueryCounter
+
+PATHS = {'serializer': False, 'projections': True}
+
+
+def render_page(packs, projections):
+    """load and render the first packs of the catalog, return the json"""
+    view = BookingPackList()
+    view.format_kwarg = None
+    view.request = view.initialize_request(APIRequestFactory().get('/'))
+    with override_settings(BOOKING_CATALOG_PROJECTIONS=projections):
+        page = list(view.get_queryset()[:packs])
+        return JSONRenderer().render(view.serialize_packs(page))
+
+
+def run(sizes, packs=100, repeat=50, database_file=None, stdout=None):
+    """render the page repeat times with each path, check they match"""
+    with seeded_database(sizes, database_file) as (users, seed_time):
+        report = make_report(sizes, repeat, 1, seed_time)
+        report['meta']['packs'] = packs
+        outputs = {}
+        for name, projections in PATHS.items():
+            if stdout is not None:
+                stdout.write('%s ...\n' % name)
+            results = []
+            start = time.perf_counter()
+            for i in range(repeat):
+                counter = QueryCounter()
+                with connection.execute_wrapper(counter):
+                    started = time.perf_counter()
+                    outputs[name] = render_page(packs, projections)
+                    results.append((time.perf_counter() - started,
+                                    counter.queries, 200))
+            report['endpoints'][name] = summarize(
+                results, time.perf_counter() - start
+            )
+        report['meta']['identical'] = \
+            outputs['serializer'] == outputs['projections']
+        return report
@@ -0,0 +1,54 @@
+# benchmarks/login.py
+# login throughput of the sync token view and of its async version, both
+# driven concurrently through the ASGI request handler
+
+import asyncio
+import json
+import time
+
+from django.test import AsyncClient
+from django.urls import reverse
+
+from benchmarks.runner import make_report, seeded_database, summarize
+from benchmarks.seed import PASSWORD
+from core.middleware import QueryCounter, current_counter
+
+
+async def drive(url, users, requests, concurrency):
+    """post the credentials of the users, concurrency requests at a time"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login(i):
+        user = users[i % len(users)]
+        async with semaphore:
+            counter = QueryCounter()
+            current_counter.set(counter)
+            start = time.perf_counter()
+            response = await AsyncClient().post(
+                url, json.dumps({'email': user.email, 'password': PASSWORD}),
+                content_type='application/json',
+            )
+            return (time.perf_counter() - start, counter.queries,
+                    response.status_code)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login(i) for i in range(requests)))
+    return summarize(results, time.perf_counter() - start)
+
+
+def run(sizes, requests=64, concurrency=16, database_file=None,
+        stdout=None):
+    """benchmark the token endpoints, sync (before) and async (after)"""
+    endpoints = {
+        'token': reverse('users:token'),
+        'token_async': reverse('users:token_async'),
+    }
+    with seeded_database(sizes, database_file) as (users, seed_time):
+        report = make_report(sizes, requests, concurrency, seed_time)
+        for name, url in endpoints.items():
+            if stdout is not None:
+                stdout.write('POST %s ...\n' % url)
+            report['endpoints'][name] = asyncio.run(
+                drive(url, users, requests, concurrency)
+            )
+        return report
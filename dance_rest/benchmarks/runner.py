@@ -0,0 +1,194 @@
+# benchmarks/runner.py
+# drive the api concurrently with the django test client and report the
+# latency percentiles, throughput and queries per endpoint
+
+import json
+import math
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import django
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, \
+                              teardown_test_environment
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from benchmarks.seed import PASSWORD, seed
+from core.middleware import QueryCounter
+
+
+def get_endpoints():
+    """name -> (method, url) of the benchmarked endpoints"""
+    return {
+        'catalog': ('get', reverse('booking:booking')),
+        'token': ('post', reverse('users:token')),
+        'me': ('get', reverse('users:me')),
+        'details': ('get', reverse('users:details')),
+    }
+
+
+def percentile(values, pct):
+    """nearest rank percentile of a sorted list"""
+    if not values:
+        return None
+    rank = math.ceil(pct / 100.0 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class Benchmark:
+    """run the requests of one endpoint from a pool of threads"""
+
+    def __init__(self, users, tokens, concurrency):
+        self.users = users
+        self.tokens = tokens
+        self.concurrency = concurrency
+
+    def request(self, method, url, i):
+        user = self.users[i % len(self.users)]
+        client = Client()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            if method == 'post':
+                response = client.post(url, {'email': user.email,
+                                             'password': PASSWORD})
+            else:
+                response = client.get(
+                    url, HTTP_AUTHORIZATION='Token ' + self.tokens[user.pk]
+                )
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        return elapsed, counter.queries, response.status_code
+
+    def run(self, method, url, requests):
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            start = time.perf_counter()
+            results = list(pool.map(
+                lambda i: self.request(method, url, i), range(requests)
+            ))
+            wall_time = time.perf_counter() - start
+        return summarize(results, wall_time)
+
+
+def summarize(results, wall_time):
+    latencies = sorted(elapsed * 1000 for elapsed, _, _ in results)
+    queries = [count for _, count, _ in results]
+    errors = sum(1 for _, _, code in results if code >= 400)
+    return {
+        'requests': len(results),
+        'errors': errors,
+        'requests_per_second': len(results) / wall_time if wall_time else 0,
+        'latency_ms': {
+            'mean': sum(latencies) / len(latencies),
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1],
+        },
+        'queries': {
+            'mean': sum(queries) / len(queries),
+            'max': max(queries),
+        },
+    }
+
+
+@contextmanager
+def seeded_database(sizes, database_file=None):
+    """
+    create a throwaway test database seeded with the given sizes (keyword
+    arguments of benchmarks.seed.seed), yield the users and the seconds
+    taken by the seeding
+    """
+    setup_test_environment(debug=False)
+    if database_file:
+        connection.settings_dict['TEST']['NAME'] = database_file
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        start = time.perf_counter()
+        users = seed(**sizes)
+        yield users, time.perf_counter() - start
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def make_report(sizes, requests, concurrency, seed_time):
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'sizes': sizes,
+            'requests': requests,
+            'concurrency': concurrency,
+            'seed_seconds': seed_time,
+        },
+        'endpoints': {},
+    }
+
+
+def run(sizes, requests=200, concurrency=8, endpoints=None,
+        database_file=None, stdout=None):
+    """seed a throwaway database, benchmark the endpoints and report"""
+    with seeded_database(sizes, database_file) as (users, seed_time):
+        tokens = dict(Token.objects.values_list('user_id', 'key'))
+        benchmark = Benchmark(users, tokens, concurrency)
+        report = make_report(sizes, requests, concurrency, seed_time)
+        for name, (method, url) in get_endpoints().items():
+            if endpoints and name not in endpoints:
+                continue
+            if stdout is not None:
+                stdout.write('%s %s ...\n' % (method.upper(), url))
+            report['endpoints'][name] = benchmark.run(method, url, requests)
+        return report
+
+
+def format_report(report):
+    lines = ['%-10s %8s %8s %8s %8s %8s %8s' % (
+        'endpoint', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries',
+        'errors')]
+    for name, stats in report['endpoints'].items():
+        latency = stats['latency_ms']
+        lines.append('%-10s %8.1f %8.2f %8.2f %8.2f %8.1f %8d' % (
+            name, stats['requests_per_second'], latency['p50'],
+            latency['p95'], latency['p99'], stats['queries']['mean'],
+            stats['errors']))
+    return '\n'.join(lines)
+
+
+def compare(old, new):
+    """table of the changes between two reports"""
+    lines = ['%-10s %-8s %10s %10s %8s' % ('endpoint', 'metric', 'old',
+                                           'new', 'change')]
+    for name, stats in new['endpoints'].items():
+        if name not in old['endpoints']:
+            continue
+        old_stats = old['endpoints'][name]
+        metrics = [
+            ('req/s', old_stats['requests_per_second'],
+             stats['requests_per_second']),
+            ('queries', old_stats['queries']['mean'],
+             stats['queries']['mean']),
+        ] + [
+            (pct + ' ms', old_stats['latency_ms'][pct],
+             stats['latency_ms'][pct])
+            for pct in ('p50', 'p95', 'p99')
+        ]
+        for metric, before, after in metrics:
+            change = (after - before) / before * 100 if before else 0
+            lines.append('%-10s %-8s %10.2f %10.2f %+7.1f%%' % (
+                name, metric, before, after, change))
+    return '\n'.join(lines)
+
+
+def dump(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
@@ -0,0 +1,124 @@
+# benchmarks/seed.py
+# synthetic data for the benchmarks, created with bulk operations
+
+import random
+from io import StringIO
+from datetime import date, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from booking.search import is_supported
+from core.db.bulk import bulk_create
+from core.models import User, UserDetails, Artist, Location, Event, Pack, \
+                        Booking
+
+PASSWORD = 'benchmark123'
+BATCH_SIZE = 1000
+
+STYLES = ['Lindy Hop', 'Balboa', 'Charleston', 'Blues', 'Salsa', 'Tango']
+ARTIST_TYPES = ['Teacher', 'Band', 'DJ']
+EVENT_TYPES = ['Class', 'Workshop', 'Social Dance', 'Festival']
+CITIES = ['Padova', 'Milano', 'Torino', 'Bologna', 'Roma', 'Venezia']
+
+
+def seed(users=1000, artists=100, locations=20, events=1000, packs=300,
+         bookings=5000, events_per_pack=3, seed=0):
+    """
+    create the benchmark data set and return the seeded users, all of
+    them have the password PASSWORD and an auth token
+    """
+    rnd = random.Random(seed)
+    # hashing is the slow part of creating users and it is not what is
+    # measured here, every user shares the same hash
+    password = make_password(PASSWORD)
+
+    user_list = bulk_create(User, [
+        User(email='user%d@bench.io' % i, password=password)
+        for i in range(users)
+    ], BATCH_SIZE)
+    UserDetails.objects.bulk_create(
+        [UserDetails(user=user, name='Name %d' % user.pk,
+                     surname='Surname %d' % user.pk, address='via roma 1',
+                     city=rnd.choice(CITIES), country='Italia',
+                     tel='+39000000000', privacy=True)
+         for user in user_list],
+        batch_size=BATCH_SIZE,
+    )
+    Token.objects.bulk_create(
+        [Token(user=user, key=Token.generate_key()) for user in user_list],
+        batch_size=BATCH_SIZE,
+    )
+
+    artist_list = bulk_create(
+        Artist,
+        [Artist(name='Artist %d' % i, style=rnd.choice(STYLES),
+                type=rnd.choice(ARTIST_TYPES), description='',
+                country='Italia')
+         for i in range(artists)],
+        BATCH_SIZE,
+    )
+    location_list = bulk_create(
+        Location,
+        [Location(name='Location %d' % i, address='via roma %d' % i,
+                  city=rnd.choice(CITIES), room='main')
+         for i in range(locations)],
+        BATCH_SIZE,
+    )
+
+    start = date(2021, 1, 1)
+    event_list = bulk_create(
+        Event,
+        [Event(name='Event %d' % i, type=rnd.choice(EVENT_TYPES),
+               description='Event %d description' % i,
+               date=start + timedelta(days=rnd.randrange(730)),
+               time=time(rnd.randrange(10, 23)),
+               location=rnd.choice(location_list),
+               price=rnd.randrange(10, 100))
+         for i in range(events)],
+        BATCH_SIZE,
+    )
+    EventArtist = Event.artist.through
+    EventArtist.objects.bulk_create(
+        [EventArtist(event_id=event.pk, artist_id=artist.pk)
+         for event in event_list
+         for artist in rnd.sample(artist_list, min(2, len(artist_list)))],
+        batch_size=BATCH_SIZE,
+    )
+
+    prices = [rnd.randrange(20, 300) for i in range(packs)]
+    # no discounts are linked, the final price is the price
+    pack_list = bulk_create(
+        Pack,
+        [Pack(name='Pack %d' % i, description='Pack %d description' % i,
+              price=price, final_price=price)
+         for i, price in enumerate(prices)],
+        BATCH_SIZE,
+    )
+    PackEvent = Pack.events.through
+    PackEvent.objects.bulk_create(
+        [PackEvent(pack_id=pack.pk, event_id=event.pk)
+         for pack in pack_list
+         for event in rnd.sample(event_list,
+                                 min(events_per_pack, len(event_list)))],
+        batch_size=BATCH_SIZE,
+    )
+    # bulk inserts send no signals, the dates of the packs in one UPDATE
+    Pack.objects.update_event_dates()
+
+    booking_list = []
+    for i in range(bookings):
+        booking = Booking(users=rnd.choice(user_list),
+                          packs=rnd.choice(pack_list),
+                          payed=rnd.random() < 0.7)
+        booking.amount = booking.packs.final_price
+        booking_list.append(booking)
+    Booking.objects.bulk_create(booking_list, batch_size=BATCH_SIZE)
+    # bulk inserts skip the seat counters, compute them in one go
+    call_command('repair_seat_counters', stdout=StringIO())
+    if is_supported(connection):
+        call_command('rebuild_search_index', stdout=StringIO())
+    call_command('rebuild_sales_rollups', stdout=StringIO())
+    return user_list
@@ -0,0 +1,51 @@
+# benchmarks/tests/test_benchmarks.py
+# test the benchmark data seeder and the report helpers
+
+from django.test import TestCase
+from core.models import User, Pack, Event, Booking
+from benchmarks.runner import percentile, summarize, compare
+from benchmarks.seed import seed, PASSWORD
+
+
+class SeedTests(TestCase):
+
+    def test_seed(self):
+        """Test the seeder creates the requested rows"""
+        users = seed(users=20, artists=5, locations=2, events=30, packs=10,
+                     bookings=50)
+
+        self.assertEqual(len(users), 20)
+        self.assertTrue(users[0].check_password(PASSWORD))
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Event.objects.count(), 30)
+        self.assertEqual(Pack.objects.count(), 10)
+        self.assertEqual(Booking.objects.count(), 50)
+        self.assertEqual(Pack.events.through.objects.count(), 30)
+        self.assertEqual(
+            sum(Pack.objects.values_list('booked_count', flat=True)), 50
+        )
+
+
+class ReportTests(TestCase):
+
+    def test_percentile(self):
+        """Test the nearest rank percentile"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+
+    def test_summarize_and_compare(self):
+        """Test the summary of the results and the comparison"""
+        results = [(0.001 * i, 2, 200) for i in range(1, 11)]
+        results.append((0.02, 3, 500))
+        stats = summarize(results, 1.0)
+
+        self.assertEqual(stats['requests'], 11)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['requests_per_second'], 11)
+        self.assertEqual(stats['queries']['max'], 3)
+
+        report = {'endpoints': {'catalog': stats}}
+        self.assertIn('catalog', compare(report, report))
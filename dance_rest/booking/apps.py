@@ -1,6 +1,39 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models import signals
 
 
 class BookingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'booking'
+
+    def ready(self):
+        from core.models import Pack, Event, Artist, Location, Discount, \
+                                Booking
+        from booking import search
+        from booking.cache import invalidate_catalog, invalidate_seats
+
+        # every model shown in the catalog invalidates the cached catalog
+        for model in (Pack, Event, Artist, Location, Discount):
+            signals.post_save.connect(invalidate_catalog, sender=model)
+            signals.post_delete.connect(invalidate_catalog, sender=model)
+        for through in (Event.artist.through, Pack.events.through,
+                        Pack.discounts.through):
+            signals.m2m_changed.connect(invalidate_catalog, sender=through)
+        # bookings only change the seat counters, read live over the cached
+        # catalog, the cache is kept and its validators change
+        signals.post_save.connect(invalidate_seats, sender=Booking)
+        signals.post_delete.connect(invalidate_seats, sender=Booking)
+
+        # the search table is created after the core tables are migrated
+        # (booking has no models of its own) and follows the events, their
+        # artists and their location
+        signals.post_migrate.connect(search.create_search_index,
+                                     sender=apps.get_app_config('core'))
+        signals.post_save.connect(search.event_saved, sender=Event)
+        signals.post_delete.connect(search.event_deleted, sender=Event)
+        signals.m2m_changed.connect(search.event_artists_changed,
+                                    sender=Event.artist.through)
+        signals.post_save.connect(search.artist_saved, sender=Artist)
+        signals.pre_delete.connect(search.artist_deleting, sender=Artist)
+        signals.post_delete.connect(search.artist_deleted, sender=Artist)
+        signals.post_save.connect(search.location_saved, sender=Location)
@@ -0,0 +1,141 @@
+# booking/cache.py
+# versioned cache for the serialized pack catalog
+#
+# every cached catalog is stored under a key containing the current catalog
+# version, editing any model shown in the catalog bumps the version so the
+# old entries are never read again and just expire from the backend.
+#
+# the seat counters change with every booking, they are read live over the
+# cached catalog (booking.projections.overlay_seats) and bookings only bump
+# the seats version, which the conditional GET validators include
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from core.routers import get_replica_lag, reading_from_primary
+
+VERSION_KEY = 'booking:catalog:version'
+SEATS_VERSION_KEY = 'booking:catalog:seats'
+HITS_KEY = 'booking:catalog:hits'
+MISSES_KEY = 'booking:catalog:misses'
+
+
+class CatalogCache:
+    """cache for the catalog responses, keyed by catalog version"""
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'BOOKING_CATALOG_CACHE', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'BOOKING_CATALOG_CACHE_TIMEOUT', 300)
+
+    def get_version(self, key=VERSION_KEY):
+        """return the catalog version, starting a new one if missing"""
+        version = self.cache.get(key)
+        if version is None:
+            self.cache.add(key, time.time_ns(), None)
+            version = self.cache.get(key)
+        return version
+
+    def get_seats_version(self):
+        """return the version of the seat counters"""
+        return self.get_version(SEATS_VERSION_KEY)
+
+    def get_last_modified(self):
+        """unix timestamp of the last change to the catalog or its seats"""
+        return max(self.get_version(), self.get_seats_version()) / 10 ** 9
+
+    def bump_version(self):
+        """invalidate every cached catalog"""
+        # the version is the time of the change, so it can also be used
+        # as the last modification time of the catalog
+        self.cache.set(VERSION_KEY, time.time_ns(), None)
+
+    def bump_seats_version(self):
+        """change the validators of the catalog, the cache is kept"""
+        self.cache.set(SEATS_VERSION_KEY, time.time_ns(), None)
+
+    def make_key(self, variant, version=None):
+        if version is None:
+            version = self.get_version()
+        digest = hashlib.md5(variant.encode('utf-8')).hexdigest()
+        return 'booking:catalog:%s:%s' % (version, digest)
+
+    def get_or_set(self, variant, build):
+        """
+        return the cached data for this variant of the catalog (the request
+        path with its query string), calling build() on a miss
+        """
+        data = self.get(variant)
+        if data is not None:
+            return data
+        self._incr(MISSES_KEY)
+        version = self.get_version()
+        if time.time() - version / 10 ** 9 < get_replica_lag():
+            # the replicas could still miss the change that bumped the
+            # version, and the data is cached under the new version
+            with reading_from_primary():
+                data = build()
+        else:
+            data = build()
+        self.cache.set(self.make_key(variant, version), data, self.timeout)
+        return data
+
+    def get(self, variant):
+        """return the cached data for this variant or None"""
+        data = self.cache.get(self.make_key(variant))
+        if data is not None:
+            self._incr(HITS_KEY)
+        return data
+
+    def stats(self):
+        """hit/miss counters of the catalog cache"""
+        hits = self.cache.get(HITS_KEY, 0)
+        misses = self.cache.get(MISSES_KEY, 0)
+        total = hits + misses
+        return {
+            'version': self.get_version(),
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else None,
+        }
+
+    def reset_stats(self):
+        self.cache.delete_many([HITS_KEY, MISSES_KEY])
+
+    def _incr(self, key):
+        self.cache.add(key, 0, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # evicted between add and incr, losing one count is fine
+            pass
+
+
+catalog_cache = CatalogCache()
+
+
+def invalidate_catalog(using=None, action=None, **kwargs):
+    """signal receiver bumping the catalog version"""
+    if action is not None and not action.startswith('post_'):
+        # m2m_changed is sent before and after the change
+        return
+    # bump now and again once the transaction is committed, a request
+    # served in between could have cached the data before the commit
+    catalog_cache.bump_version()
+    transaction.on_commit(catalog_cache.bump_version, using=using)
+
+
+def invalidate_seats(using=None, update_fields=None, **kwargs):
+    """signal receiver bumping the seats version, for the bookings"""
+    if update_fields is not None and 'packs' not in update_fields:
+        # paid, the seats taken are the same
+        return
+    catalog_cache.bump_seats_version()
+    transaction.on_commit(catalog_cache.bump_seats_version, using=using)
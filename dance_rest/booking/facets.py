@@ -0,0 +1,115 @@
+# booking/facets.py
+# filters of the catalog by the events of the packs, and the facet counts
+# of each filter computed by the database with grouped aggregates
+#
+# a pack matches a filter when one of its events matches one of the values
+# given, the filters of different dimensions are combined with AND. The
+# counts of a dimension ignore the filter of the dimension itself, so they
+# tell how many packs each other value would add.
+
+from django.db.models import Count, Exists, Max, Min, OuterRef
+from rest_framework import serializers
+
+from core.models import Event, Pack
+
+# the values of the filters are validated by these fields, the ids must fit
+# in the 64 bit integers of sqlite
+id_field = serializers.IntegerField(min_value=1, max_value=2 ** 63 - 1)
+name_field = serializers.CharField()
+price_field = serializers.DecimalField(max_digits=6, decimal_places=2)
+
+# query parameter -> (event lookup, field of the values, columns of the
+# through table grouped for the counts: value and label)
+DIMENSIONS = {
+    'artist': ('artist__in', id_field,
+               ['event__artist', 'event__artist__name']),
+    'style': ('artist__style__in', name_field, ['event__artist__style']),
+    'type': ('type__in', name_field, ['event__type']),
+    'city': ('location__city__in', name_field, ['event__location__city']),
+    'location': ('location__in', id_field,
+                 ['event__location', 'event__location__name']),
+}
+PRICE = 'price'
+PRICE_PARAMS = {'price_min': 'final_price__gte',
+                'price_max': 'final_price__lte'}
+
+
+def parse_value(name, field, value):
+    """the value validated by field, ValidationError under name if not"""
+    try:
+        return field.run_validation(value)
+    except serializers.ValidationError as e:
+        raise serializers.ValidationError({name: e.detail}, code='invalid')
+
+
+def parse_filters(params):
+    """
+    the filters of the query parameters, dimension -> list of values and
+    price lookup -> Decimal, comma separated values are alternatives
+    """
+    filters = {}
+    for name, (lookup, field, columns) in DIMENSIONS.items():
+        value = params.get(name)
+        if not value:
+            continue
+        filters[name] = [parse_value(name, field, item.strip())
+                         for item in value.split(',') if item.strip()]
+    for name, lookup in PRICE_PARAMS.items():
+        value = params.get(name)
+        if not value:
+            continue
+        filters[lookup] = parse_value(name, price_field, value)
+    return filters
+
+
+def filter_packs(queryset, filters, exclude=None):
+    """
+    the packs of queryset matching the filters, except the ones of the
+    exclude dimension (PRICE for the price range)
+    """
+    for name, values in filters.items():
+        if name in DIMENSIONS and name != exclude:
+            lookup = DIMENSIONS[name][0]
+            # EXISTS keeps one row per pack, a join would repeat the pack
+            # for every matching event
+            queryset = queryset.filter(Exists(Event.objects.filter(
+                pack=OuterRef('pk'), **{lookup: values}
+            )))
+        elif name not in DIMENSIONS and exclude != PRICE:
+            queryset = queryset.filter(**{name: values})
+    return queryset
+
+
+def dimension_counts(packs, columns):
+    """
+    [{'value', 'label', 'count'}] of the packs by the grouped columns,
+    most packs first
+    """
+    rows = Pack.events.through.objects.filter(
+        pack__in=packs.values('pk'), **{columns[0] + '__isnull': False}
+    ).values(*columns).annotate(
+        count=Count('pack', distinct=True)
+    ).order_by('-count', columns[-1])
+    return [{'value': row[columns[0]], 'label': row[columns[-1]],
+             'count': row['count']} for row in rows]
+
+
+def price_range(packs):
+    """the lowest and highest final price of the packs"""
+    prices = Pack.objects.filter(pk__in=packs.values('pk')).aggregate(
+        min=Min('final_price'), max=Max('final_price')
+    )
+    return {name: price_field.to_representation(value)
+            if value is not None else None
+            for name, value in prices.items()}
+
+
+def pack_facets(get_packs):
+    """
+    the counts of every dimension and the price range, get_packs(exclude)
+    returns the packs filtered by every dimension but exclude
+    """
+    facets = {name: dimension_counts(get_packs(name), columns)
+              for name, (lookup, field, columns) in DIMENSIONS.items()}
+    facets[PRICE] = price_range(get_packs(PRICE))
+    return facets
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.season import SeasonError, import_season, load_season_file
+
+
+class Command(BaseCommand):
+    help = ('Import the locations, artists, discounts, events and packs of '
+            'a season from a json or yaml file, in a single transaction')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='season file, .json or .yaml')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            counts = import_season(load_season_file(options['path']))
+        except (OSError, SeasonError) as e:
+            raise CommandError(str(e))
+
+        for section, count in counts.items():
+            self.stdout.write('%s: %d created, %d existing' % (
+                section, count['created'], count['existing']))
+        self.stdout.write(self.style.SUCCESS(
+            'season imported in %.2fs' % (time.perf_counter() - start)
+        ))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from booking.search import create_search_index, is_supported, \
+                           rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the full text search table of the catalog from the '
+            'events, their artists and their location')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='database to rebuild, "default" by default',
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not is_supported(connections[using]):
+            raise CommandError('the search table needs sqlite with FTS5')
+        start = time.perf_counter()
+        with transaction.atomic(using=using):
+            # a no-op when the table exists
+            create_search_index(using)
+            count = rebuild_search_index(using)
+        self.stdout.write(self.style.SUCCESS(
+            '%d events indexed in %.2fs' % (count,
+                                            time.perf_counter() - start)
+        ))
@@ -0,0 +1,22 @@
+# booking/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class PackCursorPagination(CursorPagination):
+    """
+    keyset pagination over the catalog ordered by pack starting date,
+    every page is a range query on pack_first_event_date_idx so deep
+    pages cost the same as the first one
+    """
+    ordering = ('first_event_date', 'id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class BookingCursorPagination(CursorPagination):
+    """bookings of a user newest first, served by booking_user_date_idx"""
+    ordering = ('-date', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,192 @@
+# booking/projections.py
+# read only rendering of the catalog from values() projections, the output
+# is the same as PackListSerializers without a serializer per object
+
+from rest_framework import serializers
+
+from booking.serializers import PackListSerializers
+from core.models import Event, Artist, Pack
+
+PACK_COLUMNS = ['id', 'name', 'description', 'price', 'final_price',
+                'capacity', 'booked_count', 'first_event_date',
+                'last_event_date']
+EVENT_COLUMNS = ['id', 'date', 'type', 'description', 'time', 'location',
+                 'price', 'capacity', 'booked_count']
+ARTIST_COLUMNS = ['id', 'name', 'style', 'type', 'country']
+
+# serializer field -> column, when they are named differently
+PACK_SOURCES = {'starting_date': 'first_event_date',
+                'ending_date': 'last_event_date'}
+
+# the events of a pack and the artists of an event, in the order of the
+# prefetches of the serializer path
+EVENT_ORDERING = ['date', 'time', 'id']
+ARTIST_ORDERING = ['id']
+
+
+def project_packs(queryset):
+    """the pack rows of the catalog queryset as dicts"""
+    return queryset.values(*PACK_COLUMNS)
+
+
+def remaining_seats(capacity, booked_count, others=()):
+    """
+    seats left as Event.remaining and Pack.remaining compute them, others
+    are the seats left in the events of a pack
+    """
+    seats = [capacity - booked_count] if capacity is not None else []
+    seats += [seat for seat in others if seat is not None]
+    return max(min(seats), 0) if seats else None
+
+
+def compile_fields(serializer, sources=None, computed=()):
+    """
+    (field name, column, to_representation) of the fields of serializer,
+    to_representation is None for the nested and computed fields and for
+    the relations rendered as their primary key
+    """
+    sources = sources or {}
+    fields = []
+    for name, field in serializer.fields.items():
+        convert = None
+        if not isinstance(field, (serializers.BaseSerializer,
+                                  serializers.RelatedField)) and \
+                name not in computed:
+            convert = field.to_representation
+        fields.append((name, sources.get(name, name), convert))
+    return fields
+
+
+def render_row(row, fields, values):
+    """the representation of a row, values are the nested/computed ones"""
+    data = {}
+    for name, column, convert in fields:
+        if name in values:
+            data[name] = values[name]
+            continue
+        value = row[column]
+        data[name] = convert(value) \
+            if convert is not None and value is not None else value
+    return data
+
+
+def render_packs(packs, pack_serializer=None):
+    """
+    the PackListSerializers data of the pack rows of project_packs,
+    pack_serializer can add pack columns to the fields
+    """
+    if pack_serializer is None:
+        pack_serializer = PackListSerializers()
+    event_serializer = pack_serializer.fields['events'].child
+    artist_serializer = event_serializer.fields['artist'].child
+    pack_fields = compile_fields(pack_serializer, PACK_SOURCES,
+                                 computed=['remaining'])
+    event_fields = compile_fields(event_serializer, computed=['remaining'])
+    artist_fields = compile_fields(artist_serializer)
+
+    events = list(
+        Event.objects.filter(pack__in=[pack['id'] for pack in packs])
+                     .order_by(*EVENT_ORDERING)
+                     .values('pack', *EVENT_COLUMNS)
+    )
+    artists = {}
+    for artist in Artist.objects.filter(
+            event__in={event['id'] for event in events}
+    ).order_by(*ARTIST_ORDERING).values('event', *ARTIST_COLUMNS):
+        artists.setdefault(artist['event'], []).append(
+            render_row(artist, artist_fields, {})
+        )
+
+    pack_events = {}
+    for event in events:
+        remaining = remaining_seats(event['capacity'], event['booked_count'])
+        pack_events.setdefault(event['pack'], []).append((remaining, (
+            render_row(event, event_fields, {
+                'artist': artists.get(event['id'], []),
+                'remaining': remaining,
+            })
+        )))
+
+    data = []
+    for pack in packs:
+        events = pack_events.get(pack['id'], [])
+        data.append(render_row(pack, pack_fields, {
+            'events': [event for remaining, event in events],
+            'remaining': remaining_seats(
+                pack['capacity'], pack['booked_count'],
+                [remaining for remaining, event in events],
+            ),
+        }))
+    return data
+
+
+def live_seats(pack_ids):
+    """
+    the live seat counters of the packs, {pack id: (booked_count,
+    remaining, [(booked_count, remaining) of its events])}, the events in
+    the order they are rendered, two queries
+    """
+    events = {}
+    for event in Event.objects.filter(pack__in=pack_ids) \
+                              .order_by(*EVENT_ORDERING) \
+                              .values('pack', 'capacity', 'booked_count'):
+        events.setdefault(event['pack'], []).append((
+            event['booked_count'],
+            remaining_seats(event['capacity'], event['booked_count']),
+        ))
+    seats = {}
+    for pack in Pack.objects.filter(pk__in=pack_ids) \
+                            .values('id', 'capacity', 'booked_count'):
+        pack_events = events.get(pack['id'], [])
+        seats[pack['id']] = (
+            pack['booked_count'],
+            remaining_seats(pack['capacity'], pack['booked_count'],
+                            [remaining for booked, remaining in pack_events]),
+            pack_events,
+        )
+    return seats
+
+
+def set_seats(data, booked_count, remaining):
+    """set the seat counters rendered in data, ?fields= can leave them out"""
+    if 'booked_count' in data:
+        data['booked_count'] = booked_count
+    if 'remaining' in data:
+        data['remaining'] = remaining
+
+
+def overlay_seats(packs, pack_ids):
+    """
+    replace the seat counters of the rendered packs (pack_ids in the same
+    order) and of their expanded events with the live ones, the cached
+    catalog is not invalidated by the bookings
+    """
+    if not pack_ids:
+        return
+    seats = live_seats(pack_ids)
+    for pack, pack_id in zip(packs, pack_ids):
+        if pack_id not in seats:
+            # deleted, the catalog version changed too
+            continue
+        booked_count, remaining, events = seats[pack_id]
+        set_seats(pack, booked_count, remaining)
+        for event, event_seats in zip(pack.get('events', ()), events):
+            if isinstance(event, dict):
+                set_seats(event, *event_seats)
+
+
+def overlay_event_seats(events):
+    """the same for rendered events with their id, one query"""
+    if not events:
+        return
+    seats = {
+        event['id']: (event['booked_count'],
+                      remaining_seats(event['capacity'],
+                                      event['booked_count']))
+        for event in Event.objects.filter(
+            pk__in=[event['id'] for event in events]
+        ).values('id', 'capacity', 'booked_count')
+    }
+    for event in events:
+        if event['id'] in seats:
+            set_seats(event, *seats[event['id']])
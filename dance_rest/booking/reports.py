@@ -0,0 +1,79 @@
+# booking/reports.py
+# sales reports read from the DailySales and DailyEventSales rollups only,
+# their cost depends on the number of packs, events and days reported and
+# not on the bookings
+
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from rest_framework import serializers
+
+from core.models import DailyEventSales, DailySales
+
+# group -> (rollup model, key column, label column) of the rollup rows
+GROUPS = {
+    'day': (DailySales, 'day', 'day'),
+    'month': (DailySales, 'month', 'month'),
+    'pack': (DailySales, 'pack', 'pack__name'),
+    # the share of the event in the sales of its packs, the amounts add up
+    # to the total but for the packs without events, a booking counts for
+    # each event of its pack
+    'event': (DailyEventSales, 'event', 'event__name'),
+}
+TOTALS = {
+    'bookings': Sum('bookings'),
+    'paid_bookings': Sum('paid_bookings'),
+    'amount': Sum('amount'),
+    'paid_amount': Sum('paid_amount'),
+}
+
+amount_field = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+def rollups(date_from=None, date_to=None, model=DailySales):
+    """the rollup rows of the days between date_from and date_to"""
+    rows = model.objects.all()
+    if date_from:
+        rows = rows.filter(day__gte=date_from)
+    if date_to:
+        rows = rows.filter(day__lte=date_to)
+    return rows
+
+
+def sales_rows(group, date_from=None, date_to=None):
+    """the sales of the rollups grouped by group, in key order"""
+    model, key, label = GROUPS[group]
+    rows = rollups(date_from, date_to, model)
+    if group == 'month':
+        rows = rows.annotate(month=TruncMonth('day'))
+    return rows.values(*dict.fromkeys((key, label))).annotate(**TOTALS) \
+               .order_by(key)
+
+
+def render_sales(row):
+    """the totals of a rollup group, with the amount still to be paid"""
+    return {
+        'bookings': row['bookings'] or 0,
+        'paid_bookings': row['paid_bookings'] or 0,
+        'unpaid_bookings': (row['bookings'] or 0) -
+                           (row['paid_bookings'] or 0),
+        'amount': amount_field.to_representation(row['amount'] or 0),
+        'paid_amount': amount_field.to_representation(
+            row['paid_amount'] or 0),
+        'outstanding': amount_field.to_representation(
+            (row['amount'] or 0) - (row['paid_amount'] or 0)),
+    }
+
+
+def sales_report(group, date_from=None, date_to=None):
+    """the rows of the report and the totals over the date window"""
+    model, key, label = GROUPS[group]
+    return {
+        'group': group,
+        'results': [
+            dict(key=row[key], label=row[label], **render_sales(row))
+            for row in sales_rows(group, date_from, date_to)
+        ],
+        'totals': render_sales(
+            rollups(date_from, date_to).aggregate(**TOTALS)
+        ),
+    }
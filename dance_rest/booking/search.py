@@ -0,0 +1,227 @@
+# booking/search.py
+# full text search of the catalog with a sqlite FTS5 table, one row per
+# event (rowid = event id) with the event, its artists and its city
+#
+# the table is created after migrate and kept in sync by the signal
+# receivers below, bulk operations (season import, seed) reindex the
+# events they create with index_events()
+
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from core.models import Event, Artist, Pack
+
+TABLE = 'booking_search'
+COLUMNS = ['name', 'type', 'description', 'artists', 'city']
+# bm25 weight of each column, a match in the name counts the most
+WEIGHTS = [10.0, 4.0, 1.0, 5.0, 3.0]
+# words of the query used, the others are ignored
+MAX_TERMS = 10
+BATCH_SIZE = 500
+
+
+def is_supported(connection):
+    """
+    whether the database has FTS5, sqlite can be compiled without it and
+    the search then falls back to plain lookups
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    if not hasattr(connection, 'search_fts5'):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            connection.search_fts5 = bool(cursor.fetchone()[0])
+    return connection.search_fts5
+
+
+def search_terms(query):
+    """the words of the query, punctuation and FTS5 syntax are dropped"""
+    return re.findall(r'\w+', query)[:MAX_TERMS]
+
+
+def match_expression(terms):
+    """every term must match as a prefix, 'salsa mi' -> '"salsa"* "mi"*'"""
+    return ' '.join('"%s"*' % term for term in terms)
+
+
+def create_search_index(using='default', **kwargs):
+    """
+    post_migrate receiver creating the search table, filled with the
+    events already in the database when it is created
+    """
+    connection = connections[using]
+    if not is_supported(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s",
+                       [TABLE])
+        if cursor.fetchone():
+            return
+        cursor.execute(
+            "CREATE VIRTUAL TABLE %s USING fts5(%s, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+            % (TABLE, ', '.join(COLUMNS))
+        )
+    rebuild_search_index(using)
+
+
+def rebuild_search_index(using='default'):
+    """reindex every event, return the number of events indexed"""
+    with connections[using].cursor() as cursor:
+        cursor.execute("DELETE FROM %s" % TABLE)
+    ids = list(Event.objects.using(using).order_by('pk')
+                                         .values_list('pk', flat=True))
+    index_events(ids, using)
+    return len(ids)
+
+
+def index_events(event_ids, using='default'):
+    """(re)index the events, the ones that no longer exist are removed"""
+    event_ids = list(event_ids)
+    if not is_supported(connections[using]):
+        return
+    for start in range(0, len(event_ids), BATCH_SIZE):
+        _index_batch(event_ids[start:start + BATCH_SIZE], using)
+
+
+def _index_batch(event_ids, using):
+    events = Event.objects.using(using).filter(pk__in=event_ids) \
+                          .values_list('pk', 'name', 'type', 'description',
+                                       'location__city')
+    artists = {}
+    for event_id, name, style in Artist.objects.using(using).filter(
+            event__in=event_ids
+    ).values_list('event', 'name', 'style'):
+        artists.setdefault(event_id, []).extend((name, style))
+
+    unindex_events(event_ids, using)
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO %s (rowid, %s) VALUES (%%s, %s)"
+            % (TABLE, ', '.join(COLUMNS), ', '.join(['%s'] * len(COLUMNS))),
+            [(pk, name, type, description,
+              ' '.join(artists.get(pk, [])), city)
+             for pk, name, type, description, city in events],
+        )
+
+
+def unindex_events(event_ids, using='default'):
+    event_ids = list(event_ids)
+    if not is_supported(connections[using]):
+        return
+    with connections[using].cursor() as cursor:
+        for start in range(0, len(event_ids), BATCH_SIZE):
+            batch = event_ids[start:start + BATCH_SIZE]
+            cursor.execute("DELETE FROM %s WHERE rowid IN (%s)"
+                           % (TABLE, ', '.join(['%s'] * len(batch))), batch)
+
+
+def _ranked(sql, terms, limit):
+    """the ids of the first column of the ranked FTS5 query"""
+    with connections[router.db_for_read(Event)].cursor() as cursor:
+        cursor.execute(sql % {
+            'table': TABLE,
+            'weights': ', '.join(str(weight) for weight in WEIGHTS),
+            'pack_events': Pack.events.through._meta.db_table,
+        }, [match_expression(terms), limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_events(terms, limit):
+    """ids of the events matching every term, best match first"""
+    if not is_supported(connections[router.db_for_read(Event)]):
+        return list(_filter_events(terms).order_by('date', 'time', 'id')
+                    .values_list('pk', flat=True)[:limit])
+    return _ranked(
+        "SELECT rowid, bm25(%(table)s, %(weights)s) AS rank "
+        "FROM %(table)s WHERE %(table)s MATCH %%s "
+        "ORDER BY rank LIMIT %%s",
+        terms, limit,
+    )
+
+
+def search_packs(terms, limit):
+    """
+    ids of the packs with an event matching every term, ranked by their
+    best event
+    """
+    if not is_supported(connections[router.db_for_read(Event)]):
+        return list(Pack.objects.filter(events__in=_filter_events(terms))
+                    .order_by('pk').values_list('pk', flat=True)
+                    .distinct()[:limit])
+    return _ranked(
+        # bm25 cannot run once the match is flattened into the grouped
+        # query, sqlite never flattens a subquery with a LIMIT into an
+        # aggregate (MATERIALIZED would need sqlite 3.35+)
+        "SELECT pack_events.pack_id, MIN(matches.rank) AS rank "
+        "FROM (SELECT rowid AS event_id, "
+        "             bm25(%(table)s, %(weights)s) AS rank "
+        "      FROM %(table)s WHERE %(table)s MATCH %%s LIMIT -1) AS matches "
+        "INNER JOIN %(pack_events)s AS pack_events "
+        "        ON pack_events.event_id = matches.event_id "
+        "GROUP BY pack_events.pack_id ORDER BY rank LIMIT %%s",
+        terms, limit,
+    )
+
+
+def _filter_events(terms):
+    """the events matching every term, without FTS5"""
+    queryset = Event.objects.all()
+    for term in terms:
+        queryset = queryset.filter(
+            Q(name__icontains=term) | Q(type__icontains=term) |
+            Q(description__icontains=term) | Q(artist__name__icontains=term) |
+            Q(artist__style__icontains=term) |
+            Q(location__city__icontains=term)
+        )
+    return queryset.distinct()
+
+
+# signal receivers keeping the table in sync
+
+def event_saved(instance, using='default', **kwargs):
+    index_events([instance.pk], using)
+
+
+def event_deleted(instance, using='default', **kwargs):
+    unindex_events([instance.pk], using)
+
+
+def event_artists_changed(instance, action, reverse, pk_set, using='default',
+                          **kwargs):
+    """m2m_changed receiver of Event.artist"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            index_events([instance.pk], using)
+    elif action == 'pre_clear':
+        # the events of the artist are unknown after the clear
+        instance._search_event_ids = list(
+            instance.event_set.using(using).values_list('pk', flat=True)
+        )
+    elif action == 'post_clear':
+        index_events(instance.__dict__.pop('_search_event_ids', []), using)
+    elif action in ('post_add', 'post_remove'):
+        index_events(pk_set, using)
+
+
+def artist_saved(instance, using='default', **kwargs):
+    index_events(instance.event_set.using(using).values_list('pk', flat=True),
+                 using)
+
+
+def artist_deleting(instance, using='default', **kwargs):
+    """pre_delete receiver of Artist, remember its events"""
+    instance._search_event_ids = list(
+        instance.event_set.using(using).values_list('pk', flat=True)
+    )
+
+
+def artist_deleted(instance, using='default', **kwargs):
+    index_events(instance.__dict__.pop('_search_event_ids', []), using)
+
+
+def location_saved(instance, using='default', **kwargs):
+    index_events(instance.event_set.using(using).values_list('pk', flat=True),
+                 using)
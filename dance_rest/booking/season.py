@@ -0,0 +1,285 @@
+# booking/season.py
+# load a season (locations, artists, discounts, events and packs) from a
+# json or yaml file with bulk operations in a single transaction
+
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from booking.cache import invalidate_catalog
+from booking.search import index_events
+from core.db.bulk import bulk_create
+from core.models import Location, Artist, Discount, Event, Pack, \
+                        apply_discounts
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+BATCH_SIZE = 500
+
+
+class SeasonError(ValueError):
+    """raised for an invalid season file, nothing is imported"""
+
+
+def load_season_file(path):
+    """read the season from a json or yaml (PyYAML needed) file"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise SeasonError('PyYAML is needed to import yaml files')
+            try:
+                return yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise SeasonError('invalid yaml: %s' % e)
+        try:
+            return json.load(f)
+        except ValueError as e:
+            raise SeasonError('invalid json: %s' % e)
+
+
+def build(model, entry, fields, section, **related):
+    """an unsaved model instance for the entry, validated"""
+    values = {field: entry[field] for field in fields if field in entry}
+    obj = model(**values, **related)
+    try:
+        # the related objects are known to exist, validating them would
+        # cost a query per entry
+        obj.clean_fields(exclude=list(related))
+    except ValidationError as e:
+        raise SeasonError('%s %r: %s' % (section, entry.get('name'),
+                                         e.message_dict))
+    return obj
+
+
+class References(dict):
+    """
+    natural key -> instance of the reference data. A reference to it is a
+    mapping of the natural key fields, or a name no other instance has
+    """
+
+    def __init__(self, model, key_fields, objs):
+        super().__init__(objs)
+        self.model = model
+        self.key_fields = key_fields
+        self.names = {}
+        for key in self:
+            self.names.setdefault(key[0], []).append(key)
+
+    def key(self, ref):
+        """the natural key of the reference, raise KeyError if unknown"""
+        if isinstance(ref, dict):
+            try:
+                return tuple(
+                    self.model._meta.get_field(field).to_python(ref.get(field))
+                    for field in self.key_fields)
+            except ValidationError:
+                raise KeyError(ref)
+        keys = self.names.get(ref) if isinstance(ref, str) else None
+        if not keys:
+            raise KeyError(ref)
+        if len(keys) > 1:
+            raise SeasonError('%s %r is ambiguous, refer to it by %s' % (
+                self.model._meta.model_name, ref,
+                ' and '.join(self.key_fields)))
+        return keys[0]
+
+    def resolve(self, ref):
+        return self[self.key(ref)]
+
+
+class SeasonImporter:
+    """
+    Import a season, a dict with the lists 'locations', 'artists',
+    'discounts', 'events' and 'packs'.
+
+    Reference data already in the database or repeated in the file is
+    reused: locations by name and city, artists by name, discounts by name
+    and amount, events by name, date, time and location, packs by name.
+    Events refer to their artists by name, packs to their events by key
+    (the event name unless a key is given). Events refer to their location
+    and packs to their discounts by natural key, a mapping like {'name':
+    ..., 'city': ...}, or by name alone when no other one has it.
+    """
+
+    LOCATION_FIELDS = ['name', 'address', 'city', 'room']
+    ARTIST_FIELDS = ['name', 'style', 'type', 'description', 'country']
+    DISCOUNT_FIELDS = ['name', 'discount']
+    EVENT_FIELDS = ['name', 'type', 'description', 'date', 'time', 'price',
+                    'capacity']
+    PACK_FIELDS = ['name', 'description', 'price', 'capacity']
+
+    def __init__(self, season):
+        if not isinstance(season, dict):
+            raise SeasonError('the season must be a mapping')
+        self.season = season
+        self.counts = {}
+
+    def entries(self, section):
+        entries = self.season.get(section) or []
+        if not isinstance(entries, list) or \
+                not all(isinstance(entry, dict) for entry in entries):
+            raise SeasonError('%s must be a list of mappings' % section)
+        return entries
+
+    def reference(self, objs, key, kind, section, entry):
+        try:
+            if isinstance(objs, References):
+                return objs.resolve(key)
+            return objs[key]
+        except SeasonError as e:
+            raise SeasonError('%s %r: %s' % (section, entry.get('name'), e))
+        except (KeyError, TypeError):
+            raise SeasonError('%s %r: unknown %s %r' % (
+                section, entry.get('name'), kind, key))
+
+    def import_season(self):
+        """import everything or nothing, return the counts per section"""
+        with transaction.atomic():
+            locations = self.import_reference(
+                'locations', Location, self.LOCATION_FIELDS,
+                lambda obj: (obj.name, obj.city),
+            )
+            artists = self.import_reference(
+                'artists', Artist, self.ARTIST_FIELDS,
+                lambda obj: obj.name,
+            )
+            discounts = self.import_reference(
+                'discounts', Discount, self.DISCOUNT_FIELDS,
+                lambda obj: (obj.name, obj.discount),
+            )
+            locations = References(Location, ('name', 'city'), locations)
+            discounts = References(Discount, ('name', 'discount'),
+                                   discounts)
+            events = self.import_events(locations, artists)
+            self.import_packs(events, discounts)
+            # bulk operations send no signals
+            invalidate_catalog()
+        return self.counts
+
+    def import_reference(self, section, model, fields, natural_key):
+        """
+        create the entries missing from the database, return natural key
+        -> instance of every entry
+        """
+        objs = {}
+        for entry in self.entries(section):
+            obj = build(model, entry, fields, section)
+            objs.setdefault(natural_key(obj), obj)
+
+        existing = {natural_key(obj): obj for obj in model.objects.filter(
+            name__in={obj.name for obj in objs.values()})}
+        new = [obj for key, obj in objs.items() if key not in existing]
+        created = bulk_create(model, new, BATCH_SIZE)
+        objs.update(existing)
+        objs.update((natural_key(obj), obj) for obj in created)
+        self.counts[section] = {'created': len(created),
+                                'existing': len(objs) - len(created)}
+        return objs
+
+    def import_events(self, locations, artists):
+        """create the events and their artists, return key -> event"""
+        by_key, event_artists = {}, {}
+        for entry in self.entries('events'):
+            location = self.reference(locations, entry.get('location'),
+                                      'location', 'events', entry)
+            event = build(Event, entry, self.EVENT_FIELDS, 'events',
+                          location=location)
+            key = entry.get('key', event.name)
+            if key in by_key:
+                raise SeasonError('events: duplicate key %r' % (key,))
+            by_key[key] = event
+            event_artists[key] = [
+                self.reference(artists, name, 'artist', 'events', entry)
+                for name in entry.get('artists', [])
+            ]
+
+        def natural_key(event):
+            return (event.name, event.date, event.time, event.location_id)
+
+        existing = {natural_key(event): event for event in
+                    Event.objects.filter(
+                        name__in={event.name for event in by_key.values()})}
+        new = {}
+        for key, event in by_key.items():
+            if natural_key(event) in existing:
+                by_key[key] = existing[natural_key(event)]
+            else:
+                new.setdefault(natural_key(event), []).append(key)
+
+        created = bulk_create(Event, [by_key[keys[0]]
+                                      for keys in new.values()], BATCH_SIZE)
+        links = []
+        for event, keys in zip(created, new.values()):
+            for key in keys:
+                by_key[key] = event
+            links.extend(
+                Event.artist.through(event_id=event.pk, artist_id=artist_id)
+                for artist_id in {artist.pk
+                                  for artist in event_artists[keys[0]]}
+            )
+        Event.artist.through.objects.bulk_create(links,
+                                                 batch_size=BATCH_SIZE)
+        index_events(event.pk for event in created)
+        self.counts['events'] = {'created': len(created),
+                                 'existing': len(by_key) - sum(
+                                     len(keys) for keys in new.values())}
+        return by_key
+
+    def import_packs(self, events, discounts):
+        """create the packs with their events and discounts"""
+        packs, pack_links = {}, {}
+        for entry in self.entries('packs'):
+            pack = build(Pack, entry, self.PACK_FIELDS, 'packs')
+            if pack.name in packs:
+                raise SeasonError('packs: duplicate name %r' % (pack.name,))
+            packs[pack.name] = pack
+            pack_discounts = {
+                discount.pk: discount.discount
+                for discount in (self.reference(discounts, name, 'discount',
+                                                'packs', entry)
+                                 for name in entry.get('discounts', []))
+            }
+            pack_events = [self.reference(events, key, 'event', 'packs',
+                                          entry)
+                           for key in entry.get('events', [])]
+            # bulk_create skips save(), the final price and the dates are
+            # set here
+            pack.final_price = apply_discounts(pack.price,
+                                               pack_discounts.values())
+            if pack_events:
+                dates = [event.date for event in pack_events]
+                pack.first_event_date = min(dates)
+                pack.last_event_date = max(dates)
+            pack_links[pack.name] = (
+                {event.pk for event in pack_events},
+                set(pack_discounts),
+            )
+
+        existing = set(Pack.objects.filter(name__in=list(packs))
+                                   .values_list('name', flat=True))
+        created = bulk_create(Pack, [pack for name, pack in packs.items()
+                                     if name not in existing], BATCH_SIZE)
+        event_links, discount_links = [], []
+        for pack in created:
+            event_ids, discount_ids = pack_links[pack.name]
+            event_links.extend(Pack.events.through(pack_id=pack.pk,
+                                                   event_id=event_id)
+                               for event_id in event_ids)
+            discount_links.extend(Pack.discounts.through(
+                pack_id=pack.pk, discount_id=discount_id)
+                for discount_id in discount_ids)
+        Pack.events.through.objects.bulk_create(event_links,
+                                                batch_size=BATCH_SIZE)
+        Pack.discounts.through.objects.bulk_create(discount_links,
+                                                   batch_size=BATCH_SIZE)
+        self.counts['packs'] = {'created': len(created),
+                                'existing': len(existing)}
+
+
+def import_season(season):
+    """import a season dict, see SeasonImporter"""
+    return SeasonImporter(season).import_season()
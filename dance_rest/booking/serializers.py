@@ -1,38 +1,171 @@
 # booking/serializers.py
+from collections import OrderedDict
 
 from django.contrib.auth import get_user_model, authenticate
 from rest_framework import serializers
 from django.utils.translation import ugettext_lazy as _
-from core.models import Pack, Event, Artist
+from core.models import Pack, Event, Artist, Booking, SoldOut
 
 
-class EventArtistListSerializers(serializers.ModelSerializer):
+def parse_field_tree(value):
+    """
+    parse a comma separated list of dotted field names into a tree,
+    'name,events.date,events.artist' -> {'name': None, 'events':
+    {'date': None, 'artist': None}}, None stands for the whole field
+    """
+    tree = {}
+    for path in value.split(','):
+        names = [name.strip() for name in path.split('.')]
+        if not all(names):
+            continue
+        node = tree
+        for name in names[:-1]:
+            if name in node and node[name] is None:
+                # the whole field is already selected
+                break
+            node = node.setdefault(name, {})
+        else:
+            node[names[-1]] = None
+    return tree
+
+
+class SparseFieldsMixin:
+    """
+    Serializer mixin keeping only the fields of the `fields` tree and
+    expanding only the nested serializers of the `expand` tree, the others
+    are rendered as primary keys. None, the default, keeps and expands
+    everything.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self.field_tree = fields
+        self.expand_tree = expand
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        nested = {name: getattr(field, 'child', field)
+                  for name, field in fields.items()
+                  if isinstance(getattr(field, 'child', field),
+                                SparseFieldsMixin)}
+        self._check_names('fields', self.field_tree, fields)
+        self._check_names('expand', self.expand_tree, nested)
+
+        if self.field_tree is not None:
+            fields = OrderedDict((name, field)
+                                 for name, field in fields.items()
+                                 if name in self.field_tree)
+        for name, serializer in nested.items():
+            if name not in fields:
+                continue
+            many = isinstance(fields[name], serializers.ListSerializer)
+            if self.expand_tree is not None and name not in self.expand_tree:
+                fields[name] = serializers.PrimaryKeyRelatedField(
+                    many=many, read_only=True
+                )
+                continue
+            fields[name] = type(serializer)(
+                many=many, read_only=True,
+                fields=None if self.field_tree is None
+                else self.field_tree[name],
+                # expanding a field does not expand its own nested fields
+                expand=None if self.expand_tree is None
+                else self.expand_tree[name] or {},
+            )
+        return fields
+
+    def _check_names(self, param, tree, fields):
+        unknown = set(tree or ()) - set(fields)
+        if unknown:
+            msg = _('unknown fields: %s') % ', '.join(sorted(unknown))
+            raise serializers.ValidationError({param: msg}, code='invalid')
+
+
+class EventArtistListSerializers(SparseFieldsMixin,
+                                 serializers.ModelSerializer):
 
     class Meta:
         model = Artist
         fields = ['name', 'style', 'type', 'country']
 
-class PackEventListSerializers(serializers.ModelSerializer):
+class PackEventListSerializers(SparseFieldsMixin,
+                               serializers.ModelSerializer):
 
     artist = EventArtistListSerializers(read_only=True, many=True)
 
     class Meta:
         model = Event
         fields = ['date', 'type', 'description', 'time',
-                  'location', 'artist', 'price']
+                  'location', 'artist', 'price', 'booked_count', 'remaining']
 
 
 
 
 
-class PackListSerializers(serializers.ModelSerializer):
+class PackListSerializers(SparseFieldsMixin, serializers.ModelSerializer):
 
     events = PackEventListSerializers(read_only=True, many=True)
+    starting_date = serializers.DateField(read_only=True)
+    ending_date = serializers.DateField(read_only=True)
+    remaining = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Pack
         fields = ['name', 'description',
                   'events',
-                  # 'dates',
-                  'price']
+                  'starting_date', 'ending_date',
+                  'price', 'final_price', 'booked_count', 'remaining']
         extra_kwargs = {'select': {'write_only':True, 'min_length':5}}
+
+
+class SearchEventSerializer(PackEventListSerializers):
+    """an event found by the catalog search"""
+
+    class Meta(PackEventListSerializers.Meta):
+        fields = ['id', 'name'] + PackEventListSerializers.Meta.fields
+
+
+class SearchPackSerializer(PackListSerializers):
+    """a pack found by the catalog search"""
+
+    class Meta(PackListSerializers.Meta):
+        fields = ['id'] + PackListSerializers.Meta.fields
+
+
+class BookingSerializer(serializers.ModelSerializer):
+    """Serializer to book a pack for the authenticated user"""
+
+    class Meta:
+        model = Booking
+        fields = ['id', 'packs', 'date', 'payed']
+        read_only_fields = ['id', 'date', 'payed']
+
+    def create(self, validated_data):
+        """reserve the seats and create the booking"""
+        try:
+            return Booking.objects.create_booking(
+                user=self.context['request'].user,
+                pack=validated_data['packs'],
+            )
+        except SoldOut:
+            msg = _('no seats left for this pack')
+            raise serializers.ValidationError({'packs': msg},
+                                              code='sold_out')
+
+
+class MyBookingSerializer(serializers.ModelSerializer):
+    """a booking of the authenticated user with the pack booked"""
+
+    pack = serializers.PrimaryKeyRelatedField(source='packs', read_only=True)
+    pack_name = serializers.CharField(source='packs.name', read_only=True)
+    starting_date = serializers.DateField(source='packs.first_event_date',
+                                          read_only=True)
+    ending_date = serializers.DateField(source='packs.last_event_date',
+                                        read_only=True)
+
+    class Meta:
+        model = Booking
+        fields = ['id', 'date', 'pack', 'pack_name',
+                  'starting_date', 'ending_date',
+                  'amount', 'payed', 'date_payed']
+        read_only_fields = fields
@@ -0,0 +1,19 @@
+# booking/streaming.py
+from rest_framework.renderers import JSONRenderer
+
+
+def stream_json_array(chunks):
+    """
+    render an iterable of lists of serialized objects as one json array,
+    yielding the bytes chunk by chunk instead of rendering it all at once
+    """
+    renderer = JSONRenderer()
+    yield b'['
+    first = True
+    for chunk in chunks:
+        for item in chunk:
+            if not first:
+                yield b','
+            first = False
+            yield renderer.render(item)
+    yield b']'
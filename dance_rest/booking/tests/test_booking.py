@@ -1,13 +1,28 @@
 # booking/tests/test_booking.py
 
-from django.test import TestCase
+import asyncio
+import json
+import threading
+from datetime import date
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.db import connection, connections, OperationalError
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework import status
 from core import models
+from booking.cache import catalog_cache
+from core.middleware import QueryCounter, current_counter
+from rest_framework.authtoken.models import Token
 
 BOOKING_API = reverse('booking:booking')
+CACHE_STATS_API = reverse('booking:cache_stats')
+BOOK_API = reverse('booking:book')
+BOOKING_ASYNC_API = reverse('booking:booking_async')
+MY_BOOKINGS_API = reverse('booking:mine')
 
 # helper functions
 
@@ -125,10 +140,631 @@ class PrivateBookingTests(TestCase):
         """test retrive a list of packages """
         res = self.client.get(BOOKING_API)
         print("Date")
-        print (res.data[0]['events'][0]['date'])
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], 'Bounce Factory all night')
-        self.assertEqual(res.data[0]['events'][0]['date'],
+        print (res.data['results'][0]['events'][0]['date'])
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], 'Bounce Factory all night')
+        self.assertEqual(res.data['results'][0]['events'][0]['date'],
                          min([self.event1.date, self.event2.date])
                          )
-        self.assertEqual(res.data[0]['events'][0]['artist'][0]['name'], self.artist1.name)
+        self.assertEqual(res.data['results'][0]['events'][0]['artist'][0]['name'], self.artist1.name)
+
+    def test_list_packs_query_count_is_constant(self):
+        """test the catalog query count does not grow with the packs """
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(BOOKING_API)
+        queries_one_pack = len(ctx.captured_queries)
+
+        location = create_location(
+                    name="Bounce Factory",
+                    address='via roma 7',
+                    city='Milano',
+                    room='main'
+                    )
+        for i in range(5):
+            event = create_event(
+                name="Workshop %s" % i,
+                type="Workshop",
+                date="2021-06-%02d" % (i + 1),
+                time="15:00",
+                description="",
+                price=30.0,
+                location=location,
+                artists=[self.artist1, self.artist2]
+            )
+            create_pack(
+                name="Workshop pack %s" % i,
+                price=50.0,
+                events=[event, self.event1]
+            )
+
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(BOOKING_API)
+        self.assertEqual(len(res.data['results']), 6)
+        self.assertEqual(len(ctx.captured_queries), queries_one_pack)
+
+    def test_list_packs_cached(self):
+        """test the catalog is served from the cache until it changes """
+        catalog_cache.reset_stats()
+        self.client.get(BOOKING_API)
+        # only the live seat counters, of the packs and of their events
+        with self.assertNumQueries(2):
+            res = self.client.get(BOOKING_API)
+        self.assertEqual(res.data['results'][0]['name'], self.pack.name)
+
+        self.pack.name = 'Bounce Factory special'
+        self.pack.save()
+        res = self.client.get(BOOKING_API)
+        self.assertEqual(res.data['results'][0]['name'], 'Bounce Factory special')
+
+        self.artist1.name = 'Frankie'
+        self.artist1.save()
+        self.event1.artist.remove(self.artist2)
+        res = self.client.get(BOOKING_API)
+        self.assertEqual(res.data['results'][0]['events'][0]['artist'],
+                         [{'name': 'Frankie', 'style': 'Lindy Hop',
+                           'type': 'Teacher', 'country': 'USA'}])
+
+        stats = catalog_cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 3)
+
+    def test_cache_stats_admin_only(self):
+        """test only staff can read the cache counters """
+        res = self.client.get(CACHE_STATS_API)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        res = self.client.get(CACHE_STATS_API)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('hits', res.data)
+        self.assertIn('misses', res.data)
+
+    def test_list_packs_paginated(self):
+        """test the catalog is paginated by pack starting date """
+        location = create_location(name="Bounce Factory",
+                                   address='via roma 7',
+                                   city='Milano', room='main')
+        for day in (3, 1, 2):
+            event = create_event(name="Class %s" % day, type="Class",
+                                 date="2021-06-%02d" % day, time="21:00",
+                                 description="", price=10.0,
+                                 location=location, artists=[])
+            create_pack(name="Pack %s" % day, price=10.0, events=[event])
+        create_pack(name="Empty pack", price=10.0, events=[])
+
+        names = []
+        url = BOOKING_API + '?page_size=2'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(res.data['results']), 2)
+            names += [pack['name'] for pack in res.data['results']]
+            url = res.data['next']
+            # the pages are range queries on the stored starting date
+            for query in queries:
+                self.assertNotIn('GROUP BY', query['sql'])
+
+        self.assertEqual(names, ['Bounce Factory all night',
+                                 'Pack 1', 'Pack 2', 'Pack 3'])
+
+    def test_list_packs_date_window(self):
+        """test filtering the catalog by starting date """
+        location = create_location(name="Bounce Factory",
+                                   address='via roma 7',
+                                   city='Milano', room='main')
+        for day in (1, 2, 3):
+            event = create_event(name="Class %s" % day, type="Class",
+                                 date="2021-06-%02d" % day, time="21:00",
+                                 description="", price=10.0,
+                                 location=location, artists=[])
+            create_pack(name="Pack %s" % day, price=10.0, events=[event])
+
+        res = self.client.get(BOOKING_API, {'from': '2021-06-02'})
+        self.assertEqual([pack['name'] for pack in res.data['results']],
+                         ['Pack 2', 'Pack 3'])
+
+        res = self.client.get(BOOKING_API, {'from': '2021-05-01',
+                                            'to': '2021-06-01'})
+        self.assertEqual([pack['name'] for pack in res.data['results']],
+                         ['Bounce Factory all night', 'Pack 1'])
+
+    def test_list_packs_invalid_date(self):
+        """test an invalid date filter is rejected """
+        res = self.client.get(BOOKING_API, {'from': '2021-13-45'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('from', res.data)
+
+    def create_facet_catalog(self):
+        """the setUp pack (Padova) plus a salsa pack in Milano"""
+        location = create_location(name="Salsa Club", address='via roma 7',
+                                   city='Milano', room='main')
+        salsa = create_artist(name="Maria Rossi", type="Teacher",
+                              style="Salsa", description="",
+                              country="Italia")
+        event = create_event(name="Salsa night", type="Social Dance",
+                             date="2021-06-01", time="21:00",
+                             description="", price=10.0, location=location,
+                             artists=[salsa])
+        return create_pack(name="Salsa pass", price=40.0, events=[event])
+
+    def test_list_packs_filters(self):
+        """test filtering the catalog by the events of the packs """
+        self.create_facet_catalog()
+
+        def names(params):
+            res = self.client.get(BOOKING_API, params)
+            return [pack['name'] for pack in res.data['results']]
+
+        self.assertEqual(names({'city': 'Milano'}), ['Salsa pass'])
+        self.assertEqual(names({'style': 'Salsa,Lindy Hop'}),
+                         ['Bounce Factory all night', 'Salsa pass'])
+        self.assertEqual(names({'artist': self.artist1.id}),
+                         ['Bounce Factory all night'])
+        self.assertEqual(names({'type': 'Social Dance', 'city': 'Padova'}),
+                         ['Bounce Factory all night'])
+        self.assertEqual(names({'price_min': '20'}), ['Salsa pass'])
+        self.assertEqual(names({'price_max': '20', 'city': 'Milano'}), [])
+
+    def test_list_packs_invalid_filters(self):
+        """test invalid filters are rejected """
+        res = self.client.get(BOOKING_API, {'artist': 'frankie'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('artist', res.data)
+
+        for params in ({'artist': '99999999999999999999999'},
+                       {'location': '1,0'},
+                       {'price_min': 'cheap'},
+                       {'price_min': 'NaN'},
+                       {'price_max': 'Infinity'},
+                       {'price_max': '1e999'}):
+            res = self.client.get(BOOKING_API, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(next(iter(params)), res.data)
+
+    def test_list_packs_facets(self):
+        """test the facet counts ignore the filter of their dimension """
+        self.create_facet_catalog()
+
+        res = self.client.get(BOOKING_API, {'facets': 'true',
+                                            'city': 'Milano'})
+
+        facets = res.data['facets']
+        self.assertEqual([pack['name'] for pack in res.data['results']],
+                         ['Salsa pass'])
+        self.assertEqual(
+            [(row['label'], row['count']) for row in facets['city']],
+            [('Milano', 1), ('Padova', 1)],
+        )
+        self.assertEqual(
+            [(row['label'], row['count']) for row in facets['style']],
+            [('Salsa', 1)],
+        )
+        self.assertEqual(
+            [(row['label'], row['count']) for row in facets['type']],
+            [('Social Dance', 1)],
+        )
+        self.assertEqual(facets['artist'][0]['label'], 'Maria Rossi')
+        self.assertEqual(facets['location'][0]['label'], 'Salsa Club')
+        self.assertEqual(facets['price'], {'min': '40.00', 'max': '40.00'})
+
+    def test_list_packs_facets_query_count(self):
+        """test the facets are one grouped query per dimension """
+        self.create_facet_catalog()
+        with CaptureQueriesContext(connection) as plain:
+            self.client.get(BOOKING_API, {'city': 'Milano'})
+        catalog_cache.bump_version()
+        with CaptureQueriesContext(connection) as faceted:
+            res = self.client.get(BOOKING_API, {'facets': '1',
+                                                'city': 'Milano'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(faceted) - len(plain), 6)
+
+    def test_list_packs_not_modified(self):
+        """test polling the catalog with the etag answers 304 """
+        res = self.client.get(BOOKING_API)
+        etag = res['ETag']
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(BOOKING_API, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.get(BOOKING_API,
+                              HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.pack.price = 20.0
+        self.pack.save()
+        res = self.client.get(BOOKING_API, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    @override_settings(BOOKING_CATALOG_STREAM_CHUNK_SIZE=2)
+    def test_list_packs_streaming(self):
+        """test the catalog can be streamed as a json array """
+        location = create_location(name="Bounce Factory",
+                                   address='via roma 7',
+                                   city='Milano', room='main')
+        for day in (3, 1, 2, 2):
+            event = create_event(name="Class %s" % day, type="Class",
+                                 date="2021-06-%02d" % day, time="21:00",
+                                 description="", price=10.0,
+                                 location=location, artists=[])
+            create_pack(name="Pack %s" % day, price=10.0, events=[event])
+
+        paginated = self.client.get(BOOKING_API).data['results']
+        res = self.client.get(BOOKING_API, {'stream': '1'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res.streaming)
+        with CaptureQueriesContext(connection) as queries:
+            data = json.loads(b''.join(res.streaming_content))
+        # the chunks are range queries on the stored starting date
+        self.assertTrue(queries)
+        for query in queries:
+            self.assertNotIn('GROUP BY', query['sql'])
+        self.assertEqual([pack['name'] for pack in data],
+                         ['Bounce Factory all night', 'Pack 1', 'Pack 2',
+                          'Pack 2', 'Pack 3'])
+        self.assertEqual(data, json.loads(json.dumps(paginated)))
+
+    def test_book_pack(self):
+        """test booking a pack reserves a seat in the pack and its events """
+        res = self.client.post(BOOK_API, {'packs': self.pack.id})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        booking = models.Booking.objects.get(id=res.data['id'])
+        self.assertEqual(booking.users, self.user)
+        self.assertEqual(booking.packs, self.pack)
+        self.pack.refresh_from_db()
+        self.event1.refresh_from_db()
+        self.assertEqual(self.pack.booked_count, 1)
+        self.assertEqual(self.event1.booked_count, 1)
+
+    def test_book_pack_sold_out(self):
+        """test a full pack can not be booked """
+        self.pack.capacity = 1
+        self.pack.save()
+        self.client.post(BOOK_API, {'packs': self.pack.id})
+
+        res = self.client.post(BOOK_API, {'packs': self.pack.id})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(models.Booking.objects.count(), 1)
+
+    def test_book_pack_event_sold_out(self):
+        """test a pack can not be booked when one of its events is full """
+        self.event2.capacity = 1
+        self.event2.save()
+        other_pack = create_pack(name="Social only", price=10.0,
+                                 events=[self.event2])
+        self.client.post(BOOK_API, {'packs': other_pack.id})
+
+        res = self.client.post(BOOK_API, {'packs': self.pack.id})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.pack.refresh_from_db()
+        self.event1.refresh_from_db()
+        self.assertEqual(self.pack.booked_count, 0)
+        self.assertEqual(self.event1.booked_count, 0)
+
+
+    def test_list_packs_seats(self):
+        """test the catalog shows the seats left """
+        self.pack.capacity = 10
+        self.pack.save()
+        self.event1.capacity = 3
+        self.event1.save()
+        self.client.post(BOOK_API, {'packs': self.pack.id})
+
+        res = self.client.get(BOOKING_API)
+
+        pack = res.data['results'][0]
+        self.assertEqual(pack['booked_count'], 1)
+        self.assertEqual(pack['remaining'], 2)
+        self.assertCountEqual(
+            [event['remaining'] for event in pack['events']], [2, None]
+        )
+
+    def test_list_packs_seats_cached(self):
+        """test a booking keeps the cached catalog with live seats """
+        self.pack.capacity = 10
+        self.pack.save()
+        self.client.get(BOOKING_API)
+        version = catalog_cache.get_version()
+        res = self.client.get(BOOKING_API)
+        etag = res['ETag']
+
+        catalog_cache.reset_stats()
+        self.client.post(BOOK_API, {'packs': self.pack.id})
+        res = self.client.get(BOOKING_API, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(catalog_cache.get_version(), version)
+        self.assertEqual(catalog_cache.stats()['hits'], 1)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        pack = res.data['results'][0]
+        self.assertEqual(pack['booked_count'], 1)
+        self.assertEqual(pack['remaining'], 9)
+        self.assertEqual([event['booked_count'] for event in pack['events']],
+                         [1, 1])
+
+        res = self.client.get(BOOKING_API, {'fields': 'name,remaining'})
+        self.assertEqual(res.data['results'][0],
+                         {'name': self.pack.name, 'remaining': 9})
+
+    def test_my_bookings(self):
+        """test the bookings of the user are listed with their totals """
+        discount = models.Discount.objects.create(name="early bird",
+                                                  discount=20)
+        other = create_pack(name="Social only", price=8.5,
+                            events=[self.event2])
+        other.discounts.add(discount)
+        self.client.post(BOOK_API, {'packs': self.pack.id})
+        self.client.post(BOOK_API, {'packs': other.id})
+        models.Booking.objects.filter(packs=self.pack).update(payed=True)
+        someone = create_user(email='other@seelv.io', password='test123')
+        models.Booking.objects.create_booking(someone, self.pack)
+
+        res = self.client.get(MY_BOOKINGS_API)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['totals'], {
+            'count': 2, 'paid': '15.00', 'outstanding': '6.80',
+        })
+        booking = res.data['results'][0]
+        self.assertEqual(booking['pack_name'], 'Social only')
+        self.assertEqual(booking['amount'], '6.80')
+        self.assertFalse(booking['payed'])
+        self.assertEqual(booking['starting_date'], '2021-05-18')
+        self.assertEqual(booking['date'], date.today().isoformat())
+
+    def test_my_bookings_paginated(self):
+        """test the bookings are paginated newest first in two queries """
+        for day in range(1, 6):
+            booking = models.Booking.objects.create_booking(self.user,
+                                                            self.pack)
+            booking.date = date(2021, 6, day)
+            booking.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(MY_BOOKINGS_API, {'page_size': 2})
+        # the page and the totals
+        self.assertEqual(len(queries), 2)
+
+        dates = []
+        url = MY_BOOKINGS_API + '?page_size=2'
+        while url:
+            res = self.client.get(url)
+            dates.extend(booking['date'] for booking in res.data['results'])
+            self.assertEqual(res.data['totals']['count'], 5)
+            url = res.data['next']
+        self.assertEqual(dates, ['2021-06-%02d' % day
+                                 for day in range(5, 0, -1)])
+
+    def test_my_bookings_not_logged_in(self):
+        """test the bookings of a user need authentication """
+        res = APIClient().get(MY_BOOKINGS_API)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_list_packs_sparse_fields(self):
+        """test ?fields= selects the fields, nested ones with dots """
+        res = self.client.get(BOOKING_API,
+                              {'fields': 'name,price,events.date'})
+
+        pack = res.data['results'][0]
+        self.assertEqual(list(pack), ['name', 'events', 'price'])
+        self.assertEqual(pack['events'][0], {'date': '2021-05-18'})
+
+    def test_list_packs_sparse_fields_skip_prefetch(self):
+        """test the events are not queried when they are not rendered """
+        with CaptureQueriesContext(connection) as full:
+            self.client.get(BOOKING_API)
+        with CaptureQueriesContext(connection) as sparse:
+            res = self.client.get(BOOKING_API, {'fields': 'name,price'})
+
+        self.assertEqual(res.data['results'][0],
+                         {'name': self.pack.name, 'price': '15.00'})
+        # no events and artists prefetch
+        self.assertEqual(len(sparse.captured_queries),
+                         len(full.captured_queries) - 2)
+
+    def test_list_packs_sparse_fields_dates(self):
+        """test the dates of ?fields= are loaded with the packs """
+        create_pack(name="Social only", price=8.5, events=[self.event2])
+        params = {'fields': 'name,starting_date,ending_date'}
+        with CaptureQueriesContext(connection) as two_packs:
+            self.client.get(BOOKING_API, params)
+        for day in (1, 2, 3):
+            create_pack(name="Pack %s" % day, price=10.0,
+                        events=[self.event1])
+        catalog_cache.bump_version()
+
+        with self.assertNumQueries(len(two_packs)):
+            res = self.client.get(BOOKING_API, params)
+        self.assertEqual(len(res.data['results']), 5)
+        self.assertEqual(res.data['results'][0],
+                         {'name': self.pack.name,
+                          'starting_date': '2021-05-18',
+                          'ending_date': '2021-05-18'})
+
+    def test_list_packs_expand(self):
+        """test ?expand= renders the nested fields not listed as ids """
+        res = self.client.get(BOOKING_API, {'expand': ''})
+        self.assertCountEqual(res.data['results'][0]['events'],
+                              [self.event1.id, self.event2.id])
+
+        res = self.client.get(BOOKING_API, {'expand': 'events'})
+        event = res.data['results'][0]['events'][0]
+        self.assertCountEqual(event['artist'],
+                              [self.artist1.id, self.artist2.id])
+        self.assertEqual(event['price'], '10.00')
+
+    def test_list_packs_projections_same_output(self):
+        """test the projections render the same json as the serializer """
+        self.pack.capacity = 10
+        self.pack.description = None
+        self.pack.save()
+        self.event1.capacity = 1
+        self.event1.save()
+        self.client.post(BOOK_API, {'packs': self.pack.id})
+        create_pack(name="Social only", price=8.5, description="social",
+                    events=[self.event2])
+
+        contents = []
+        for projections in (False, True):
+            with override_settings(BOOKING_CATALOG_PROJECTIONS=projections):
+                catalog_cache.bump_version()
+                res = self.client.get(BOOKING_API, {'page_size': 1})
+                contents.append(res.content)
+                res = self.client.get(BOOKING_API, {'stream': '1'})
+                contents.append(b''.join(res.streaming_content))
+
+        self.assertEqual(contents[:2], contents[2:])
+        self.assertIn(b'"remaining":0', contents[1])
+
+    def test_list_packs_unknown_fields(self):
+        """test unknown fields are refused """
+        res = self.client.get(BOOKING_API, {'fields': 'name,events.color'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', res.data)
+
+        res = self.client.get(BOOKING_API, {'expand': 'price'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expand', res.data)
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Test parallel buyers can not oversell a pack"""
+
+    def test_parallel_bookings_no_oversell(self):
+        """test many threads booking the last seats at the same time """
+        location = create_location(name="Carichi", address='via portello 1',
+                                   city='Padova', room='main')
+        event = create_event(name="Workshop", type="Workshop",
+                             date="2021-06-01", time="15:00",
+                             description="", price=30.0, location=location,
+                             capacity=7, artists=[])
+        pack = create_pack(name="Workshop pack", price=30.0, capacity=10,
+                           events=[event])
+        users = [create_user(email='user%s@seelv.io' % i, password='test123')
+                 for i in range(20)]
+        barrier = threading.Barrier(len(users))
+        results = []
+
+        def buy(user):
+            barrier.wait()
+            try:
+                # create_booking retries on its own while the database is
+                # locked by another buyer, a lock error left is a failure
+                models.Booking.objects.create_booking(user, pack)
+                results.append('booked')
+            except models.SoldOut:
+                results.append('sold out')
+            except OperationalError as e:
+                results.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=buy, args=(user,))
+                   for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([result for result in results
+                          if isinstance(result, OperationalError)], [])
+        pack.refresh_from_db()
+        event.refresh_from_db()
+        self.assertEqual(results.count('booked'), 7)
+        self.assertEqual(results.count('sold out'), 13)
+        self.assertEqual(models.Booking.objects.count(), 7)
+        self.assertEqual(pack.booked_count, 7)
+        self.assertEqual(event.booked_count, 7)
+
+
+class AsyncCatalogTests(TransactionTestCase):
+    """Test the async catalog view, the worker threads need the data
+    committed so this is a TransactionTestCase"""
+
+    def setUp(self):
+        self.user = create_user(email='test@seelv.io', password='test123')
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        location = create_location(name="Carichi", address='via portello 1',
+                                   city='Padova', room='main')
+        artist = create_artist(name="Frankie Manning", type="Teacher",
+                               style="Lindy Hop", description="",
+                               country="USA")
+        event = create_event(name="Bounce Factory", type="Class",
+                             date="2021-05-18", time="21:00",
+                             description="", price=10.0, location=location,
+                             artists=[artist])
+        create_pack(name="Bounce Factory all night", price=15.0,
+                    events=[event])
+
+    def test_async_catalog_same_as_sync(self):
+        """test the async view returns the catalog of the sync view """
+        sync = self.client.get(BOOKING_API, HTTP_ACCEPT='application/json')
+        res = self.client.get(BOOKING_ASYNC_API,
+                              HTTP_ACCEPT='application/json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['results'], sync.json()['results'])
+
+    def test_async_catalog_from_cache(self):
+        """test a warm catalog poll only queries the seat counters """
+        self.client.get(BOOKING_ASYNC_API)
+
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        try:
+            res = self.client.get(BOOKING_ASYNC_API)
+            queries = counter.queries
+            etag = res['ETag']
+            not_modified = self.client.get(BOOKING_ASYNC_API,
+                                           HTTP_IF_NONE_MATCH=etag)
+        finally:
+            current_counter.reset(token)
+
+        # the live seat counters, and nothing for the 304
+        self.assertEqual(queries, 2)
+        self.assertEqual(counter.queries, 2)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['results'][0]['name'],
+                         'Bounce Factory all night')
+        self.assertEqual(not_modified.status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+    def test_async_catalog_cache_off_event_loop(self):
+        """test the cache lookups of the async view run in a worker """
+        self.client.get(BOOKING_ASYNC_API)
+        on_loop = []
+        get = catalog_cache.get
+
+        def recording_get(variant):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return get(variant)
+
+        with mock.patch.object(catalog_cache, 'get', recording_get):
+            res = self.client.get(BOOKING_ASYNC_API)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(on_loop, [False])
+
+    def test_async_catalog_not_logged_in(self):
+        """test the async view needs authentication too """
+        res = APIClient().get(BOOKING_ASYNC_API)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token wrong')
+        res = client.get(BOOKING_ASYNC_API)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
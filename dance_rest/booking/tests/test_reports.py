@@ -0,0 +1,150 @@
+# booking/tests/test_reports.py
+
+from datetime import date, time
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import models
+
+SALES_REPORT_API = reverse('booking:sales_report')
+
+# helper functions
+
+def create_pack(name, price, event_names, event_price=10):
+    location = models.Location.objects.create(
+        name='Sala', address='via roma 1', city='Padova', room='A'
+    )
+    pack = models.Pack.objects.create(name=name, price=price)
+    for event_name in event_names:
+        pack.events.add(models.Event.objects.create(
+            name=event_name, type='Class', description='',
+            date=date(2030, 1, 1), time=time(20), location=location,
+            price=event_price,
+        ))
+    return pack
+
+
+def book(user, pack, day, paid=False):
+    booking = models.Booking.objects.create_booking(user, pack)
+    booking.date = day
+    booking.save()
+    if paid:
+        booking.pay()
+    return booking
+
+
+class SalesReportTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@seelv.io', 'Test123456!'
+        )
+        self.client.force_authenticate(self.admin)
+        user = get_user_model().objects.create_user(
+            email='test@seelv.io', password='Test123456!'
+        )
+        self.weekend = create_pack('Weekend', 40, ['Friday', 'Saturday'])
+        self.night = create_pack('Night', 10, ['Saturday night'])
+        book(user, self.weekend, date(2021, 5, 1), paid=True)
+        book(user, self.weekend, date(2021, 5, 20))
+        book(user, self.night, date(2021, 6, 3), paid=True)
+
+    def test_report_staff_only(self):
+        """ test the reports are for the staff only """
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.get(
+            email='test@seelv.io'
+        ))
+        res = client.get(SALES_REPORT_API)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_report_by_month(self):
+        """ test the sales per month with paid and outstanding amounts """
+        res = self.client.get(SALES_REPORT_API, {'group': 'month'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        may, june = res.data['results']
+        self.assertEqual(may['key'], date(2021, 5, 1))
+        self.assertEqual(may['bookings'], 2)
+        self.assertEqual(may['unpaid_bookings'], 1)
+        self.assertEqual(may['amount'], '80.00')
+        self.assertEqual(may['outstanding'], '40.00')
+        self.assertEqual(june['paid_amount'], '10.00')
+        self.assertEqual(res.data['totals']['amount'], '90.00')
+        self.assertEqual(res.data['totals']['outstanding'], '40.00')
+
+    def test_report_by_pack_and_event(self):
+        """ test the sales per pack and the share of each event """
+        res = self.client.get(SALES_REPORT_API, {'group': 'pack'})
+        self.assertEqual(
+            [(row['label'], row['amount']) for row in res.data['results']],
+            [('Weekend', '80.00'), ('Night', '10.00')],
+        )
+
+        res = self.client.get(SALES_REPORT_API, {'group': 'event'})
+        self.assertEqual(
+            {row['label']: (row['bookings'], row['amount'],
+                            row['paid_amount'])
+             for row in res.data['results']},
+            {'Friday': (2, '40.00', '20.00'),
+             'Saturday': (2, '40.00', '20.00'),
+             'Saturday night': (1, '10.00', '10.00')},
+        )
+        self.assertEqual(res.data['totals']['amount'], '90.00')
+
+        res = self.client.get(SALES_REPORT_API, {'group': 'event_packs'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_report_event_shares_by_price(self):
+        """ test a sale is split between the events by their price """
+        festival = create_pack('Festival', 100, ['Class'], event_price=10)
+        festival.events.add(models.Event.objects.create(
+            name='Gala', type='Social Dance', description='',
+            date=date(2030, 1, 2), time=time(21),
+            location=models.Location.objects.get(pk=festival.events.get()
+                                                 .location_id),
+            price=20,
+        ))
+        festival.save()
+        user = get_user_model().objects.get(email='test@seelv.io')
+        book(user, festival, date(2021, 7, 1))
+
+        res = self.client.get(SALES_REPORT_API, {'group': 'event',
+                                                 'from': '2021-07-01'})
+        self.assertEqual(
+            {row['label']: row['amount'] for row in res.data['results']},
+            {'Class': '33.33', 'Gala': '66.67'},
+        )
+
+    def test_report_date_window(self):
+        """ test the report is limited to the booking dates given """
+        res = self.client.get(SALES_REPORT_API, {
+            'group': 'day', 'from': '2021-05-02', 'to': '2021-05-31',
+        })
+
+        self.assertEqual([row['key'] for row in res.data['results']],
+                         [date(2021, 5, 20)])
+        self.assertEqual(res.data['totals']['bookings'], 1)
+
+    def test_report_reads_rollups_only(self):
+        """ test the report never queries the bookings """
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(SALES_REPORT_API, {'group': 'pack'})
+
+        self.assertEqual(len(queries), 2)
+        for query in queries:
+            self.assertNotIn('core_booking', query['sql'])
+
+    def test_report_invalid_group(self):
+        """ test an unknown group is refused """
+        res = self.client.get(SALES_REPORT_API, {'group': 'artist'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('group', res.data)
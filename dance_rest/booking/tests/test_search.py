@@ -0,0 +1,209 @@
+# booking/tests/test_search.py
+
+from datetime import date, time
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from booking.search import TABLE, match_expression, search_events, \
+                           search_packs, search_terms
+from booking.season import import_season
+from booking.tests.test_season import make_season
+from core import models
+
+SEARCH_URL = reverse('booking:search')
+
+# helper functions
+
+def create_event(name, city='Padova', artists=(), type='Workshop',
+                 description=''):
+    location = models.Location.objects.create(
+        name='Sala', address='via roma 1', city=city, room='A'
+    )
+    event = models.Event.objects.create(
+        name=name, type=type, description=description,
+        date=date(2030, 1, 1), time=time(20), location=location, price=10,
+    )
+    event.artist.add(*artists)
+    return event
+
+
+def create_artist(name, style):
+    return models.Artist.objects.create(name=name, style=style,
+                                        type='Teacher', description='',
+                                        country='Italia')
+
+
+def indexed_ids():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT rowid FROM %s ORDER BY rowid' % TABLE)
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SearchIndexTests(TestCase):
+
+    def setUp(self):
+        self.salsa = create_artist('Maria Rossi', 'Salsa')
+        self.swing = create_artist('Frankie Manning', 'Lindy Hop')
+
+    def test_terms(self):
+        """ test the query is reduced to words matched as prefixes """
+        terms = search_terms('salsa "workshop" -Milano* OR')
+        self.assertEqual(terms, ['salsa', 'workshop', 'Milano', 'OR'])
+        self.assertEqual(match_expression(['salsa', 'OR']),
+                         '"salsa"* "OR"*')
+
+    def test_search_across_models(self):
+        """ test the words are matched in events, artists and cities """
+        milano = create_event('Weekend intensive', city='Milano',
+                              artists=[self.salsa])
+        create_event('Weekend intensive', city='Padova',
+                     artists=[self.salsa])
+        create_event('Social night', city='Milano', type='Social',
+                     artists=[self.swing])
+
+        self.assertEqual(search_events(['salsa', 'workshop', 'milano'], 10),
+                         [milano.pk])
+        self.assertEqual(len(search_events(['sals'], 10)), 2)
+        self.assertEqual(search_events(['tango'], 10), [])
+
+    def test_ranking(self):
+        """ test a match in the name ranks above one in the description """
+        in_description = create_event('Social night',
+                                      description='after the salsa class')
+        in_name = create_event('Salsa night')
+
+        self.assertEqual(search_events(['salsa'], 10),
+                         [in_name.pk, in_description.pk])
+
+    def test_index_follows_changes(self):
+        """ test the signals keep the index in sync """
+        event = create_event('Weekend intensive')
+        self.assertEqual(search_events(['salsa'], 10), [])
+
+        event.artist.add(self.salsa)
+        self.assertEqual(search_events(['salsa'], 10), [event.pk])
+
+        self.salsa.style = 'Bachata'
+        self.salsa.save()
+        self.assertEqual(search_events(['salsa'], 10), [])
+        self.assertEqual(search_events(['bachata'], 10), [event.pk])
+
+        event.location.city = 'Torino'
+        event.location.save()
+        self.assertEqual(search_events(['torino'], 10), [event.pk])
+
+        self.salsa.event_set.clear()
+        self.assertEqual(search_events(['bachata'], 10), [])
+
+        event.artist.add(self.swing)
+        self.swing.delete()
+        self.assertEqual(search_events(['lindy'], 10), [])
+
+        event.delete()
+        self.assertEqual(indexed_ids(), [])
+
+    def test_search_packs(self):
+        """ test the packs are ranked by their best event """
+        night = create_event('Social night', description='salsa')
+        class_ = create_event('Salsa class')
+        other = create_event('Tango class')
+        both = models.Pack.objects.create(name='Both', price=20)
+        both.events.add(night, other)
+        best = models.Pack.objects.create(name='Best', price=20)
+        best.events.add(class_)
+        models.Pack.objects.create(name='Empty', price=20)
+
+        self.assertEqual(search_packs(['salsa'], 10), [best.pk, both.pk])
+        self.assertEqual(search_packs(['salsa'], 1), [best.pk])
+
+    def test_season_import_indexed(self):
+        """ test the events bulk created by the importer are indexed """
+        import_season(make_season())
+
+        self.assertEqual(len(search_events(['social', 'padova'], 10)), 2)
+
+    def test_without_fts5(self):
+        """ test sqlite without FTS5 falls back to plain lookups """
+        connection.search_fts5 = False
+        self.addCleanup(delattr, connection, 'search_fts5')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE %s' % TABLE)
+
+        call_command('migrate', verbosity=0)
+        event = create_event('Salsa night', artists=[self.salsa])
+
+        self.assertEqual(search_events(['salsa'], 10), [event.pk])
+
+    def test_rebuild_command(self):
+        """ test the command reindexes every event """
+        event = create_event('Salsa night')
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % TABLE)
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+
+        self.assertEqual(indexed_ids(), [event.pk])
+        self.assertIn('1 events indexed', out.getvalue())
+
+
+class SearchApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@seelv.io', password='Test123456!'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_search_requires_authentication(self):
+        """ test the search is for authenticated users only """
+        res = APIClient().get(SEARCH_URL, {'q': 'salsa'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_search(self):
+        """ test the events and packs found are returned best first """
+        artist = create_artist('Maria Rossi', 'Salsa')
+        event = create_event('Salsa workshop', city='Milano',
+                             artists=[artist])
+        create_event('Tango workshop', city='Milano')
+        pack = models.Pack.objects.create(name='Salsa pass', price=20)
+        pack.events.add(event)
+
+        res = self.client.get(SEARCH_URL, {'q': 'salsa workshop milano'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([e['id'] for e in res.data['events']], [event.pk])
+        self.assertEqual(res.data['events'][0]['name'], 'Salsa workshop')
+        self.assertEqual(res.data['events'][0]['artist'][0]['name'],
+                         'Maria Rossi')
+        self.assertEqual([p['id'] for p in res.data['packs']], [pack.pk])
+        self.assertEqual(res.data['packs'][0]['events'][0]['type'],
+                         'Workshop')
+
+    def test_search_limit(self):
+        """ test the number of results is limited """
+        for i in range(3):
+            create_event('Salsa night %d' % i)
+
+        res = self.client.get(SEARCH_URL, {'q': 'salsa', 'limit': 2})
+        self.assertEqual(len(res.data['events']), 2)
+
+        res = self.client.get(SEARCH_URL, {'q': 'salsa', 'limit': 'x'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('limit', res.data)
+
+    def test_search_without_words(self):
+        """ test a query without words is refused """
+        res = self.client.get(SEARCH_URL, {'q': '" * -'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('q', res.data)
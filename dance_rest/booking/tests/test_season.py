@@ -0,0 +1,166 @@
+# booking/tests/test_season.py
+
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+
+from booking.cache import catalog_cache
+from booking.season import SeasonError, import_season
+from core import models
+
+# helper functions
+
+def make_season(events=2):
+    return {
+        'locations': [
+            {'name': 'Sala Grande', 'address': 'via roma 1',
+             'city': 'Padova', 'room': 'A'},
+            {'name': 'Sala Grande', 'address': 'via roma 1',
+             'city': 'Padova', 'room': 'A'},
+        ],
+        'artists': [
+            {'name': 'Frankie Manning', 'style': 'Lindy Hop',
+             'type': 'Teacher', 'description': 'ambassador',
+             'country': 'USA'},
+            {'name': 'Count Basie', 'style': 'Swing', 'type': 'Band',
+             'description': 'big band', 'country': 'USA'},
+        ],
+        'discounts': [{'name': 'early bird', 'discount': '10'}],
+        'events': [
+            {'key': 'night%d' % i, 'name': 'Social night',
+             'type': 'Social Dance', 'description': 'live music',
+             'date': (date(2026, 7, 1) + timedelta(days=i)).isoformat(),
+             'time': '21:00',
+             'location': 'Sala Grande', 'price': '15.00',
+             'artists': ['Frankie Manning', 'Count Basie']}
+            for i in range(events)
+        ],
+        'packs': [
+            {'name': 'Full pass', 'price': '25.00', 'capacity': 100,
+             'events': ['night%d' % i for i in range(events)],
+             'discounts': ['early bird']},
+        ],
+    }
+
+
+class SeasonImportTests(TestCase):
+
+    def test_import_season(self):
+        """ test the season is created with its links """
+        counts = import_season(make_season())
+
+        self.assertEqual(models.Location.objects.count(), 1)
+        self.assertEqual(counts['locations'],
+                         {'created': 1, 'existing': 0})
+        pack = models.Pack.objects.get(name='Full pass')
+        self.assertEqual(pack.capacity, 100)
+        self.assertEqual(pack.events.count(), 2)
+        self.assertEqual(pack.discounts.get().name, 'early bird')
+        event = pack.events.order_by('date').first()
+        self.assertEqual(event.date, date(2026, 7, 1))
+        self.assertCountEqual(event.artist.values_list('name', flat=True),
+                              ['Frankie Manning', 'Count Basie'])
+
+    def test_import_reuses_existing_rows(self):
+        """ test importing twice creates nothing new """
+        import_season(make_season())
+        counts = import_season(make_season())
+
+        self.assertEqual(counts['events'], {'created': 0, 'existing': 2})
+        self.assertEqual(counts['packs'], {'created': 0, 'existing': 1})
+        self.assertEqual(models.Artist.objects.count(), 2)
+        self.assertEqual(models.Event.objects.count(), 2)
+        self.assertEqual(models.Event.artist.through.objects.count(), 4)
+
+    def test_import_references_by_natural_key(self):
+        """ test homonym locations and discounts are told apart """
+        season = make_season()
+        season['locations'].append({'name': 'Sala Grande',
+                                    'address': 'via po 2',
+                                    'city': 'Torino', 'room': 'B'})
+        season['discounts'].append({'name': 'early bird', 'discount': '20'})
+        season['events'][0]['location'] = {'name': 'Sala Grande',
+                                           'city': 'Padova'}
+        season['events'][1]['location'] = {'name': 'Sala Grande',
+                                           'city': 'Torino'}
+        season['packs'][0]['discounts'] = [{'name': 'early bird',
+                                            'discount': 20}]
+        import_season(season)
+
+        event = models.Event.objects.get(date=date(2026, 7, 2))
+        self.assertEqual(event.location.city, 'Torino')
+        pack = models.Pack.objects.get()
+        self.assertEqual(pack.discounts.get().discount, 20)
+        self.assertEqual(pack.final_price, 20)
+
+    def test_import_ambiguous_reference(self):
+        """ test a name shared by two locations is refused """
+        season = make_season()
+        season['locations'].append({'name': 'Sala Grande',
+                                    'address': 'via po 2',
+                                    'city': 'Torino', 'room': 'B'})
+
+        with self.assertRaisesMessage(SeasonError, "ambiguous"):
+            import_season(season)
+        self.assertFalse(models.Location.objects.exists())
+
+    def test_import_queries_do_not_grow(self):
+        """ test the queries do not depend on the number of events """
+        queries = []
+        for events in (2, 50):
+            # the locations, artists and discounts exist on both runs
+            import_season(make_season(events=1))
+            models.Pack.objects.all().delete()
+            models.Event.objects.all().delete()
+            with CaptureQueriesContext(connection) as captured:
+                import_season(make_season(events=events))
+            queries.append(len(captured))
+
+        self.assertEqual(queries[0], queries[1])
+        self.assertEqual(models.Event.objects.count(), 50)
+
+    def test_import_invalid_nothing_created(self):
+        """ test an invalid season imports nothing """
+        season = make_season()
+        season['packs'][0]['events'].append('missing')
+
+        with self.assertRaisesMessage(SeasonError, "unknown event"):
+            import_season(season)
+        self.assertFalse(models.Location.objects.exists())
+        self.assertFalse(models.Event.objects.exists())
+
+    def test_import_invalid_field(self):
+        """ test an invalid value is reported """
+        season = make_season()
+        season['events'][0]['date'] = 'tomorrow'
+
+        with self.assertRaisesMessage(SeasonError, "events 'Social night'"):
+            import_season(season)
+
+    def test_import_bumps_catalog_version(self):
+        """ test the cached catalog is invalidated """
+        version = catalog_cache.get_version()
+        import_season(make_season())
+        self.assertNotEqual(catalog_cache.get_version(), version)
+
+    def test_import_season_command(self):
+        """ test the command imports a json file """
+        f = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        with f:
+            json.dump(make_season(), f)
+        self.addCleanup(os.remove, f.name)
+
+        out = StringIO()
+        call_command('import_season', f.name, stdout=out)
+        self.assertIn('events: 2 created, 0 existing', out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('import_season', f.name + '.missing')
@@ -6,4 +6,14 @@ app_name = 'booking'
 
 urlpatterns = [
         path('booking/', views.BookingPackList.as_view(), name='booking'),
+        path('booking/async/', views.booking_pack_list_async,
+             name='booking_async'),
+        path('search/', views.CatalogSearchView.as_view(),
+             name='search'),
+        path('mine/', views.MyBookingList.as_view(), name='mine'),
+        path('book/', views.CreateBookingView.as_view(), name='book'),
+        path('reports/sales/', views.SalesReportView.as_view(),
+             name='sales_report'),
+        path('cache-stats/', views.CatalogCacheStatsView.as_view(),
+             name='cache_stats'),
         ]
@@ -1,18 +1,467 @@
 # booking/views.py
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Prefetch, Q, Sum
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_date
+from django.utils.translation import gettext_lazy as _
 from rest_framework import generics, authentication, permissions, \
-                            viewsets, mixins
-from booking.serializers import PackListSerializers
+                            viewsets, mixins, serializers
+from booking.cache import catalog_cache
+from booking.facets import pack_facets, parse_filters, filter_packs
+from booking.pagination import BookingCursorPagination, \
+                               PackCursorPagination
+from booking.projections import ARTIST_ORDERING, EVENT_ORDERING, \
+                                PACK_SOURCES, overlay_event_seats, overlay_seats, \
+                                project_packs, render_packs
+from booking.reports import GROUPS, sales_report
+from booking.search import search_events, search_packs, search_terms
+from booking.streaming import stream_json_array
+from booking.serializers import PackListSerializers, BookingSerializer, \
+                                SearchEventSerializer, SearchPackSerializer, \
+                                MyBookingSerializer, parse_field_tree
+from rest_framework.authentication import get_authorization_header
+from rest_framework.renderers import JSONRenderer
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from core.models import Pack
+from core.async_utils import run_sync_view
+from core.authentication import CachedTokenAuthentication, token_cache
+from core.mixins import ConditionalGetMixin, conditional_response, make_etag
+from core.models import Pack, Event, Artist, Booking
+from core.routers import ReplicaReadMixin
 
 
 # Create your views here.
 
-class BookingPackList(generics.ListAPIView):
-    """Create a new user in the system """
+def catalog_etag_source(request):
+    return '%s:%s:%s' % (catalog_cache.get_version(),
+                         catalog_cache.get_seats_version(),
+                         request.build_absolute_uri())
+
+
+class DateParamMixin:
+
+    def _get_date_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            date = parse_date(value)
+        except ValueError:
+            date = None
+        if date is None:
+            msg = _('date must be in the format YYYY-MM-DD')
+            raise serializers.ValidationError({name: msg}, code='invalid')
+        return date
+
+
+class BookingPackList(ReplicaReadMixin, DateParamMixin, ConditionalGetMixin,
+                      generics.ListAPIView):
+    """List the packs in the catalog with their events and artists """
     serializer_class = PackListSerializers
-    queryset = Pack.objects.all()
+    # the dates are stored on the packs (pack_first_event_date_idx), the
+    # events and artists shown are prefetched by get_queryset
+    queryset = Pack.objects.order_by('first_event_date', 'id')
+
+    pagination_class = PackCursorPagination
 
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        """the packs of get_catalog_queryset with the data rendered"""
+        queryset = self.get_catalog_queryset()
+        if self.use_projections():
+            # rows rendered by serialize_packs, nothing to prefetch
+            return project_packs(queryset)
+        return self.select_related_data(queryset)
+
+    def get_catalog_queryset(self, exclude=None):
+        """
+        filter the packs by starting date with the `from` and `to` query
+        parameters and by their events with the filters of booking.facets
+        but the exclude one, packs without events have no date and are not
+        listed
+        """
+        queryset = super().get_queryset().filter(
+            first_event_date__isnull=False
+        )
+        date_from = self._get_date_param('from')
+        date_to = self._get_date_param('to')
+        if date_from:
+            queryset = queryset.filter(first_event_date__gte=date_from)
+        if date_to:
+            queryset = queryset.filter(first_event_date__lte=date_to)
+        return filter_packs(queryset, self.get_filters(), exclude)
+
+    def get_filters(self):
+        if not hasattr(self, '_filters'):
+            self._filters = parse_filters(self.request.query_params)
+        return self._filters
+
+    def use_projections(self):
+        """
+        whether the packs are rendered from values() projections instead
+        of the serializer, for the full catalog only
+        """
+        return getattr(settings, 'BOOKING_CATALOG_PROJECTIONS', True) and \
+            self.get_field_trees() == (None, None)
+
+    def serialize_packs(self, packs):
+        if self.use_projections():
+            return render_packs(packs)
+        return self.get_serializer(packs, many=True).data
+
+    def get_field_trees(self):
+        """
+        the trees (see parse_field_tree) of the `fields` to render and of
+        the nested fields to `expand`, None when not given
+        """
+        params = self.request.query_params
+        fields = params.get('fields')
+        expand = params.get('expand')
+        return (parse_field_tree(fields) if fields else None,
+                parse_field_tree(expand) if expand is not None else None)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs['fields'], kwargs['expand'] = self.get_field_trees()
+        return super().get_serializer(*args, **kwargs)
+
+    def select_related_data(self, queryset):
+        """
+        prefetch only the events and artists rendered, otherwise the
+        nested serializers would query them per pack, and load only the
+        pack columns rendered
+        """
+        fields, expand = self.get_field_trees()
+
+        def included(tree, name):
+            return tree is None or name in tree
+
+        # the seats left of a pack depend on the seats left of its events
+        seats = ['id', 'capacity', 'booked_count']
+        if fields is not None:
+            # the cursor of the pagination reads the starting date, the
+            # fields named differently from their column are mapped
+            columns = {PACK_SOURCES.get(name, name) for name in fields}
+            queryset = queryset.only(*seats, 'first_event_date', *(
+                field.name for field in Pack._meta.concrete_fields
+                if field.name in columns
+            ))
+
+        if included(fields, 'events') and included(expand, 'events'):
+            event_fields = None if fields is None else fields['events']
+            event_expand = None if expand is None else expand['events'] or {}
+            # the same order as booking.projections
+            events = Event.objects.order_by(*EVENT_ORDERING)
+            if included(event_fields, 'artist'):
+                artists = Artist.objects.order_by(*ARTIST_ORDERING) \
+                    if included(event_expand, 'artist') \
+                    else Artist.objects.only('id')
+                events = events.prefetch_related(
+                    Prefetch('artist', queryset=artists)
+                )
+        elif included(fields, 'events') or included(fields, 'remaining'):
+            events = Event.objects.only(*seats)
+        else:
+            return queryset
+        return queryset.prefetch_related(Prefetch('events', queryset=events))
+
+    def get_etag_source(self, request):
+        return catalog_etag_source(request)
+
+    def get_last_modified(self, request):
+        return catalog_cache.get_last_modified()
+
+    def list(self, request, *args, **kwargs):
+        # unknown fields and invalid filters are refused before anything is
+        # cached or streamed
+        self.get_serializer().fields
+        self.get_filters()
+        if request.query_params.get('stream') in ('1', 'true'):
+            return self.conditional_response(request, self.stream_catalog)
+        return self.conditional_response(request, lambda: Response(
+            self.get_catalog_data(request, *args, **kwargs)
+        ))
+
+    def stream_catalog(self):
+        """
+        stream the whole catalog as a json array without pagination, the
+        packs are loaded and serialized a chunk at a time so the memory
+        used depends on the chunk size and not on the catalog size
+        """
+        return StreamingHttpResponse(
+            stream_json_array(self.iter_catalog_chunks()),
+            content_type='application/json',
+        )
+
+    def iter_catalog_chunks(self):
+        chunk_size = getattr(settings, 'BOOKING_CATALOG_STREAM_CHUNK_SIZE',
+                             200)
+        queryset = self.filter_queryset(self.get_queryset()).order_by(
+            'first_event_date', 'id'
+        )
+        last = None
+        while True:
+            chunk = queryset
+            if last is not None:
+                # keyset on (starting date, id), every chunk is a range
+                # query on pack_first_event_date_idx instead of an ever
+                # growing offset
+                chunk = chunk.filter(
+                    Q(first_event_date__gt=last[0]) |
+                    Q(first_event_date=last[0], id__gt=last[1])
+                )
+            packs = list(chunk[:chunk_size])
+            if packs:
+                yield self.serialize_packs(packs)
+            if len(packs) < chunk_size:
+                return
+            last = (packs[-1]['first_event_date'], packs[-1]['id']) \
+                if isinstance(packs[-1], dict) else \
+                (packs[-1].first_event_date, packs[-1].id)
+
+    def get_catalog_data(self, request, *args, **kwargs):
+        """
+        serve the catalog from the cache, it is the same for every user,
+        with the live seat counters
+        """
+        self.catalog_built = False
+        data, pack_ids = catalog_cache.get_or_set(
+            # the pagination links are absolute urls, key on the host too
+            request.build_absolute_uri(),
+            self.build_catalog_data,
+        )
+        if not self.catalog_built:
+            # the counters may have changed since the page was cached
+            overlay_seats(data['results'], pack_ids)
+        return data
+
+    def build_catalog_data(self):
+        """the catalog page to cache and the ids of its packs"""
+        self.catalog_built = True
+        data = self.list_page().data
+        return data, [pack['id'] if isinstance(pack, dict) else pack.pk
+                      for pack in self.paginator.page]
+
+    def list_page(self):
+        """
+        the paginated response of the catalog, not cached, with the facet
+        counts when the `facets` query parameter is set
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(self.serialize_packs(page))
+        if self.request.query_params.get('facets') in ('1', 'true'):
+            response.data['facets'] = pack_facets(self.get_catalog_queryset)
+        return response
+
+
+class CreateBookingView(generics.CreateAPIView):
+    """Book a pack for the authenticated user"""
+    serializer_class = BookingSerializer
+
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+
+class MyBookingList(ReplicaReadMixin, generics.ListAPIView):
+    """
+    List the bookings of the authenticated user, newest first, with the
+    totals of all of them: count, amount paid and outstanding
+    """
+    serializer_class = MyBookingSerializer
+    pagination_class = BookingCursorPagination
+
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_bookings(self):
+        return Booking.objects.filter(users=self.request.user)
+
+    def get_queryset(self):
+        """the pack and its event dates come with the bookings, one query"""
+        return self.get_bookings().select_related('packs')
+
+    def get_totals(self):
+        """the totals of every booking of the user, one query"""
+        totals = self.get_bookings().aggregate(
+            count=Count('pk'),
+            paid=Coalesce(Sum('amount', filter=Q(payed=True)), Decimal(0)),
+            outstanding=Coalesce(Sum('amount', filter=Q(payed=False)),
+                                 Decimal(0)),
+        )
+        amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+        return {
+            'count': totals['count'],
+            'paid': amount.to_representation(totals['paid']),
+            'outstanding': amount.to_representation(totals['outstanding']),
+        }
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        response.data['totals'] = self.get_totals()
+        return response
+
+
+class CatalogSearchView(ReplicaReadMixin, APIView):
+    """
+    Search the catalog with the `q` query parameter, returns the events
+    and the packs matching every word, best match first. The words are
+    looked up in the events, their artists and their city.
+    """
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request):
+        terms = search_terms(request.query_params.get('q', ''))
+        if not terms:
+            msg = _('enter the words to search')
+            raise serializers.ValidationError({'q': msg}, code='required')
+        limit = self._get_limit()
+        # the results are the same for every user, cached as the catalog
+        data = catalog_cache.get_or_set(
+            request.build_absolute_uri(),
+            lambda: self.search(terms, limit),
+        )
+        overlay_seats(data['packs'], [pack['id'] for pack in data['packs']])
+        overlay_event_seats(data['events'])
+        return Response(data)
+
+    def _get_limit(self):
+        value = self.request.query_params.get('limit')
+        if not value:
+            return self.default_limit
+        try:
+            limit = int(value)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            msg = _('limit must be a positive integer')
+            raise serializers.ValidationError({'limit': msg}, code='invalid')
+        return min(limit, self.max_limit)
+
+    def search(self, terms, limit):
+        """the ranked events and packs with their events and artists"""
+        event_ids = search_events(terms, limit)
+        events = Event.objects.filter(pk__in=event_ids).prefetch_related(
+            Prefetch('artist',
+                     queryset=Artist.objects.order_by(*ARTIST_ORDERING))
+        )
+        pack_ids = search_packs(terms, limit)
+        packs = project_packs(Pack.objects.filter(pk__in=pack_ids))
+        return {
+            'packs': render_packs(
+                sorted(packs, key=lambda pack: pack_ids.index(pack['id'])),
+                SearchPackSerializer(),
+            ),
+            'events': SearchEventSerializer(
+                sorted(events, key=lambda event: event_ids.index(event.pk)),
+                many=True,
+            ).data,
+        }
+
+
+class SalesReportView(ReplicaReadMixin, DateParamMixin, APIView):
+    """
+    Sales grouped by `group` (day, month, pack or event, the share of the
+    event in the sales of its packs) between the `from` and `to` booking
+    dates, for the staff. Read from the daily rollups, the bookings are
+    never scanned.
+    """
+    authentication_classes = (CachedTokenAuthentication,
+                              authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        group = request.query_params.get('group', 'month')
+        if group not in GROUPS:
+            msg = _('must be one of: %s') % ', '.join(GROUPS)
+            raise serializers.ValidationError({'group': msg},
+                                              code='invalid')
+        return Response(sales_report(group, self._get_date_param('from'),
+                                     self._get_date_param('to')))
+
+
+class CatalogCacheStatsView(APIView):
+    """hit/miss counters of the catalog cache, for monitoring"""
+    authentication_classes = (CachedTokenAuthentication,
+                              authentication.SessionAuthentication)
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return Response(catalog_cache.stats())
+
+
+# async read path for ASGI, the request runs in a worker thread where a
+# catalog poll is answered from the caches (and the seat counters) and
+# anything else runs the sync view. The cache lookups can block on a network
+# cache, so none of them runs on the event loop.
+
+booking_pack_list = BookingPackList.as_view()
+
+
+class _NotCached(Exception):
+    pass
+
+
+def _catalog_from_cache(request):
+    """
+    the response to a catalog request served from the caches, only the
+    seat counters are read from the database, None if the sync view has
+    to run
+    """
+    if request.method not in ('GET', 'HEAD') or 'stream' in request.GET or \
+            'format' in request.GET:
+        return None
+    accept = request.META.get('HTTP_ACCEPT', '*/*')
+    if 'text/html' in accept or \
+            ('application/json' not in accept and '*/*' not in accept):
+        # the browsable api or some other format
+        return None
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != b'token':
+        return None
+    token = token_cache.get(auth[1].decode('latin-1'), shared=False)
+    if token is None:
+        return None
+
+    variant = request.build_absolute_uri()
+
+    def build():
+        entry = catalog_cache.get(variant)
+        if entry is None:
+            raise _NotCached
+        data, pack_ids = entry
+        overlay_seats(data['results'], pack_ids)
+        return HttpResponse(JSONRenderer().render(data),
+                            content_type='application/json')
+
+    try:
+        response = conditional_response(
+            request, make_etag(catalog_etag_source(request), 'json'),
+            catalog_cache.get_last_modified(), build,
+        )
+    except _NotCached:
+        return None
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def _catalog_response(request):
+    response = _catalog_from_cache(request)
+    if response is None:
+        response = booking_pack_list(request)
+    return response
+
+
+async def booking_pack_list_async(request):
+    """List the packs in the catalog, async version of BookingPackList"""
+    # one thread hop for the cache lookups and the view together
+    return await run_sync_view(_catalog_response, request)
@@ -3,13 +3,18 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext as _
 from core import models
+from core.routers import ReplicaChangeListMixin
+
+
+class ReplicaModelAdmin(ReplicaChangeListMixin, admin.ModelAdmin):
+    """changelists read from the database replicas"""
 
 
 class UserDetailsAdminStacked(admin.StackedInline):
     model = models.UserDetails
 
 
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(ReplicaChangeListMixin, BaseUserAdmin):
     ordering = ['id']
     list_display = ['email']
     inlines = [UserDetailsAdminStacked]
@@ -36,7 +41,7 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
-class UserDetailsAdmin(admin.ModelAdmin):
+class UserDetailsAdmin(ReplicaModelAdmin):
 
     ordering = ['name', 'surname']
     list_display = ['name', 'surname', 'get_email', 'tel']
@@ -44,16 +49,31 @@ class UserDetailsAdmin(admin.ModelAdmin):
         return obj.user.email
 
 
-class EventAdmin(admin.ModelAdmin):
+class EventAdmin(ReplicaModelAdmin):
     ordering = ['date']
     list_display = ['name', 'date', 'location']
 
 
-class PackAdmin(admin.ModelAdmin):
-    # ordering = ['date']
-    list_display = ['name', 'price', 'starting_date']
-    # def starting_date(self, obj):
-    #     return max([event.date for event in obj.events.all()])
+class PackAdmin(ReplicaModelAdmin):
+    list_display = ['name', 'price', 'final_price', 'starting_date',
+                    'ending_date', 'events_count']
+    readonly_fields = ['final_price']
+
+    def get_queryset(self, request):
+        """count the events in the query of the whole changelist"""
+        return super().get_queryset(request).with_events_count()
+
+    @admin.display(ordering='first_event_date')
+    def starting_date(self, obj):
+        return obj.first_event_date
+
+    @admin.display(ordering='last_event_date')
+    def ending_date(self, obj):
+        return obj.last_event_date
+
+    @admin.display(ordering='events_count')
+    def events_count(self, obj):
+        return obj.events_count
 
 
 # @admin.register(models.User, models.UserDetails)
@@ -62,7 +82,7 @@ class PackAdmin(admin.ModelAdmin):
 
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.UserDetails, UserDetailsAdmin)
-admin.site.register(models.Artist)
-admin.site.register(models.Location)
+admin.site.register(models.Artist, ReplicaModelAdmin)
+admin.site.register(models.Location, ReplicaModelAdmin)
 admin.site.register(models.Event, EventAdmin)
 admin.site.register(models.Pack, PackAdmin)
@@ -1,6 +1,51 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models import signals
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+        from core.authentication import invalidate_token, \
+                                        invalidate_user_tokens
+        from core.middleware import install_query_counter
+        from core.models import User, Booking, Pack, Discount, Event
+        from core.signals import release_seats, update_pack_prices, \
+                                 discount_changed, discount_deleting, \
+                                 discount_deleted, booking_saving, \
+                                 booking_saved, booking_deleted, \
+                                 update_pack_dates, event_changed, \
+                                 event_deleting, event_deleted
+
+        # cached tokens are dropped as soon as the token or its user change
+        signals.post_save.connect(invalidate_token, sender=Token)
+        signals.post_delete.connect(invalidate_token, sender=Token)
+        signals.post_save.connect(invalidate_user_tokens, sender=User)
+        signals.post_delete.connect(invalidate_user_tokens, sender=User)
+
+        # deleting a booking cancels it and frees its seats
+        signals.post_delete.connect(release_seats, sender=Booking)
+        # the daily sales rollups follow the bookings
+        signals.pre_save.connect(booking_saving, sender=Booking)
+        signals.post_save.connect(booking_saved, sender=Booking)
+        signals.post_delete.connect(booking_deleted, sender=Booking)
+
+        # the final price of the packs follows their discounts
+        signals.m2m_changed.connect(update_pack_prices,
+                                    sender=Pack.discounts.through)
+        signals.post_save.connect(discount_changed, sender=Discount)
+        signals.pre_delete.connect(discount_deleting, sender=Discount)
+        signals.post_delete.connect(discount_deleted, sender=Discount)
+
+        # the first/last event dates of the packs follow their events
+        signals.m2m_changed.connect(update_pack_dates,
+                                    sender=Pack.events.through)
+        signals.post_save.connect(event_changed, sender=Event)
+        signals.pre_delete.connect(event_deleting, sender=Event)
+        signals.post_delete.connect(event_deleted, sender=Event)
+
+        # queries of every connection can be counted per request
+        connection_created.connect(install_query_counter)
@@ -0,0 +1,45 @@
+# core/async_utils.py
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+
+def database_sync_to_async(func, executor=None):
+    """
+    sync_to_async for database work that may run in parallel with the
+    work of other requests.
+
+    The ORM of this django version is sync only and thread sensitive
+    sync_to_async would queue every query of every request on one thread.
+    These calls run in executor (the default executor if None) instead, so
+    many requests can have their queries in flight together. The
+    connections of the worker threads are not closed by the request cycle,
+    they are checked before and after each call like the request cycle
+    does.
+    """
+    @wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False, executor=executor)
+
+
+def _render_view(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    if hasattr(response, 'render'):
+        # DRF responses are rendered lazily, render them in the worker
+        # too instead of on the thread of the sync views
+        response.render()
+    return response
+
+
+async def run_sync_view(view, request, *args, executor=None, **kwargs):
+    """run a sync view (e.g. a DRF one) with database_sync_to_async"""
+    return await database_sync_to_async(_render_view, executor)(
+        view, request, *args, **kwargs
+    )
@@ -0,0 +1,232 @@
+# core/authentication.py
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+CACHE_KEY_PREFIX = 'core:auth-token:'
+GENERATION_KEY_PREFIX = 'core:auth-token-generation:'
+INVALIDATIONS_KEY = 'core:auth-token-invalidations'
+
+
+class TokenCache:
+    """
+    Cache of token key -> token (with its user) for the authentication.
+
+    Tokens are kept in a bounded in-process LRU with a time to live and,
+    when TOKEN_AUTH_CACHE names a cache alias, also in the django cache so
+    the processes can share the lookups. Entries are stored pickled, every
+    request gets its own copy of the user.
+
+    With a shared cache the entries of a user are only trusted while the
+    generation of the user in the shared cache is the one they were stored
+    with. Invalidations bump it, so the other processes stop accepting the
+    token at once instead of after the time to live. Without one the other
+    processes never hear of the invalidations and the entries live for
+    TOKEN_AUTH_CACHE_LOCAL_TTL seconds at most.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._user_keys = {}
+        self._invalidations = 0
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'TOKEN_AUTH_CACHE_SIZE', 10000)
+
+    @property
+    def ttl(self):
+        ttl = getattr(settings, 'TOKEN_AUTH_CACHE_TTL', 60)
+        if self.shared is None:
+            ttl = min(ttl, getattr(settings, 'TOKEN_AUTH_CACHE_LOCAL_TTL', 2))
+        return ttl
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'TOKEN_AUTH_CACHE', None)
+        return caches[alias] if alias else None
+
+    def get(self, key, shared=True):
+        """
+        return the cached token or None, with shared=False the tokens of
+        the shared cache are not looked up (the generations still are)
+        """
+        cache = self.shared
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                entry = None
+        if entry is not None:
+            if cache is None or entry[3] is not None and \
+                    cache.get(self._generation_key(entry[2])) == entry[3]:
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                return pickle.loads(entry[1])
+            with self._lock:
+                self._remove(key)
+
+        if cache is not None and shared:
+            entry = cache.get(CACHE_KEY_PREFIX + key)
+            if entry is not None:
+                user_id, generation, data = entry
+                if cache.get(self._generation_key(user_id)) == generation:
+                    self._store(key, user_id, data, generation)
+                    return pickle.loads(data)
+        return None
+
+    def stamp(self):
+        """
+        the invalidations seen so far, taken before reading a token from
+        the database so set() can tell it was invalidated in between
+        """
+        shared = self.shared
+        return (self._invalidations,
+                self._counter(shared, INVALIDATIONS_KEY)
+                if shared is not None else None)
+
+    def set(self, token, stamp=None):
+        """
+        cache the token, unless an invalidation happened since stamp (see
+        stamp()), the token read could be the one invalidated
+        """
+        data = pickle.dumps(token)
+        shared = self.shared
+        generation = None
+        if shared is not None:
+            # the generation first: an invalidation bumping it after the
+            # check below leaves the entry with the previous generation
+            generation = self._generation(shared, token.user_id)
+            if stamp is not None and \
+                    self._counter(shared, INVALIDATIONS_KEY) != stamp[1]:
+                return
+            shared.set(CACHE_KEY_PREFIX + token.key,
+                       (token.user_id, generation, data), self.ttl)
+        self._store(token.key, token.user_id, data, generation,
+                    stamp[0] if stamp is not None else None)
+
+    def invalidate(self, key, user_id=None):
+        """forget the token, in every process when the user is given"""
+        with self._lock:
+            self._invalidations += 1
+            entry = self._entries.get(key)
+            self._remove(key)
+        if user_id is None and entry is not None:
+            user_id = entry[2]
+        shared = self.shared
+        if shared is not None:
+            self._bump(shared, INVALIDATIONS_KEY)
+            shared.delete(CACHE_KEY_PREFIX + key)
+            if user_id is not None:
+                self._bump(shared, self._generation_key(user_id))
+
+    def invalidate_user(self, user_id):
+        """forget every token of the user"""
+        with self._lock:
+            self._invalidations += 1
+            keys = set(self._user_keys.get(user_id, ()))
+            for key in keys:
+                self._remove(key)
+        shared = self.shared
+        if shared is not None:
+            self._bump(shared, INVALIDATIONS_KEY)
+            self._bump(shared, self._generation_key(user_id))
+            # the shared entries could be stored by another process only
+            keys.update(Token.objects.filter(user_id=user_id)
+                                     .values_list('key', flat=True))
+            shared.delete_many([CACHE_KEY_PREFIX + key for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+
+    def _generation_key(self, user_id):
+        return GENERATION_KEY_PREFIX + str(user_id)
+
+    def _generation(self, cache, user_id):
+        """the generation of the user in the shared cache, set if missing"""
+        return self._counter(cache, self._generation_key(user_id))
+
+    def _counter(self, cache, key):
+        """the counter at key in the shared cache, set if missing"""
+        value = cache.get(key)
+        if value is None:
+            # a new value each time, an evicted counter never matches the
+            # values read before
+            cache.add(key, time.time_ns(), None)
+            value = cache.get(key)
+        return value
+
+    def _bump(self, cache, key):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+    def _store(self, key, user_id, data, generation=None, invalidations=None):
+        with self._lock:
+            if invalidations is not None and \
+                    invalidations != self._invalidations:
+                # invalidated while the token was read
+                return
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, data, user_id,
+                                  generation)
+            self._user_keys.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._user_keys.get(entry[2])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._user_keys[entry[2]]
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication resolving the tokens through token_cache, the
+    database is queried only on a cache miss
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            stamp = token_cache.stamp()
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(token, stamp)
+        return token.user, token
+
+
+def invalidate_token(instance, using=None, **kwargs):
+    """signal receiver for Token changes"""
+    key, user_id = instance.key, instance.user_id
+    # now and again once the transaction is committed, a lookup in between
+    # could have read the previous row
+    token_cache.invalidate(key, user_id)
+    transaction.on_commit(lambda: token_cache.invalidate(key, user_id),
+                          using=using)
+
+
+def invalidate_user_tokens(instance, using=None, **kwargs):
+    """signal receiver for User changes, e.g. deactivation"""
+    user_id = instance.pk
+    token_cache.invalidate_user(user_id)
+    transaction.on_commit(lambda: token_cache.invalidate_user(user_id),
+                          using=using)
@@ -0,0 +1,18 @@
+# core/db/bulk.py
+# bulk inserts returning the rows with their primary keys
+
+
+def bulk_create(model, objs, batch_size=None):
+    """
+    bulk create the rows and return them with their primary keys, in the
+    order of objs
+
+    sqlite does not return the ids of bulk inserts, they are read back as
+    the last rows of the table: call it in a transaction holding the write
+    lock (or on a database nobody else writes to) so they are the rows
+    just created
+    """
+    model.objects.bulk_create(objs, batch_size=batch_size)
+    if objs and objs[0].pk is None:
+        objs = list(model.objects.order_by('-pk')[:len(objs)])[::-1]
+    return objs
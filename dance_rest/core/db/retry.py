@@ -0,0 +1,42 @@
+# core/db/retry.py
+import functools
+import random
+import time
+
+from django.db import OperationalError, connections
+
+
+def is_lock_error(error):
+    """whether the error is sqlite giving up waiting for a lock"""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def retry_on_lock(func=None, attempts=5, backoff=0.05, max_backoff=1.0):
+    """
+    Decorator retrying func when the database is locked, waiting backoff
+    seconds, doubled at every attempt (with some jitter) up to max_backoff.
+
+    func must be safe to run again, e.g. a write in its own atomic block.
+    Inside an atomic block nothing is retried: the outer transaction is
+    broken by the error and only its owner can roll it back.
+    """
+    if func is None:
+        return functools.partial(retry_on_lock, attempts=attempts,
+                                 backoff=backoff, max_backoff=max_backoff)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        delay = backoff
+        for attempt in range(1, attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == attempts or not is_lock_error(e) or \
+                        any(conn.in_atomic_block
+                            for conn in connections.all()):
+                    raise
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, max_backoff)
+
+    return wrapper
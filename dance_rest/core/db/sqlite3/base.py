@@ -0,0 +1,53 @@
+# core/db/sqlite3/base.py
+# sqlite backend tuned for concurrent requests, ENGINE 'core.db.sqlite3'
+
+from django.db.backends.sqlite3 import base
+
+# applied to every new connection, OPTIONS['pragmas'] overrides them
+DEFAULT_PRAGMAS = {
+    # milliseconds waited for a lock before "database is locked", first so
+    # it applies to the pragmas below too
+    'busy_timeout': 5000,
+    # readers see the last committed data while a writer is busy, instead
+    # of waiting for it
+    'journal_mode': 'WAL',
+    # safe with WAL, the commits do not wait for the disk
+    'synchronous': 'NORMAL',
+    # negative is KiB, 20 MB of page cache per connection
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The django sqlite backend with two more OPTIONS:
+
+    pragmas -- name -> value set on every new connection, merged with
+        DEFAULT_PRAGMAS (a None value skips a default)
+    transaction_mode -- 'DEFERRED' (the sqlite default), 'IMMEDIATE' or
+        'EXCLUSIVE', how the atomic blocks begin their transaction.
+        IMMEDIATE takes the write lock at the start, so a transaction that
+        reads then writes waits busy_timeout for the lock instead of
+        failing at once when another writer got in between.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # not arguments of sqlite3.connect
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**DEFAULT_PRAGMAS,
+                   **self.settings_dict['OPTIONS'].get('pragmas', {})}
+        for name, value in pragmas.items():
+            if value is not None:
+                conn.execute('PRAGMA %s = %s' % (name, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute('BEGIN %s' % mode if mode else 'BEGIN')
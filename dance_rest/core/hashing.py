@@ -0,0 +1,39 @@
+# core/hashing.py
+# password hashing off the event loop, for the async views
+#
+# PBKDF2 keeps a cpu busy for hundreds of milliseconds, run in the event
+# loop it would stall every other request and run through sync_to_async it
+# would queue behind the other sync code. hashlib releases the GIL while
+# hashing so a small pool of threads hashes in parallel, the views that
+# hash (signup, login) run there whole so they validate and save exactly
+# as their sync version.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from core.async_utils import run_sync_view
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    """the bounded pool shared by every hashing call"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', None)
+            _executor = ThreadPoolExecutor(
+                max_workers=workers or os.cpu_count() or 1,
+                thread_name_prefix='password-hashing',
+            )
+        return _executor
+
+
+async def run_hashing_view(view, request, *args, **kwargs):
+    """run a sync view hashing passwords in the bounded pool"""
+    return await run_sync_view(view, request, *args,
+                               executor=get_executor(), **kwargs)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from booking.cache import invalidate_catalog
+from core.models import Pack
+
+
+class Command(BaseCommand):
+    help = ('Recompute the final price of the packs from their price and '
+            'discounts and repair the ones that are stale')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='only report the final prices that are stale',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = Pack.objects.all().update_final_prices()
+            if options['dry_run']:
+                # same queries, nothing is written
+                transaction.set_rollback(True)
+            elif count:
+                invalidate_catalog()
+        self.stdout.write('packs: %d final prices %s' % (
+            count, 'stale' if options['dry_run'] else 'repaired',
+        ))
@@ -0,0 +1,222 @@
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.db.bulk import bulk_create
+from core.models import User, UserDetails
+
+DETAILS_FIELDS = ['name', 'surname', 'address', 'city', 'country', 'tel',
+                  'privacy', 'marketing']
+BOOLEAN_FIELDS = {'privacy', 'marketing'}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+def init_worker():
+    """set up django in the hashing processes started with spawn"""
+    if not apps.ready:
+        django.setup()
+
+
+def read_rows(stream, format):
+    """yield the rows of a csv (with header) or json lines file"""
+    if format == 'csv':
+        yield from csv.DictReader(stream)
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def clean_details(row):
+    """the user details of the row, None if it has none"""
+    details = {}
+    for field in DETAILS_FIELDS:
+        value = row.get(field)
+        if value is None or value == '':
+            continue
+        if field in BOOLEAN_FIELDS and not isinstance(value, bool):
+            value = str(value).strip().lower() in TRUE_VALUES
+        details[field] = value
+    return details or None
+
+
+class Command(BaseCommand):
+    help = ('Import users and their details from a csv or json lines file, '
+            'in batches with the passwords hashed by a pool of processes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="file to import, '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='hashing processes, default cpu count')
+        parser.add_argument(
+            '--unusable-passwords', action='store_true',
+            help='ignore the passwords and mark them unusable, for users '
+                 'that will be invited to set one',
+        )
+        parser.add_argument(
+            '--update', action='store_true',
+            help='update the users already registered with the same email '
+                 'instead of skipping them',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format']
+        if format is None:
+            if path.endswith('.csv'):
+                format = 'csv'
+            elif path.endswith(('.jsonl', '.json')):
+                format = 'jsonl'
+            else:
+                raise CommandError('can not guess the format, use --format')
+
+        self.options = options
+        self.counts = {'read': 0, 'created': 0, 'updated': 0, 'skipped': 0,
+                       'invalid': 0}
+        start = time.perf_counter()
+
+        stream = sys.stdin if path == '-' else open(path, newline='',
+                                                    encoding='utf-8')
+        pool = None if options['unusable_passwords'] else \
+            ProcessPoolExecutor(options['workers'], initializer=init_worker)
+        try:
+            for batch in batches(read_rows(stream, format),
+                                 options['batch_size']):
+                self.import_batch(batch, pool)
+                elapsed = time.perf_counter() - start
+                self.stdout.write('%d rows, %.0f rows/s' % (
+                    self.counts['read'], self.counts['read'] / elapsed))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            '%(read)d rows read: %(created)d created, %(updated)d updated, '
+            '%(skipped)d skipped, %(invalid)d invalid' % self.counts
+            + ' in %.1fs (%.0f rows/s)' % (
+                elapsed, self.counts['read'] / elapsed if elapsed else 0)
+        ))
+
+    def import_batch(self, rows, pool):
+        self.counts['read'] += len(rows)
+
+        # one row per email, the last one wins
+        by_email = {}
+        for row in rows:
+            email = User.objects.normalize_email((row.get('email') or '')
+                                                 .strip())
+            if not email:
+                self.counts['invalid'] += 1
+                self.stderr.write('row without email: %r' % (row,))
+                continue
+            if email in by_email:
+                self.counts['skipped'] += 1
+            by_email[email] = row
+
+        existing = dict(User.objects.filter(email__in=list(by_email))
+                                    .values_list('email', 'pk'))
+        new = [email for email in by_email if email not in existing]
+        if self.options['update']:
+            updated = [email for email in by_email if email in existing]
+        else:
+            updated = []
+            self.counts['skipped'] += len(existing)
+
+        # the passwords of the updated users change only when given
+        rehashed = [email for email in updated
+                    if by_email[email].get('password')] \
+            if pool is not None else []
+        passwords = dict(zip(new + rehashed, self.hash_passwords(
+            [by_email[email].get('password') or None
+             for email in new + rehashed],
+            pool,
+        )))
+
+        with transaction.atomic():
+            users = bulk_create(
+                User,
+                [User(email=email, password=passwords[email])
+                 for email in new],
+                self.options['batch_size'],
+            )
+            UserDetails.objects.bulk_create(
+                [UserDetails(user_id=user.pk, **details)
+                 for user in users
+                 for details in [clean_details(by_email[user.email])]
+                 if details is not None],
+                batch_size=self.options['batch_size'],
+            )
+            if updated:
+                self.update_users(updated, existing, by_email, passwords)
+
+        self.counts['created'] += len(new)
+        self.counts['updated'] += len(updated)
+
+    def hash_passwords(self, passwords, pool):
+        """hash the passwords of the batch across the process pool"""
+        if pool is None:
+            # make_password(None) is an unusable password, no hashing
+            return [make_password(None) for password in passwords]
+        workers = self.options['workers'] or os.cpu_count() or 1
+        chunksize = max(len(passwords) // (workers * 4), 1)
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+    def update_users(self, emails, existing, by_email, passwords):
+        now = timezone.now()
+        users = [User(pk=existing[email], email=email,
+                      password=passwords[email], date_modified=now)
+                 for email in emails if email in passwords]
+        User.objects.bulk_update(users, ['password', 'date_modified'],
+                                 batch_size=self.options['batch_size'])
+
+        details = {existing[email]: clean_details(by_email[email])
+                   for email in emails}
+        details = {pk: fields for pk, fields in details.items()
+                   if fields is not None}
+        current = UserDetails.objects.in_bulk(list(details))
+        to_create, to_update, fields = [], [], {'date_modified'}
+        for pk, values in details.items():
+            obj = current.get(pk) or UserDetails(user_id=pk)
+            for field, value in values.items():
+                setattr(obj, field, value)
+            fields.update(values)
+            if pk in current:
+                obj.date_modified = now
+                to_update.append(obj)
+            else:
+                to_create.append(obj)
+        UserDetails.objects.bulk_create(
+            to_create, batch_size=self.options['batch_size']
+        )
+        if to_update:
+            UserDetails.objects.bulk_update(
+                to_update, list(fields),
+                batch_size=self.options['batch_size'],
+            )
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import DailyEventSales, DailySales
+
+
+class Command(BaseCommand):
+    help = ('Recompute the daily sales rollups of the reports from the '
+            'bookings, in a single transaction')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transaction.atomic():
+            count = DailySales.objects.rebuild()
+            events = DailyEventSales.objects.rebuild()
+        self.stdout.write('%d daily sales rows rebuilt (%d event rows) in '
+                          '%.2fs' % (count, events,
+                                     time.perf_counter() - start))
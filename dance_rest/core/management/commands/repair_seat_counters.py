@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from booking.cache import invalidate_seats
+from core.models import Booking, Event, Pack
+
+
+def booking_count(**lookup):
+    """subquery counting the bookings matching lookup (an OuterRef)"""
+    field, ref = next(iter(lookup.items()))
+    return Coalesce(
+        Subquery(
+            Booking.objects.filter(**lookup)
+                           .order_by()
+                           .values(field)
+                           .annotate(total=Count('pk'))
+                           .values('total')
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = ('Recompute the booked_count counters of packs and events from '
+            'the bookings and repair the ones that drifted')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='only report the counters that drifted',
+        )
+
+    def handle(self, *args, **options):
+        targets = (
+            (Pack, booking_count(packs=OuterRef('pk'))),
+            (Event, booking_count(packs__events=OuterRef('pk'))),
+        )
+        with transaction.atomic():
+            for model, actual in targets:
+                # one statement per model, whatever the number of rows
+                drifted = model.objects.exclude(booked_count=actual)
+                count = drifted.count()
+                if count and not options['dry_run']:
+                    drifted.update(booked_count=actual)
+                    invalidate_seats()
+                self.stdout.write('%s: %d counters %s' % (
+                    model._meta.verbose_name_plural, count,
+                    'drifted' if options['dry_run'] else 'repaired',
+                ))
@@ -0,0 +1,216 @@
+# core/middleware.py
+import asyncio
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from core.routers import db_writes, get_replicas, pin_user
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """raised when a view runs more queries than its budget allows"""
+
+
+class QueryStats:
+    """queries and time of the requests, aggregated per view name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view_name, queries, db_time, total_time):
+        with self._lock:
+            stats = self._views.setdefault(view_name, {
+                'requests': 0, 'queries': 0, 'db_time': 0.0,
+                'total_time': 0.0, 'max_queries': 0, 'max_total_time': 0.0,
+            })
+            stats['requests'] += 1
+            stats['queries'] += queries
+            stats['db_time'] += db_time
+            stats['total_time'] += total_time
+            stats['max_queries'] = max(stats['max_queries'], queries)
+            stats['max_total_time'] = max(stats['max_total_time'],
+                                          total_time)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._views.items()}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+query_stats = QueryStats()
+
+
+class QueryCounter:
+    """database execute wrapper counting the queries and their time"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+# counter of the request being instrumented, a context variable follows the
+# request into the threads running its queries under ASGI too
+current_counter = ContextVar('current_counter', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """execute wrapper installed on every connection"""
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    """connection_created receiver installing count_queries"""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record query count, database time and total time of every request per
+    resolved view name, enabled by the QUERY_INSTRUMENTATION setting.
+
+    In DEBUG the numbers are added to the response headers, requests over
+    QUERY_INSTRUMENTATION_SLOW_MS or QUERY_INSTRUMENTATION_MAX_QUERIES are
+    logged as warnings and QUERY_BUDGETS ({view name: max queries}) makes
+    a request over its budget raise QueryBudgetExceeded, for the tests.
+    Queries run while a streaming response is consumed are not counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # keep async views async under ASGI
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.process(request, response, counter,
+                            time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            return await self.get_response(request)
+
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        return self.process(request, response, counter,
+                            time.perf_counter() - start)
+
+    def process(self, request, response, counter, total_time):
+        """record the numbers, add the headers and check the budget"""
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        query_stats.record(view_name, counter.queries, counter.db_time,
+                           total_time)
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(counter.queries)
+            response['X-DB-Time-ms'] = '%.1f' % (counter.db_time * 1000)
+            response['X-Total-Time-ms'] = '%.1f' % (total_time * 1000)
+
+        slow_ms = getattr(settings, 'QUERY_INSTRUMENTATION_SLOW_MS', None)
+        max_queries = getattr(settings, 'QUERY_INSTRUMENTATION_MAX_QUERIES',
+                              None)
+        if (slow_ms is not None and total_time * 1000 > slow_ms) or \
+                (max_queries is not None and counter.queries > max_queries):
+            logger.warning(
+                '%s %s (%s): %d queries, %.1f ms db, %.1f ms total',
+                request.method, request.path, view_name, counter.queries,
+                counter.db_time * 1000, total_time * 1000,
+            )
+
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view_name)
+        if budget is not None and counter.queries > budget:
+            raise QueryBudgetExceeded(
+                '%s ran %d queries, its budget is %d'
+                % (view_name, counter.queries, budget)
+            )
+        return response
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pin to the primary database the authenticated users whose request
+    wrote to it, so their next reads do not go to a replica lagging behind
+    (see core.routers).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not get_replicas():
+            return self.get_response(request)
+
+        writes = set()
+        token = db_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            db_writes.reset(token)
+        self.process(request, writes)
+        return response
+
+    async def __acall__(self, request):
+        if not get_replicas():
+            return await self.get_response(request)
+
+        writes = set()
+        token = db_writes.set(writes)
+        try:
+            response = await self.get_response(request)
+        finally:
+            db_writes.reset(token)
+        self.process(request, writes)
+        return response
+
+    def process(self, request, writes):
+        user = getattr(request, 'user', None)
+        if writes and user is not None and user.is_authenticated:
+            pin_user(user)
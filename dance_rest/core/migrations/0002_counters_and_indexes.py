@@ -0,0 +1,84 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_seats(apps, schema_editor):
+    """the counters of the existing bookings, as repair_seat_counters"""
+    Booking = apps.get_model('core', 'Booking')
+    using = schema_editor.connection.alias
+
+    def booking_count(field):
+        return Coalesce(Subquery(
+            Booking.objects.using(using).filter(**{field: OuterRef('pk')})
+                           .order_by().values(field)
+                           .annotate(total=Count('pk')).values('total')
+        ), 0)
+
+    for model, field in (('Pack', 'packs'), ('Event', 'packs__events')):
+        apps.get_model('core', model).objects.using(using).update(
+            booked_count=booking_count(field)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='booked_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pack',
+            name='booked_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='pack',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='date_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='userdetails',
+            name='date_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='artist',
+            index=models.Index(fields=['style'], name='artist_style_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['users', 'date'], name='booking_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('payed', False)), fields=['date'], name='booking_unpaid_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['date'], name='event_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['city'], name='location_city_idx'),
+        ),
+        migrations.RunPython(count_seats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+
+def apply_discounts(price, discounts):
+    """core.models.apply_discounts as of this migration"""
+    price = Decimal(str(price))
+    for discount in discounts:
+        discount = min(max(Decimal(str(discount)), Decimal(0)), Decimal(100))
+        price = price * (100 - discount) / 100
+    return price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def fill_final_prices(apps, schema_editor):
+    """the final price of the existing packs, as backfill_final_prices"""
+    Pack = apps.get_model('core', 'Pack')
+    using = schema_editor.connection.alias
+    discounts = {}
+    for pack_id, discount in Pack.discounts.through.objects.using(using) \
+            .values_list('pack_id', 'discount__discount'):
+        discounts.setdefault(pack_id, []).append(discount)
+    packs = list(Pack.objects.using(using).only('id', 'price'))
+    for pack in packs:
+        pack.final_price = apply_discounts(pack.price,
+                                           discounts.get(pack.pk, []))
+    Pack.objects.using(using).bulk_update(packs, ['final_price'],
+                                          batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_counters_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pack',
+            name='final_price',
+            field=models.DecimalField(blank=True, decimal_places=2, default=0, editable=False, max_digits=6),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_final_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_pack_final_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['type'], name='event_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pack',
+            index=models.Index(fields=['final_price'], name='pack_final_price_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_amounts(apps, schema_editor):
+    """the bookings made so far are charged the final price of their pack"""
+    Booking = apps.get_model('core', 'Booking')
+    Pack = apps.get_model('core', 'Pack')
+    using = schema_editor.connection.alias
+    Booking.objects.using(using).update(amount=Subquery(
+        Pack.objects.filter(pk=OuterRef('packs')).values('final_price')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_catalog_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='amount',
+            field=models.DecimalField(blank=True, decimal_places=2, default=0, editable=False, max_digits=6),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_rollups(apps, schema_editor):
+    """the rollups of the bookings made so far, as DailySales.objects.rebuild"""
+    Booking = apps.get_model('core', 'Booking')
+    DailySales = apps.get_model('core', 'DailySales')
+    using = schema_editor.connection.alias
+    rows = Booking.objects.using(using).order_by().values(
+        'date', 'packs'
+    ).annotate(
+        total_bookings=Count('pk'),
+        total_amount=Sum('amount'),
+        total_paid_bookings=Count('pk', filter=Q(payed=True)),
+        total_paid_amount=Coalesce(Sum('amount', filter=Q(payed=True)),
+                                   Decimal(0)),
+    )
+    DailySales.objects.using(using).bulk_create([
+        DailySales(day=row['date'], pack_id=row['packs'],
+                   bookings=row['total_bookings'],
+                   amount=row['total_amount'],
+                   paid_bookings=row['total_paid_bookings'],
+                   paid_amount=row['total_paid_amount'])
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_booking_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid_bookings', models.PositiveIntegerField(default=0)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pack', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.pack')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailysales',
+            index=models.Index(fields=['pack', 'day'], name='daily_sales_pack_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(fields=('day', 'pack'), name='daily_sales_day_pack_uniq'),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+from django.db.models import Max, Min, OuterRef, Subquery
+
+
+def fill_event_dates(apps, schema_editor):
+    """the dates of the existing packs, as Pack.objects.update_event_dates"""
+    Event = apps.get_model('core', 'Event')
+    Pack = apps.get_model('core', 'Pack')
+    using = schema_editor.connection.alias
+    dates = Event.objects.using(using).filter(pack=OuterRef('pk')) \
+                                      .order_by().values('pack')
+    Pack.objects.using(using).update(
+        first_event_date=Subquery(
+            dates.annotate(first=Min('date')).values('first')),
+        last_event_date=Subquery(
+            dates.annotate(last=Max('date')).values('last')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_dailysales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pack',
+            name='first_event_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='pack',
+            name='last_event_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='pack',
+            index=models.Index(fields=['first_event_date', 'id'], name='pack_first_event_date_idx'),
+        ),
+        migrations.RunPython(fill_event_dates, migrations.RunPython.noop),
+    ]
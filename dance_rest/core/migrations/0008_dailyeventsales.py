@@ -0,0 +1,88 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def allocate_amount(amount, weights):
+    """core.models.allocate_amount as of this migration"""
+    weights = [Decimal(str(weight)) for weight in weights]
+    if not weights:
+        return []
+    total = sum(weights)
+    if not total:
+        weights, total = [Decimal(1)] * len(weights), Decimal(len(weights))
+    shares = [(amount * weight / total).quantize(Decimal('0.01'),
+                                                 rounding=ROUND_HALF_UP)
+              for weight in weights[:-1]]
+    return shares + [amount - sum(shares)]
+
+
+def fill_event_rollups(apps, schema_editor):
+    """
+    the event rollups of the bookings made so far, as
+    DailyEventSales.objects.rebuild
+    """
+    Booking = apps.get_model('core', 'Booking')
+    Pack = apps.get_model('core', 'Pack')
+    DailyEventSales = apps.get_model('core', 'DailyEventSales')
+    using = schema_editor.connection.alias
+    groups = Booking.objects.using(using).order_by().values(
+        'date', 'packs', 'amount', 'payed'
+    ).annotate(total_bookings=Count('pk'))
+    events = {}
+    for pack_id, event_id, price in Pack.events.through.objects \
+            .using(using).order_by('event') \
+            .values_list('pack', 'event', 'event__price'):
+        events.setdefault(pack_id, []).append((event_id, price))
+
+    rows = {}
+    for group in groups:
+        pack_events = events.get(group['packs'], [])
+        amounts = allocate_amount(group['amount'],
+                                  [price for pk, price in pack_events])
+        count = group['total_bookings']
+        for (event_id, price), amount in zip(pack_events, amounts):
+            row = rows.setdefault((group['date'], event_id), DailyEventSales(
+                day=group['date'], event_id=event_id, bookings=0, amount=0,
+                paid_bookings=0, paid_amount=0,
+            ))
+            row.bookings += count
+            row.amount += amount * count
+            if group['payed']:
+                row.paid_bookings += count
+                row.paid_amount += amount * count
+    DailyEventSales.objects.using(using).bulk_create(rows.values(),
+                                                     batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_pack_event_dates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyEventSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid_bookings', models.PositiveIntegerField(default=0)),
+                ('paid_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.event')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailyeventsales',
+            index=models.Index(fields=['event', 'day'], name='event_sales_event_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyeventsales',
+            constraint=models.UniqueConstraint(fields=('day', 'event'), name='event_sales_day_event_uniq'),
+        ),
+        migrations.RunPython(fill_event_rollups, migrations.RunPython.noop),
+    ]
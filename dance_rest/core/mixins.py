@@ -0,0 +1,67 @@
+# core/mixins.py
+import hashlib
+import math
+
+from django.utils.cache import get_conditional_response, \
+                               patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(source, format):
+    """strong etag of the data identified by source, rendered as format"""
+    # the same data renders differently for each format, a strong
+    # validator has to tell them apart
+    source = '%s:%s' % (source, format)
+    return quote_etag(hashlib.md5(source.encode('utf-8')).hexdigest())
+
+
+def conditional_response(request, etag, last_modified, build):
+    """
+    return 304 if the client copy is fresh, build() otherwise, with the
+    validators set on the response
+    """
+    if last_modified is not None:
+        # http dates have a resolution of one second, round up so a
+        # change in the same second as the previous one still counts
+        last_modified = math.ceil(last_modified)
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = build()
+
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # the data is per user, clients must revalidate before reusing it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer conditional GET requests (If-None-Match / If-Modified-Since)
+    with 304 before building the response.
+
+    Views implement get_etag_source() returning a string that changes
+    whenever the data changes, and can implement get_last_modified()
+    returning a unix timestamp (seconds, may be a float). Both are called
+    on every request so they must be cheap lookups, not a render of the
+    data.
+    """
+
+    def get_etag_source(self, request):
+        raise NotImplementedError
+
+    def get_last_modified(self, request):
+        return None
+
+    def get_etag(self, request):
+        return make_etag(self.get_etag_source(request),
+                         request.accepted_renderer.format)
+
+    def conditional_response(self, request, build):
+        """return 304 if the client copy is fresh, build() otherwise"""
+        return conditional_response(request, self.get_etag(request),
+                                    self.get_last_modified(request), build)
@@ -1,7 +1,12 @@
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from core.db.retry import retry_on_lock
 
 
 class UserManager(BaseUserManager):
@@ -35,6 +40,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(max_length=255, unique=True)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    date_modified = models.DateTimeField(auto_now=True)
 
     objects = UserManager()
 
@@ -57,6 +63,7 @@ class UserDetails(models.Model):
     tel = models.CharField(max_length=13, blank=False)
     privacy = models.BooleanField(default=False)
     marketing = models.BooleanField(default=False)
+    date_modified = models.DateTimeField(auto_now=True)
 
 
 class Location(models.Model):
@@ -66,6 +73,12 @@ class Location(models.Model):
     city = models.CharField(max_length=255, blank=False)
     room = models.CharField(max_length=255)
 
+    class Meta:
+        indexes = [
+            # admin and catalog filters by city
+            models.Index(fields=['city'], name='location_city_idx'),
+        ]
+
     def __str__(self):
 
         return self.name
@@ -79,6 +92,12 @@ class Artist(models.Model):
     description = models.TextField()
     country = models.CharField(max_length=50, blank=False)
 
+    class Meta:
+        indexes = [
+            # admin and catalog filters by style
+            models.Index(fields=['style'], name='artist_style_idx'),
+        ]
+
     def __str__(self):
 
         return self.name
@@ -94,16 +113,94 @@ class Event(models.Model):
     location = models.ForeignKey(Location, on_delete=models.CASCADE)
     artist = models.ManyToManyField(Artist)
     price = models.DecimalField(max_digits=6, decimal_places=2)
+    # seats available, null means no limit
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    booked_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # catalog date windows and admin ordering
+            models.Index(fields=['date'], name='event_date_idx'),
+            # catalog filter by event type
+            models.Index(fields=['type'], name='event_type_idx'),
+        ]
 
     def __str__(self):
 
         return self.name
 
+    @property
+    def remaining(self):
+        """seats left, None if there is no limit"""
+        if self.capacity is None:
+            return None
+        return max(self.capacity - self.booked_count, 0)
+
 class Discount(models.Model):
     """Model for discount apply to the package """
     name = models.CharField(max_length=255, blank=False)
     discount = models.DecimalField(max_digits=4, decimal_places=2)
 
+
+def apply_discounts(price, discounts):
+    """
+    price with the discounts (percentages) applied one after the other,
+    rounded to the cent
+    """
+    price = Decimal(str(price))
+    for discount in discounts:
+        discount = min(max(Decimal(str(discount)), Decimal(0)), Decimal(100))
+        price = price * (100 - discount) / 100
+    return price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+class PackQuerySet(models.QuerySet):
+
+    def with_events_count(self):
+        """annotate the number of events of the packs"""
+        return self.annotate(events_count=Count('events', distinct=True))
+
+    def update_event_dates(self):
+        """
+        recompute the first/last event date of the packs in bulk, a
+        single UPDATE whatever the number of packs
+        """
+        dates = Event.objects.filter(pack=OuterRef('pk')).order_by() \
+                             .values('pack')
+        return self.order_by().update(
+            first_event_date=Subquery(
+                dates.annotate(first=Min('date')).values('first')),
+            last_event_date=Subquery(
+                dates.annotate(last=Max('date')).values('last')),
+        )
+
+    def update_final_prices(self):
+        """
+        recompute the final price of the packs in bulk, three queries
+        whatever the number of packs, return the number of packs changed
+        """
+        packs = list(self.order_by().only('id', 'price', 'final_price'))
+        links = self.model.discounts.through.objects.using(self.db).filter(
+            pack__in=[pack.pk for pack in packs]
+        )
+        discounts = {}
+        for pack_id, discount in links.values_list('pack_id',
+                                                   'discount__discount'):
+            discounts.setdefault(pack_id, []).append(discount)
+
+        changed = []
+        for pack in packs:
+            final_price = apply_discounts(pack.price,
+                                          discounts.get(pack.pk, []))
+            if final_price != pack.final_price:
+                pack.final_price = final_price
+                changed.append(pack)
+        self.model.objects.db_manager(self.db).bulk_update(
+            changed, ['final_price'], batch_size=500
+        )
+        return len(changed)
+
+
 class Pack(models.Model):
     """Model for package, a package is a list of events for purchase """
     name = models.CharField(max_length=255, blank=False)
@@ -111,20 +208,400 @@ class Pack(models.Model):
     events = models.ManyToManyField(Event, blank=True, null=True)
     discounts = models.ManyToManyField(Discount, blank=True, null=True)
     price = models.DecimalField(max_digits=6, decimal_places=2)
+    # price with the discounts applied, kept up to date on save and by the
+    # signals of the discounts (core/signals.py)
+    final_price = models.DecimalField(max_digits=6, decimal_places=2,
+                                      editable=False, blank=True)
+    # dates of the first and last event, null without events, kept up to
+    # date on save and by the signals of the events (core/signals.py)
+    first_event_date = models.DateField(null=True, blank=True,
+                                        editable=False)
+    last_event_date = models.DateField(null=True, blank=True,
+                                       editable=False)
+    # seats available, null means no limit
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    booked_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PackQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # catalog price range filter
+            models.Index(fields=['final_price'], name='pack_final_price_idx'),
+            # catalog order and keyset pagination, (starting date, id)
+            models.Index(fields=['first_event_date', 'id'],
+                         name='pack_first_event_date_idx'),
+        ]
 
     def __str__(self):
 
         return self.name
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'price' in update_fields:
+            # a new pack has no discounts yet
+            discounts = self.discounts.values_list('discount', flat=True) \
+                if self.pk is not None else []
+            self.final_price = apply_discounts(self.price, discounts)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'final_price'}
+        if update_fields is None and self.pk is not None:
+            # the instance could predate a change of the events
+            dates = self.events.aggregate(first=Min('date'),
+                                          last=Max('date'))
+            self.first_event_date = dates['first']
+            self.last_event_date = dates['last']
+        super().save(*args, **kwargs)
+
     @property
     def starting_date(self):
 
-        return min([event.date for event in self.events.all()])
+        return self.first_event_date
+
+    @property
+    def ending_date(self):
+
+        return self.last_event_date
+
+    @property
+    def remaining(self):
+        """
+        seats left in the pack, limited by the seats left in its events
+        (use a prefetch of the events when listing packs), None if there
+        is no limit
+        """
+        seats = [self.capacity - self.booked_count] \
+            if self.capacity is not None else []
+        seats += [event.remaining for event in self.events.all()
+                  if event.capacity is not None]
+        return max(min(seats), 0) if seats else None
+
+
+class SoldOut(Exception):
+    """raised when a pack or one of its events has no seats left"""
+
+
+def has_seats():
+    """condition for rows with capacity left"""
+    return Q(capacity__isnull=True) | Q(booked_count__lt=F('capacity'))
+
+
+class BookingManager(models.Manager):
+
+    @retry_on_lock
+    def create_booking(self, user, pack):
+        """
+        Create the booking, reserving a seat in the pack and in each of its
+        events, raise SoldOut if any of them is full.
+        """
+        booking = self.model(users=user, packs=pack,
+                             amount=pack.final_price)
+        booking.save(using=self.db, check_seats=True)
+        return booking
+
+    def reserve_seats(self, pack, check=True):
+        """
+        Take a seat in the pack and in each of its events, with check
+        raise SoldOut if any of them is full.
+
+        The capacity check and the increment of the counter are a single
+        conditional UPDATE, so concurrent buyers can never both take the
+        last seat and no row is locked longer than its own update.
+        """
+        with transaction.atomic(using=self.db):
+            packs = Pack.objects.using(self.db).filter(pk=pack.pk)
+            reserved = (packs.filter(has_seats()) if check else packs) \
+                .update(booked_count=F('booked_count') + 1)
+            if check and not reserved:
+                raise SoldOut(pack)
+
+            event_ids = list(pack.events.using(self.db)
+                                 .values_list('pk', flat=True))
+            if event_ids:
+                events = Event.objects.using(self.db).filter(pk__in=event_ids)
+                reserved = (events.filter(has_seats()) if check else events) \
+                    .update(booked_count=F('booked_count') + 1)
+                if check and reserved != len(event_ids):
+                    # one of the events is full, roll everything back
+                    raise SoldOut(pack)
+
+    def release_seats(self, pack_id):
+        """give back a seat in the pack and in each of its events"""
+        with transaction.atomic(using=self.db):
+            Pack.objects.using(self.db).filter(
+                pk=pack_id, booked_count__gt=0
+            ).update(booked_count=F('booked_count') - 1)
+            Event.objects.using(self.db).filter(
+                pack=pack_id, booked_count__gt=0
+            ).update(booked_count=F('booked_count') - 1)
+
+    def release_booking(self, booking):
+        """give back the seats taken by a cancelled booking"""
+        self.release_seats(booking.packs_id)
 
 
 class Booking(models.Model):
     users = models.ForeignKey(User, on_delete=models.PROTECT)
     packs = models.ForeignKey(Pack, on_delete=models.PROTECT)
-    date = models.DateField(default=date.today().strftime("%Y-%m-%d"))
+    # a callable, the day the booking is made and not the day the server
+    # started
+    date = models.DateField(default=date.today)
+    # price to pay, the final price of the pack when it was booked
+    amount = models.DecimalField(max_digits=6, decimal_places=2,
+                                 editable=False, blank=True)
     payed = models.BooleanField(default=False)
     date_payed = models.DateField(null=True, blank=True)
+
+    objects = BookingManager()
+
+    class Meta:
+        indexes = [
+            # booking history of a user, newest first
+            models.Index(fields=['users', 'date'],
+                         name='booking_user_date_idx'),
+            # unpaid bookings by date, for the admin and the reminders.
+            # django filters booleans as "NOT payed", which an index on
+            # payed can not serve but a partial index with the same
+            # condition can
+            models.Index(fields=['date'], condition=Q(payed=False),
+                         name='booking_unpaid_date_idx'),
+        ]
+
+    def save(self, *args, check_seats=False, **kwargs):
+        """
+        a new booking takes a seat in its pack and in the pack events, a
+        booking moved to another pack moves its seats, with check_seats
+        raise SoldOut when there are none left (deleting the booking gives
+        them back, see core.signals.release_seats)
+        """
+        if self.amount is None:
+            self.amount = self.packs.final_price
+        using = kwargs.get('using') or \
+            router.db_for_write(Booking, instance=self)
+        update_fields = kwargs.get('update_fields')
+        bookings = Booking.objects.db_manager(using)
+        with transaction.atomic(using=using):
+            if self._state.adding:
+                bookings.reserve_seats(self.packs, check_seats)
+            elif update_fields is None or 'packs' in update_fields:
+                previous = bookings.filter(pk=self.pk) \
+                                   .values_list('packs', flat=True).first()
+                if previous is not None and previous != self.packs_id:
+                    bookings.release_seats(previous)
+                    bookings.reserve_seats(self.packs, check_seats)
+            super().save(*args, **kwargs)
+
+    def pay(self, day=None):
+        """mark the booking as paid, on day (today by default)"""
+        self.payed = True
+        self.date_payed = day or date.today()
+        self.save(update_fields=['payed', 'date_payed'])
+
+
+def allocate_amount(amount, weights):
+    """
+    split amount in proportion to weights (equal shares when they add up
+    to zero), rounded to the cent, the last share takes the rounding
+    difference so the shares add up to amount
+    """
+    weights = [Decimal(str(weight)) for weight in weights]
+    if not weights:
+        return []
+    total = sum(weights)
+    if not total:
+        weights, total = [Decimal(1)] * len(weights), Decimal(len(weights))
+    shares = [(amount * weight / total).quantize(Decimal('0.01'),
+                                                 rounding=ROUND_HALF_UP)
+              for weight in weights[:-1]]
+    return shares + [amount - sum(shares)]
+
+
+class SalesRollupQuerySet(models.QuerySet):
+
+    def add(self, key, bookings, amount, paid_bookings, paid_amount):
+        """
+        add the deltas to the row of key (a dict of its unique fields),
+        created when missing, with one UPDATE in the common case
+        """
+        deltas = {
+            'bookings': F('bookings') + bookings,
+            'amount': F('amount') + amount,
+            'paid_bookings': F('paid_bookings') + paid_bookings,
+            'paid_amount': F('paid_amount') + paid_amount,
+        }
+        with transaction.atomic(using=self.db):
+            if self.filter(**key).update(**deltas):
+                if bookings < 0:
+                    # no empty rows for the reports to skip
+                    self.filter(bookings=0, **key).delete()
+                return
+            try:
+                # a savepoint, a concurrent insert of the same row is
+                # retried as an update
+                with transaction.atomic(using=self.db):
+                    self.create(bookings=bookings, amount=amount,
+                                paid_bookings=paid_bookings,
+                                paid_amount=paid_amount, **key)
+            except IntegrityError:
+                self.filter(**key).update(**deltas)
+
+
+class DailySalesQuerySet(SalesRollupQuerySet):
+
+    def record(self, day, pack_id, bookings, amount, paid_bookings,
+               paid_amount):
+        """add the deltas to the row of the pack for the day"""
+        self.add({'day': day, 'pack_id': pack_id}, bookings, amount,
+                 paid_bookings, paid_amount)
+
+    def record_booking(self, booking, sign=1):
+        """add (sign=1) or remove (sign=-1) a booking from the rollups"""
+        amount = booking.amount * sign
+        self.record(booking.date, booking.packs_id, sign, amount,
+                    sign if booking.payed else 0,
+                    amount if booking.payed else 0)
+
+    def rebuild(self):
+        """
+        recompute every row from the bookings, one grouped query, return
+        the number of rows
+        """
+        rows = Booking.objects.using(self.db).order_by().values(
+            'date', 'packs'
+        ).annotate(
+            total_bookings=Count('pk'),
+            total_amount=Sum('amount'),
+            total_paid_bookings=Count('pk', filter=Q(payed=True)),
+            total_paid_amount=Coalesce(Sum('amount', filter=Q(payed=True)),
+                                       Decimal(0)),
+        )
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            created = self.bulk_create([
+                self.model(day=row['date'], pack_id=row['packs'],
+                           bookings=row['total_bookings'],
+                           amount=row['total_amount'],
+                           paid_bookings=row['total_paid_bookings'],
+                           paid_amount=row['total_paid_amount'])
+                for row in rows
+            ], batch_size=500)
+        return len(created)
+
+
+class DailySales(models.Model):
+    """
+    sales of a pack in a day (the booking date), kept up to date by the
+    booking signals (core/signals.py) so the reports never read the
+    bookings
+    """
+    day = models.DateField()
+    pack = models.ForeignKey(Pack, on_delete=models.CASCADE)
+    bookings = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=12, decimal_places=2,
+                                 default=0)
+    paid_bookings = models.PositiveIntegerField(default=0)
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2,
+                                      default=0)
+
+    objects = DailySalesQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'pack'],
+                                    name='daily_sales_day_pack_uniq'),
+        ]
+        indexes = [
+            # sales of a pack over a date window
+            models.Index(fields=['pack', 'day'],
+                         name='daily_sales_pack_day_idx'),
+        ]
+
+
+class DailyEventSalesQuerySet(SalesRollupQuerySet):
+
+    def record_booking(self, booking, sign=1):
+        """
+        add (sign=1) or remove (sign=-1) a booking from the rows of the
+        events of its pack, the amount is split between the events in
+        proportion to their price
+        """
+        events = list(Event.objects.using(self.db)
+                                   .filter(pack=booking.packs_id)
+                                   .order_by('pk').values_list('pk', 'price'))
+        amounts = allocate_amount(booking.amount,
+                                  [price for pk, price in events])
+        for (event_id, price), amount in zip(events, amounts):
+            amount *= sign
+            self.add({'day': booking.date, 'event_id': event_id}, sign,
+                     amount, sign if booking.payed else 0,
+                     amount if booking.payed else 0)
+
+    def rebuild(self):
+        """
+        recompute every row from the bookings and the current events of
+        their packs, two queries, return the number of rows
+        """
+        # the bookings with the same amount have the same shares
+        groups = Booking.objects.using(self.db).order_by().values(
+            'date', 'packs', 'amount', 'payed'
+        ).annotate(total_bookings=Count('pk'))
+        events = {}
+        for pack_id, event_id, price in Pack.events.through.objects \
+                .using(self.db).order_by('event') \
+                .values_list('pack', 'event', 'event__price'):
+            events.setdefault(pack_id, []).append((event_id, price))
+
+        rows = {}
+        for group in groups:
+            pack_events = events.get(group['packs'], [])
+            amounts = allocate_amount(group['amount'],
+                                      [price for pk, price in pack_events])
+            count = group['total_bookings']
+            for (event_id, price), amount in zip(pack_events, amounts):
+                row = rows.setdefault((group['date'], event_id), self.model(
+                    day=group['date'], event_id=event_id, bookings=0,
+                    amount=0, paid_bookings=0, paid_amount=0,
+                ))
+                row.bookings += count
+                row.amount += amount * count
+                if group['payed']:
+                    row.paid_bookings += count
+                    row.paid_amount += amount * count
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            created = self.bulk_create(rows.values(), batch_size=500)
+        return len(created)
+
+
+class DailyEventSales(models.Model):
+    """
+    share of an event in the sales of its packs in a day (the booking
+    date): the amount of every booking is split between the events of the
+    pack in proportion to their price, kept up to date by the booking
+    signals (core/signals.py). The shares follow the events of the pack
+    when the booking was made, rebuild_sales_rollups splits them again on
+    the current events
+    """
+    day = models.DateField()
+    event = models.ForeignKey(Event, on_delete=models.CASCADE)
+    # bookings of a pack including the event
+    bookings = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=12, decimal_places=2,
+                                 default=0)
+    paid_bookings = models.PositiveIntegerField(default=0)
+    paid_amount = models.DecimalField(max_digits=12, decimal_places=2,
+                                      default=0)
+
+    objects = DailyEventSalesQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'event'],
+                                    name='event_sales_day_event_uniq'),
+        ]
+        indexes = [
+            # sales of an event over a date window
+            models.Index(fields=['event', 'day'],
+                         name='event_sales_event_day_idx'),
+        ]
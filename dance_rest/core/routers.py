@@ -0,0 +1,123 @@
+# core/routers.py
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_KEY_PREFIX = 'core:db-pin:'
+
+# whether the reads of the current request may go to a replica, enabled
+# by the read only views only
+use_replicas = ContextVar('use_replicas', default=False)
+# labels of the models written by the current request, set up by
+# ReadYourWritesMiddleware
+db_writes = ContextVar('db_writes', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_replica_lag():
+    """seconds the replicas may lag behind the primary"""
+    return getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 10)
+
+
+@contextmanager
+def reading_from_replicas():
+    """route the reads of the block to the replicas"""
+    token = use_replicas.set(True)
+    try:
+        yield
+    finally:
+        use_replicas.reset(token)
+
+
+@contextmanager
+def reading_from_primary():
+    """route the reads of the block to the primary"""
+    token = use_replicas.set(False)
+    try:
+        yield
+    finally:
+        use_replicas.reset(token)
+
+
+def get_pin_cache():
+    """the cache of the pins, shared by the processes serving the user"""
+    return caches[getattr(settings, 'DATABASE_REPLICA_PIN_CACHE', 'default')]
+
+
+def pin_user(user):
+    """send the reads of the user to the primary for a while"""
+    get_pin_cache().set(PIN_KEY_PREFIX + str(user.pk), True,
+                        get_replica_lag())
+
+
+def is_pinned(user):
+    """whether the user wrote recently, the replicas could lag behind"""
+    return user.is_authenticated and \
+        get_pin_cache().get(PIN_KEY_PREFIX + str(user.pk)) is not None
+
+
+class ReplicaRouter:
+    """
+    Send the reads enabled by use_replicas to one of the DATABASE_REPLICAS
+    aliases, everything else to the default database
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if replicas and use_replicas.get() and \
+                not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        writes = db_writes.get()
+        if writes is not None:
+            writes.add(model._meta.label)
+        # always the primary, even for objects read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same data as the primary
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    DRF view mixin reading from the replicas on safe methods, unless the
+    user wrote recently. Authentication and permissions are checked on
+    the primary, before the replicas are enabled.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = use_replicas.set(False)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            use_replicas.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not is_pinned(request.user):
+            use_replicas.set(True)
+
+
+class ReplicaChangeListMixin:
+    """ModelAdmin mixin reading the changelist pages from the replicas"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET' or is_pinned(request.user):
+            return super().changelist_view(request, extra_context)
+        with reading_from_replicas():
+            response = super().changelist_view(request, extra_context)
+            # the changelist queries run while the template is rendered
+            if hasattr(response, 'render'):
+                response.render()
+            return response
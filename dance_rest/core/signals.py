@@ -0,0 +1,141 @@
+# core/signals.py
+from core.models import Booking, DailyEventSales, DailySales, Pack
+
+
+# fields of a booking counted by the sales rollups
+SALES_FIELDS = ('date', 'packs_id', 'amount', 'payed')
+
+
+def release_seats(instance, using=None, **kwargs):
+    """signal receiver giving back the seats of a deleted booking"""
+    Booking.objects.db_manager(using).release_booking(instance)
+
+
+def booking_saving(instance, using=None, update_fields=None, **kwargs):
+    """
+    pre_save receiver of Booking, remember what the rollups counted for
+    a booking that changes
+    """
+    if update_fields is not None:
+        update_fields = {Booking._meta.get_field(name).attname
+                         for name in update_fields}
+    if instance.pk is None or (update_fields is not None and
+                               not update_fields & set(SALES_FIELDS)):
+        instance._sales_previous = None
+        return
+    previous = Booking.objects.using(using).filter(pk=instance.pk) \
+                              .values(*SALES_FIELDS).first()
+    instance._sales_previous = Booking(**previous) if previous else None
+
+
+def booking_saved(instance, created, using=None, **kwargs):
+    """
+    post_save receiver of Booking, count a new booking in the rollups or
+    move a changed one (paid, other pack or date)
+    """
+    previous = instance.__dict__.pop('_sales_previous', None)
+    if created:
+        record_sales(instance, using)
+    elif previous is not None and any(
+            getattr(previous, field) != getattr(instance, field)
+            for field in SALES_FIELDS
+    ):
+        record_sales(previous, using, sign=-1)
+        record_sales(instance, using)
+
+
+def booking_deleted(instance, using=None, **kwargs):
+    """post_delete receiver of Booking, a cancelled booking is not sold"""
+    record_sales(instance, using, sign=-1)
+
+
+def record_sales(booking, using, sign=1):
+    """add or remove the booking from the rollups of its pack and events"""
+    DailySales.objects.db_manager(using).record_booking(booking, sign)
+    DailyEventSales.objects.db_manager(using).record_booking(booking, sign)
+
+
+def changed_packs(instance, action, reverse, pk_set, using):
+    """
+    the ids of the packs whose many to many field changed, None for the
+    actions to skip (pre_clear remembers the packs of a reverse clear)
+    """
+    if action not in ('pre_clear', 'post_add', 'post_remove', 'post_clear'):
+        return None
+    if not reverse:
+        return [instance.pk] if action != 'pre_clear' else None
+    if action == 'pre_clear':
+        # the packs of the instance are unknown after the clear
+        instance._cleared_pack_ids = list(
+            instance.pack_set.using(using).values_list('pk', flat=True)
+        )
+        return None
+    if action == 'post_clear':
+        return instance.__dict__.pop('_cleared_pack_ids', [])
+    return pk_set
+
+
+def update_pack_prices(instance, action, reverse, model, pk_set,
+                       using=None, **kwargs):
+    """
+    m2m_changed receiver of Pack.discounts, recompute the final price of
+    the packs whose discounts changed
+    """
+    pack_ids = changed_packs(instance, action, reverse, pk_set, using)
+    if pack_ids:
+        Pack.objects.using(using).filter(pk__in=pack_ids) \
+                    .update_final_prices()
+
+
+def update_pack_dates(instance, action, reverse, model, pk_set,
+                      using=None, **kwargs):
+    """
+    m2m_changed receiver of Pack.events, recompute the dates of the packs
+    whose events changed
+    """
+    pack_ids = changed_packs(instance, action, reverse, pk_set, using)
+    if pack_ids:
+        Pack.objects.using(using).filter(pk__in=pack_ids) \
+                    .update_event_dates()
+
+
+def event_changed(instance, created, using=None, update_fields=None,
+                  **kwargs):
+    """post_save receiver of Event, redate the packs of a moved event"""
+    if not created and (update_fields is None or 'date' in update_fields):
+        instance.pack_set.using(using).all().update_event_dates()
+
+
+def event_deleting(instance, using=None, **kwargs):
+    """pre_delete receiver of Event, remember the packs of the event"""
+    instance._deleted_pack_ids = list(
+        instance.pack_set.using(using).values_list('pk', flat=True)
+    )
+
+
+def event_deleted(instance, using=None, **kwargs):
+    """post_delete receiver of Event, redate the packs it was in"""
+    pack_ids = instance.__dict__.pop('_deleted_pack_ids', [])
+    if pack_ids:
+        Pack.objects.using(using).filter(pk__in=pack_ids) \
+                    .update_event_dates()
+
+
+def discount_changed(instance, using=None, **kwargs):
+    """post_save receiver of Discount, reprice the packs using it"""
+    instance.pack_set.using(using).all().update_final_prices()
+
+
+def discount_deleting(instance, using=None, **kwargs):
+    """pre_delete receiver of Discount, remember the packs using it"""
+    instance._deleted_pack_ids = list(
+        instance.pack_set.using(using).values_list('pk', flat=True)
+    )
+
+
+def discount_deleted(instance, using=None, **kwargs):
+    """post_delete receiver of Discount, reprice the packs it was on"""
+    pack_ids = instance.__dict__.pop('_deleted_pack_ids', [])
+    if pack_ids:
+        Pack.objects.using(using).filter(pk__in=pack_ids) \
+                    .update_final_prices()
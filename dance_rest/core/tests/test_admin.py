@@ -1,6 +1,9 @@
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.models import Location, Event, Pack
 
 class AdminSiteTests(TestCase):
 
@@ -34,3 +37,30 @@ class AdminSiteTests(TestCase):
         url = reverse('admin:core_user_add')
         res = self.client.get(url)
         self.assertEqual(res.status_code, 200)
+
+    def test_pack_changelist_query_count(self):
+        """Test pack changelist does not query events once per pack"""
+        location = Location.objects.create(name='Carichi', address='via 1',
+                                           city='Padova', room='main')
+        url = reverse('admin:core_pack_changelist')
+
+        def add_pack(i):
+            event = Event.objects.create(name='Class %s' % i, type='Class',
+                                         description='', date='2021-05-18',
+                                         time='21:00', location=location,
+                                         price=10.0)
+            pack = Pack.objects.create(name='Pack %s' % i, price=10.0)
+            pack.events.add(event)
+
+        add_pack(0)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        queries_one_pack = len(ctx.captured_queries)
+
+        for i in range(1, 6):
+            add_pack(i)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.get(url)
+
+        self.assertContains(res, 'Pack 5')
+        self.assertEqual(len(ctx.captured_queries), queries_one_pack)
@@ -0,0 +1,198 @@
+# core/tests/test_db.py
+# test the sqlite backend profile, the retry of locked writes and the bulk
+# inserts
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.db import OperationalError, connection, transaction
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from core.db.bulk import bulk_create
+from core.db.retry import retry_on_lock
+from core.models import Artist
+
+# helper functions
+
+def open_database(path, **options):
+    """a new connection to the sqlite file with the project backend"""
+    settings_dict = dict(connection.settings_dict, NAME=path,
+                         OPTIONS=options)
+    backend = load_backend('core.db.sqlite3')
+    return backend.DatabaseWrapper(settings_dict, alias='test_%s' % path)
+
+
+def read_in_thread(path, sql, **options):
+    """run sql in another thread, return (rows or error, seconds)"""
+    result = []
+
+    def read():
+        db = open_database(path, **options)
+        start = time.perf_counter()
+        try:
+            with db.cursor() as cursor:
+                cursor.execute(sql)
+                result.append(cursor.fetchall())
+        except OperationalError as e:
+            result.append(e)
+        finally:
+            result.append(time.perf_counter() - start)
+            db.close()
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    thread.join()
+    return result
+
+
+class SqliteBackendTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'db.sqlite3')
+
+    def open(self, **options):
+        db = open_database(self.path, **options)
+        self.addCleanup(db.close)
+        return db
+
+    def create_seats(self, db):
+        with db.cursor() as cursor:
+            cursor.execute('CREATE TABLE seat (id INTEGER PRIMARY KEY, '
+                           'booked INTEGER NOT NULL)')
+            cursor.execute('INSERT INTO seat (booked) VALUES (0)')
+
+    def test_pragmas(self):
+        """ test the pragmas are set on every connection """
+        db = self.open(pragmas={'busy_timeout': 100, 'cache_size': None})
+        with db.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 100)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -2000)  # sqlite default
+
+    def test_readers_not_blocked_by_writer(self):
+        """ test a reader gets the committed data while a write is open """
+        writer = self.open()
+        self.create_seats(writer)
+        with writer.cursor() as cursor:
+            # an exclusive lock blocks every reader without WAL
+            cursor.execute('BEGIN EXCLUSIVE')
+            cursor.execute('UPDATE seat SET booked = booked + 1')
+
+            rows, seconds = read_in_thread(
+                self.path, 'SELECT booked FROM seat',
+                pragmas={'busy_timeout': 2000},
+            )
+            cursor.execute('COMMIT')
+
+        self.assertEqual(rows, [(0,)])
+        self.assertLess(seconds, 1)
+
+    def test_readers_blocked_without_wal(self):
+        """ test the same read waits and fails with a rollback journal """
+        writer = self.open(pragmas={'journal_mode': 'DELETE'})
+        self.create_seats(writer)
+        with writer.cursor() as cursor:
+            cursor.execute('BEGIN EXCLUSIVE')
+            cursor.execute('UPDATE seat SET booked = booked + 1')
+
+            error, seconds = read_in_thread(
+                self.path, 'SELECT booked FROM seat',
+                pragmas={'journal_mode': None, 'busy_timeout': 100},
+            )
+            cursor.execute('ROLLBACK')
+
+        self.assertIsInstance(error, OperationalError)
+        self.assertIn('locked', str(error))
+
+    def test_transaction_mode_immediate(self):
+        """ test atomic blocks take the write lock when they start """
+        writer = self.open(transaction_mode='IMMEDIATE')
+        self.create_seats(writer)
+        writer._start_transaction_under_autocommit()
+        try:
+            error, seconds = read_in_thread(
+                self.path, 'BEGIN IMMEDIATE', pragmas={'busy_timeout': 100},
+            )
+        finally:
+            writer.cursor().execute('ROLLBACK')
+
+        self.assertIsInstance(error, OperationalError)
+
+
+class RetryOnLockTests(TransactionTestCase):
+
+    def failing(self, *errors):
+        """function raising the errors, then returning the calls made"""
+        calls = []
+
+        def func():
+            calls.append(1)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return len(calls)
+        return func
+
+    def test_retried_until_it_succeeds(self):
+        """ test lock errors are retried """
+        func = retry_on_lock(backoff=0)(self.failing(
+            OperationalError('database is locked'),
+            OperationalError('database is locked'),
+        ))
+        self.assertEqual(func(), 3)
+
+    def test_gives_up_after_attempts(self):
+        """ test the last lock error is raised """
+        func = retry_on_lock(attempts=2, backoff=0)(self.failing(
+            *[OperationalError('database is locked')] * 3
+        ))
+        with self.assertRaisesMessage(OperationalError, 'locked'):
+            func()
+
+    def test_other_errors_not_retried(self):
+        """ test errors other than locks are raised at once """
+        func = retry_on_lock(backoff=0)(self.failing(
+            OperationalError('no such table: seat'),
+        ))
+        with self.assertRaisesMessage(OperationalError, 'no such table'):
+            func()
+
+    def test_not_retried_in_atomic_block(self):
+        """ test nothing is retried inside a transaction """
+        func = retry_on_lock(backoff=0)(self.failing(
+            OperationalError('database is locked'),
+        ))
+        with transaction.atomic():
+            with self.assertRaises(OperationalError):
+                func()
+
+
+class BulkCreateTests(TestCase):
+
+    def test_rows_with_primary_keys(self):
+        """ test the rows come back with their ids, in order """
+        Artist.objects.create(name='first', style='Swing', type='Band',
+                              description='', country='USA')
+        artists = bulk_create(Artist, [
+            Artist(name='artist %d' % i, style='Swing', type='Band',
+                   description='', country='USA')
+            for i in range(5)
+        ], batch_size=2)
+
+        self.assertEqual([artist.name for artist in artists],
+                         ['artist %d' % i for i in range(5)])
+        self.assertEqual(
+            [artist.pk for artist in artists],
+            list(Artist.objects.filter(name__startswith='artist ')
+                               .order_by('pk').values_list('pk', flat=True)),
+        )
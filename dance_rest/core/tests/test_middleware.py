@@ -0,0 +1,76 @@
+# core/tests/test_middleware.py
+# test the query instrumentation middleware and the query budgets of the
+# api endpoints
+
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework.authtoken.models import Token
+from core.authentication import token_cache
+from core.middleware import query_stats, QueryBudgetExceeded
+from core.models import UserDetails, Location, Event, Pack
+
+BOOKING_API = reverse('booking:booking')
+ME_URL = reverse('users:me')
+DETAILS_URL = reverse('users:details')
+TOKEN_URL = reverse('users:token')
+
+
+@override_settings(QUERY_INSTRUMENTATION=True, DEBUG=True)
+class QueryInstrumentationTests(TestCase):
+
+    def setUp(self):
+        query_stats.reset()
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='test@seelv.io',
+            password='test123',
+        )
+        UserDetails.objects.create(user=self.user, name='Ale',
+                                   surname='Rossi', address='via roma 7',
+                                   city='Padova', country='Italia',
+                                   tel='+39049000000')
+        location = Location.objects.create(name='Carichi', address='via 1',
+                                           city='Padova', room='main')
+        for i in range(10):
+            event = Event.objects.create(name='Class %s' % i, type='Class',
+                                         description='', date='2021-05-18',
+                                         time='21:00', location=location,
+                                         price=10.0)
+            pack = Pack.objects.create(name='Pack %s' % i, price=10.0)
+            pack.events.add(event)
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_headers_and_stats(self):
+        """Test the numbers are in the headers and recorded per view"""
+        res = self.client.get(ME_URL)
+
+        self.assertIn('X-Query-Count', res)
+        self.assertIn('X-DB-Time-ms', res)
+        self.assertIn('X-Total-Time-ms', res)
+        stats = query_stats.snapshot()['users:me']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['queries'], int(res['X-Query-Count']))
+
+    @override_settings(QUERY_BUDGETS={'users:me': 0})
+    def test_budget_exceeded(self):
+        """Test a view over its query budget fails"""
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(ME_URL)
+
+    @override_settings(QUERY_BUDGETS={
+        'booking:booking': 4,
+        'users:me': 2,
+        'users:details': 3,
+        'users:token': 2,
+    })
+    def test_endpoint_budgets(self):
+        """Test the endpoints stay within their query budgets"""
+        self.client.get(BOOKING_API)
+        self.client.get(ME_URL)
+        self.client.get(DETAILS_URL)
+        APIClient().post(TOKEN_URL, {'email': 'test@seelv.io',
+                                     'password': 'test123'})
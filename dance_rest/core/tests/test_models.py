@@ -2,10 +2,18 @@
 # this will test everything around the models like creating updating and
 # deleting rows in the database
 
-from django.test import TestCase
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from core.models import UserDetails, Location, Artist, Event, Pack, Discount, \
-                        Booking
+                        Booking, DailySales, DailyEventSales, \
+                        allocate_amount, apply_discounts
 
 
 class ModelTests(TestCase):
@@ -343,3 +351,349 @@ class BookingModelTests(TestCase):
 
         self.assertEqual(booking.users, self.user)
         self.assertEqual(booking.packs, pack)
+
+    def test_pack_with_events_count(self):
+        """ test the event dates are stored and the events counted """
+        pack = Pack.objects.create(name="Bounce Factory all night", price=15.0)
+        pack.events.add(self.event)
+        pack.events.add(self.event2)
+
+        pack = Pack.objects.with_events_count().get(id=pack.id)
+
+        self.assertEqual(str(pack.first_event_date), self.event.date)
+        self.assertEqual(str(pack.last_event_date), self.event2.date)
+        self.assertEqual(pack.events_count, 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(pack.starting_date, pack.first_event_date)
+            self.assertEqual(pack.ending_date, pack.last_event_date)
+
+    def test_pack_dates_follow_events(self):
+        """ test the stored dates follow the events of the pack """
+        pack = Pack.objects.create(name="Bounce Factory all night", price=15.0)
+        self.assertIsNone(pack.starting_date)
+        pack.events.add(self.event, self.event2)
+
+        self.event2.date = '2020-01-01'
+        self.event2.save()
+        pack.refresh_from_db()
+        self.assertEqual(str(pack.starting_date), '2020-01-01')
+        self.assertEqual(str(pack.ending_date), self.event.date)
+
+        self.event2.delete()
+        pack.refresh_from_db()
+        self.assertEqual(str(pack.starting_date), self.event.date)
+
+        self.event.pack_set.clear()
+        pack.refresh_from_db()
+        self.assertIsNone(pack.starting_date)
+        self.assertIsNone(pack.ending_date)
+
+    def test_booking_counters(self):
+        """ test booking and cancelling update the seat counters """
+        pack = Pack.objects.create(name="Bounce Factory all night",
+                                   price=15.0, capacity=10)
+        pack.events.add(self.event)
+        self.event.capacity = 5
+        self.event.save()
+
+        booking = Booking.objects.create_booking(self.user, pack)
+        pack.refresh_from_db()
+        self.event.refresh_from_db()
+        self.assertEqual(pack.booked_count, 1)
+        self.assertEqual(self.event.remaining, 4)
+        self.assertEqual(pack.remaining, 4)
+
+        booking.delete()
+        pack.refresh_from_db()
+        self.event.refresh_from_db()
+        self.assertEqual(pack.booked_count, 0)
+        self.assertEqual(self.event.booked_count, 0)
+
+    def test_booking_created_directly_counters(self):
+        """ test a booking not made by create_booking holds seats too """
+        pack = Pack.objects.create(name="Bounce Factory all night",
+                                   price=15.0)
+        pack.events.add(self.event)
+        Booking.objects.create_booking(self.user, pack)
+
+        booking = Booking.objects.create(users=self.user, packs=pack)
+        pack.refresh_from_db()
+        self.event.refresh_from_db()
+        self.assertEqual(pack.booked_count, 2)
+        self.assertEqual(self.event.booked_count, 2)
+
+        booking.delete()
+        pack.refresh_from_db()
+        self.event.refresh_from_db()
+        self.assertEqual(pack.booked_count, 1)
+        self.assertEqual(self.event.booked_count, 1)
+
+    def test_booking_moved_counters(self):
+        """ test moving a booking to another pack moves its seats """
+        pack = Pack.objects.create(name="Bounce Factory all night",
+                                   price=15.0)
+        pack.events.add(self.event)
+        other = Pack.objects.create(name="Social only", price=8.0)
+        other.events.add(self.event2)
+        booking = Booking.objects.create_booking(self.user, pack)
+
+        booking.packs = other
+        booking.save()
+        booking.pay()
+
+        for row in (pack, other, self.event, self.event2):
+            row.refresh_from_db()
+        self.assertEqual(pack.booked_count, 0)
+        self.assertEqual(self.event.booked_count, 0)
+        self.assertEqual(other.booked_count, 1)
+        self.assertEqual(self.event2.booked_count, 1)
+
+    def test_repair_seat_counters(self):
+        """ test the command repairs drifted counters """
+        pack = Pack.objects.create(name="Bounce Factory all night",
+                                   price=15.0)
+        pack.events.add(self.event)
+        Booking.objects.create_booking(self.user, pack)
+        Booking.objects.create_booking(self.user, pack)
+        Pack.objects.update(booked_count=7)
+        Event.objects.update(booked_count=0)
+
+        out = StringIO()
+        call_command('repair_seat_counters', stdout=out)
+
+        pack.refresh_from_db()
+        self.event.refresh_from_db()
+        self.event2.refresh_from_db()
+        self.assertEqual(pack.booked_count, 2)
+        self.assertEqual(self.event.booked_count, 2)
+        self.assertEqual(self.event2.booked_count, 0)
+        self.assertIn('packs: 1 counters repaired', out.getvalue())
+
+    def sales(self, pack):
+        return list(DailySales.objects.filter(pack=pack).order_by('day')
+                    .values_list('day', 'bookings', 'amount',
+                                 'paid_bookings', 'paid_amount'))
+
+    def test_sales_rollups(self):
+        """ test the rollups follow the bookings created, paid, deleted """
+        pack = Pack.objects.create(name="Bounce Factory all night",
+                                   price=15.0)
+        today = date.today()
+        first = Booking.objects.create_booking(self.user, pack)
+        second = Booking.objects.create_booking(self.user, pack)
+        self.assertEqual(self.sales(pack), [(today, 2, 30, 0, 0)])
+
+        first.pay()
+        self.assertEqual(self.sales(pack), [(today, 2, 30, 1, 15)])
+
+        second.date = date(2021, 5, 1)
+        second.save()
+        self.assertEqual(self.sales(pack), [(date(2021, 5, 1), 1, 15, 0, 0),
+                                            (today, 1, 15, 1, 15)])
+
+        first.delete()
+        second.delete()
+        self.assertEqual(self.sales(pack), [])
+
+    def event_sales(self):
+        return list(DailyEventSales.objects.order_by('event', 'day')
+                    .values_list('event', 'day', 'bookings', 'amount',
+                                 'paid_bookings', 'paid_amount'))
+
+    def test_event_sales_rollups(self):
+        """ test the sales are split between the events of the pack """
+        pack = Pack.objects.create(name="Bounce Factory all night",
+                                   price=15.0)
+        pack.events.add(self.event, self.event2)
+        today = date.today()
+        first = Booking.objects.create_booking(self.user, pack)
+        Booking.objects.create_booking(self.user, pack)
+        first.pay()
+        # the events cost the same
+        self.assertEqual(self.event_sales(), [
+            (self.event.pk, today, 2, Decimal('15.00'), 1, Decimal('7.50')),
+            (self.event2.pk, today, 2, Decimal('15.00'), 1, Decimal('7.50')),
+        ])
+
+        first.delete()
+        self.assertEqual(self.event_sales(), [
+            (self.event.pk, today, 1, Decimal('7.50'), 0, 0),
+            (self.event2.pk, today, 1, Decimal('7.50'), 0, 0),
+        ])
+
+    def test_allocate_amount(self):
+        """ test the shares add up to the amount """
+        self.assertEqual(allocate_amount(Decimal('10.00'), [1, 1, 1]),
+                         [Decimal('3.33'), Decimal('3.33'), Decimal('3.34')])
+        self.assertEqual(allocate_amount(Decimal('15.00'), [10, 20]),
+                         [Decimal('5.00'), Decimal('10.00')])
+        self.assertEqual(allocate_amount(Decimal('9.00'), [0, 0]),
+                         [Decimal('4.50'), Decimal('4.50')])
+        self.assertEqual(allocate_amount(Decimal('9.00'), []), [])
+
+    def test_rebuild_sales_rollups(self):
+        """ test the command recomputes the rollups from the bookings """
+        pack = Pack.objects.create(name="Bounce Factory all night",
+                                   price=15.0)
+        pack.events.add(self.event, self.event2)
+        Booking.objects.create_booking(self.user, pack)
+        Booking.objects.create_booking(self.user, pack).pay()
+        events = self.event_sales()
+        # bulk updates send no signals
+        Booking.objects.update(date=date(2021, 5, 1))
+        DailySales.objects.update(bookings=9)
+        DailyEventSales.objects.update(bookings=9)
+
+        out = StringIO()
+        call_command('rebuild_sales_rollups', stdout=out)
+
+        self.assertEqual(self.sales(pack), [(date(2021, 5, 1), 2, 30, 1, 15)])
+        # the same shares as the signals
+        self.assertEqual(self.event_sales(),
+                         [row[:1] + (date(2021, 5, 1),) + row[2:]
+                          for row in events])
+        self.assertIn('1 daily sales rows rebuilt', out.getvalue())
+
+    def test_pack_final_price(self):
+        """ test the final price follows the price and the discounts """
+        pack = Pack.objects.create(name="Bounce Factory all night",
+                                   price=100)
+        self.assertEqual(pack.final_price, Decimal('100.00'))
+        couple = Discount.objects.create(name="couple", discount=10)
+        student = Discount.objects.create(name="student", discount=5)
+
+        pack.discounts.add(couple, student)
+        pack.refresh_from_db()
+        # the discounts compound, 100 * 0.90 * 0.95
+        self.assertEqual(pack.final_price, Decimal('85.50'))
+
+        student.discount = 20
+        student.save()
+        pack.refresh_from_db()
+        self.assertEqual(pack.final_price, Decimal('72.00'))
+
+        pack.price = 50
+        pack.save(update_fields=['price'])
+        pack.refresh_from_db()
+        self.assertEqual(pack.final_price, Decimal('36.00'))
+
+        couple.pack_set.clear()
+        pack.refresh_from_db()
+        self.assertEqual(pack.final_price, Decimal('40.00'))
+
+        student.delete()
+        pack.refresh_from_db()
+        self.assertEqual(pack.final_price, Decimal('50.00'))
+
+    def test_apply_discounts(self):
+        """ test the discounts are clamped and rounded to the cent """
+        self.assertEqual(apply_discounts(15, []), Decimal('15.00'))
+        self.assertEqual(apply_discounts(15, [Decimal('15.00')]),
+                         Decimal('12.75'))
+        self.assertEqual(apply_discounts('9.99', [33]), Decimal('6.69'))
+        self.assertEqual(apply_discounts(10, [120]), Decimal('0.00'))
+        self.assertEqual(apply_discounts(10, [-5]), Decimal('10.00'))
+
+    def test_backfill_final_prices(self):
+        """ test the command repairs stale final prices """
+        pack = Pack.objects.create(name="Bounce Factory all night",
+                                   price=20)
+        pack.discounts.add(Discount.objects.create(name="couple",
+                                                   discount=50))
+        Pack.objects.update(final_price=0)
+
+        out = StringIO()
+        call_command('backfill_final_prices', '--dry-run', stdout=out)
+        pack.refresh_from_db()
+        self.assertEqual(pack.final_price, 0)
+        self.assertIn('packs: 1 final prices stale', out.getvalue())
+
+        out = StringIO()
+        call_command('backfill_final_prices', stdout=out)
+        pack.refresh_from_db()
+        self.assertEqual(pack.final_price, Decimal('10.00'))
+        self.assertIn('packs: 1 final prices repaired', out.getvalue())
+
+
+def write_import_file(content, suffix):
+    """write content to a temporary file removed at the end of the test"""
+    f = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False,
+                                    encoding='utf-8')
+    with f:
+        f.write(content)
+    return f.name
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']
+)
+class ImportUsersTests(TestCase):
+
+    def import_users(self, content, suffix='.csv', *args):
+        path = write_import_file(content, suffix)
+        self.addCleanup(os.remove, path)
+        out = StringIO()
+        call_command('import_users', path, '--workers', '2', *args,
+                     stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_import_csv(self):
+        """ test users and details are created from a csv file """
+        out = self.import_users(
+            'email,password,name,surname,city,privacy\n'
+            'anna@DANCE.COM,secret123,Anna,Rossi,Milano,yes\n'
+            'bob@dance.com,secret456,,,,\n'
+            ',nomail,,,,\n'
+        )
+
+        anna = get_user_model().objects.get(email='anna@dance.com')
+        self.assertTrue(anna.check_password('secret123'))
+        self.assertEqual(anna.user_details.surname, 'Rossi')
+        self.assertTrue(anna.user_details.privacy)
+        bob = get_user_model().objects.get(email='bob@dance.com')
+        self.assertTrue(bob.check_password('secret456'))
+        self.assertFalse(UserDetails.objects.filter(user=bob).exists())
+        self.assertIn('3 rows read: 2 created, 0 updated, 0 skipped, '
+                      '1 invalid', out)
+        self.assertIn('rows/s', out)
+
+    def test_import_jsonl_unusable_passwords(self):
+        """ test json lines import with unusable passwords """
+        self.import_users(
+            '{"email": "anna@dance.com", "password": "secret123"}\n'
+            '{"email": "bob@dance.com"}\n',
+            '.jsonl', '--unusable-passwords',
+        )
+
+        users = get_user_model().objects.all()
+        self.assertEqual(users.count(), 2)
+        for user in users:
+            self.assertFalse(user.has_usable_password())
+
+    def test_import_duplicates(self):
+        """ test registered emails are skipped or updated """
+        user = get_user_model().objects.create_user('anna@dance.com',
+                                                    'oldpass123')
+        content = ('email,password,name,surname\n'
+                   'anna@dance.com,newpass123,Anna,Rossi\n')
+
+        out = self.import_users(content)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('oldpass123'))
+        self.assertIn('0 created, 0 updated, 1 skipped', out)
+
+        out = self.import_users(content, '.csv', '--update')
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('newpass123'))
+        self.assertEqual(user.user_details.name, 'Anna')
+        self.assertIn('0 created, 1 updated, 0 skipped', out)
+
+    def test_import_batches(self):
+        """ test the rows are imported across several batches """
+        rows = ''.join('user%d@dance.com,pass%d\n' % (i, i)
+                       for i in range(25))
+        out = self.import_users('email,password\n' + rows, '.csv',
+                                '--batch-size', '10')
+
+        self.assertEqual(get_user_model().objects.count(), 25)
+        self.assertIn('25 rows read: 25 created', out)
@@ -0,0 +1,86 @@
+# core/tests/test_query_plans.py
+# check with EXPLAIN QUERY PLAN that the key queries of the api and the
+# admin are served by the indexes on a seeded database
+
+import re
+from datetime import date
+
+from django.db import connection
+from django.test import TestCase
+from core.models import Location, Artist, Event, Pack, Booking
+from benchmarks.seed import seed
+
+# a scan of a whole table without an index, or a sort done in a temporary
+# b-tree because no index gives the order
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+$')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR ORDER BY')
+
+# helper functions
+
+def explain(queryset):
+    """the detail lines of the sqlite query plan of the queryset"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    """the lines of the plan showing a full scan or a temporary sort"""
+    return [line for line in plan
+            if FULL_SCAN.match(line) or TEMP_SORT.search(line)]
+
+
+def key_queries(user):
+    """name -> queryset of the queries that must use an index"""
+    return {
+        'catalog date window': Event.objects.filter(
+            date__gte=date(2020, 1, 1)).order_by('date'),
+        'event admin ordering': Event.objects.order_by('date'),
+        'user booking history': Booking.objects.filter(
+            users=user).order_by('-date'),
+        'unpaid bookings': Booking.objects.filter(
+            payed=False).order_by('date'),
+        'locations by city': Location.objects.filter(city='Padova'),
+        'artists by style': Artist.objects.filter(style='Blues'),
+        'pack events prefetch': Event.objects.filter(pack__in=[1, 2]),
+        'events by type': Event.objects.filter(type='Class'),
+        'packs by price': Pack.objects.filter(final_price__lte=100),
+        'catalog keyset page': Pack.objects.filter(
+            first_event_date__gt=date(2020, 1, 1)
+        ).order_by('first_event_date', 'id'),
+    }
+
+
+class QueryPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # no ANALYZE, on a data set this small the statistics would rightly
+        # make sqlite prefer scanning the tables
+        cls.users = seed(users=30, artists=10, locations=4, events=60,
+                         packs=15, bookings=100)
+
+    def test_key_queries_use_indexes(self):
+        """ test no key query scans a whole table or sorts in memory """
+        if connection.vendor != 'sqlite':
+            self.skipTest('the plans are checked on sqlite only')
+
+        for name, queryset in key_queries(self.users[0]).items():
+            with self.subTest(name):
+                plan = explain(queryset)
+                self.assertEqual(plan_problems(plan), [], plan)
+
+    def test_plan_problems(self):
+        """ test the plan lines flagged as problems """
+        self.assertEqual(plan_problems([
+            'SCAN core_booking',
+            'SCAN TABLE core_booking',
+            'SCAN core_event USING INDEX event_date_idx',
+            'SEARCH core_location USING INDEX location_city_idx (city=?)',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]), [
+            'SCAN core_booking',
+            'SCAN TABLE core_booking',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ])
@@ -0,0 +1,176 @@
+# core/tests/test_routers.py
+# test the replica router with a second sqlite file as the replica
+
+import os
+import shutil
+import tempfile
+from datetime import date, time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from booking.cache import catalog_cache
+from core import models
+from core.routers import PIN_KEY_PREFIX, ReplicaRouter, is_pinned, \
+                         reading_from_replicas
+
+REPLICA = 'replica'
+BOOKING_API = reverse('booking:booking')
+ME_URL = reverse('users:me')
+DETAILS_URL = reverse('users:details')
+
+# helper functions
+
+def create_pack(using, name):
+    """a pack with one event, created on the given database only"""
+    location = models.Location.objects.using(using).create(
+        name='Sala', address='via roma 1', city='Padova', room='A'
+    )
+    event = models.Event.objects.using(using).create(
+        name=name, type='Class', description='', date=date(2030, 1, 1),
+        time=time(20), location=location, price=10,
+    )
+    pack = models.Pack.objects.using(using).create(name=name, price=10)
+    models.Pack.events.through.objects.using(using).create(
+        pack_id=pack.pk, event_id=event.pk
+    )
+    # the through row is created directly, no signal dates the pack
+    models.Pack.objects.using(using).filter(pk=pack.pk) \
+                       .update_event_dates()
+    return pack
+
+
+def create_details(using, user, name):
+    return models.UserDetails.objects.using(using).create(
+        user_id=user.pk, name=name, surname='Silve', address='via roma 7',
+        city='Padova', country='Italia', tel='+390000000',
+    )
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRouterTests(TransactionTestCase):
+
+    # the replica is added in setUpClass, after the test runner collected
+    # the databases it has to set up
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        connections.settings[REPLICA] = dict(
+            connections[DEFAULT_DB_ALIAS].settings_dict,
+            NAME=os.path.join(cls.directory, 'replica.sqlite3'),
+        )
+        call_command('migrate', database=REPLICA, run_syncdb=True,
+                     verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@seelv.io', password='Test123456!'
+        )
+        # the same user on the replica, as replication would copy it
+        get_user_model().objects.using(REPLICA).create(
+            pk=self.user.pk, email=self.user.email,
+            password=self.user.password,
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_router(self):
+        """ test reads go to the replica only when enabled """
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(models.Pack), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_write(models.Pack), DEFAULT_DB_ALIAS)
+        with reading_from_replicas():
+            self.assertEqual(router.db_for_read(models.Pack), REPLICA)
+            self.assertEqual(router.db_for_write(models.Pack),
+                             DEFAULT_DB_ALIAS)
+        with override_settings(DATABASE_REPLICAS=[]), \
+                reading_from_replicas():
+            self.assertEqual(router.db_for_read(models.Pack),
+                             DEFAULT_DB_ALIAS)
+
+    @override_settings(DATABASE_REPLICA_PIN_SECONDS=0)
+    def test_catalog_reads_replica(self):
+        """ test the catalog is listed from the replica """
+        create_pack(DEFAULT_DB_ALIAS, 'Primary pack')
+        create_pack(REPLICA, 'Replica pack')
+
+        res = self.client.get(BOOKING_API)
+
+        names = [pack['name'] for pack in res.data['results']]
+        self.assertEqual(names, ['Replica pack'])
+
+    def test_catalog_rebuilt_from_primary_after_change(self):
+        """ test a catalog cached right after a change reads the primary """
+        create_pack(DEFAULT_DB_ALIAS, 'Primary pack')
+        create_pack(REPLICA, 'Replica pack')
+        catalog_cache.bump_version()
+
+        res = self.client.get(BOOKING_API)
+
+        names = [pack['name'] for pack in res.data['results']]
+        self.assertEqual(names, ['Primary pack'])
+
+    def test_details_read_your_writes(self):
+        """ test a user reads from the primary after its own write """
+        create_details(DEFAULT_DB_ALIAS, self.user, 'Primary')
+        create_details(REPLICA, self.user, 'Replica')
+
+        res = self.client.get(DETAILS_URL)
+        self.assertEqual(res.data['user_details']['name'], 'Replica')
+
+        self.client.patch(ME_URL, {'name': 'Ale'})
+        res = self.client.get(DETAILS_URL)
+        self.assertEqual(res.data['user_details']['name'], 'Primary')
+
+    @override_settings(
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'pins': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'pins',
+            },
+        },
+        DATABASE_REPLICA_PIN_CACHE='pins',
+    )
+    def test_pin_in_shared_cache(self):
+        """ test the pin of a write is kept in the pin cache alias """
+        self.client.patch(ME_URL, {'name': 'Ale'})
+
+        self.assertTrue(caches['pins'].get(PIN_KEY_PREFIX + str(self.user.pk)))
+        self.assertTrue(is_pinned(self.user))
+        caches['pins'].clear()
+        self.assertFalse(is_pinned(self.user))
+
+    def test_admin_changelist_reads_replica(self):
+        """ test the admin changelists are read from the replica """
+        admin = get_user_model().objects.create_superuser(
+            'admin@seelv.io', 'Test123456!'
+        )
+        models.Artist.objects.using(REPLICA).create(
+            name='Replica artist', style='Swing', type='Band',
+            description='', country='USA',
+        )
+        self.client.force_login(admin)
+
+        res = self.client.get(reverse('admin:core_artist_changelist'))
+
+        self.assertContains(res, 'Replica artist')
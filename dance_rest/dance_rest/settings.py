@@ -45,11 +45,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ReadYourWritesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,11 +82,33 @@ WSGI_APPLICATION = 'dance_rest.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # sqlite with WAL and tuned pragmas, see core/db/sqlite3/base.py
+        'ENGINE': 'core.db.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # keep the connections, and their page cache, between requests
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            # take the write lock when an atomic block starts
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# aliases of DATABASES holding a copy of default, the catalog, profile and
+# admin changelist reads go to them (see core/routers.py), e.g.
+# DATABASES['replica'] = {'ENGINE': 'core.db.sqlite3',
+#                         'NAME': BASE_DIR / 'replica.sqlite3'}
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# lag of the replicas in seconds: the reads of a user stay on default for
+# this long after a write of theirs, and so do the catalog rebuilds after a
+# change to the catalog
+DATABASE_REPLICA_PIN_SECONDS = 10
+# cache alias of the pins, with replicas it must be shared by every process
+# (memcached, redis, database cache): a per process cache pins the user on
+# the process that served the write only
+DATABASE_REPLICA_PIN_CACHE = 'default'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -130,3 +154,51 @@ STATIC_URL = '/static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# cache alias and timeout (seconds) used for the booking catalog, the
+# catalog version lives in it too: in production it must be shared by every
+# process (memcached, redis, database cache), with a per process cache the
+# other workers serve a stale catalog until the timeout
+BOOKING_CATALOG_CACHE = 'default'
+BOOKING_CATALOG_CACHE_TIMEOUT = 300
+
+# number of packs loaded at a time when streaming the catalog (?stream=1)
+BOOKING_CATALOG_STREAM_CHUNK_SIZE = 200
+
+# render the full catalog from values() projections (booking/projections.py)
+# instead of PackListSerializers, the output is the same
+BOOKING_CATALOG_PROJECTIONS = True
+
+# token authentication cache: entries per process, seconds to live and an
+# optional cache alias shared between the processes, which also carries the
+# invalidations to the entries of the other processes. With more than one
+# process set TOKEN_AUTH_CACHE to a shared alias (memcached, redis, database
+# cache): without it a deleted token or a deactivated user keeps working on
+# the other processes until their entries expire, so they only live
+# TOKEN_AUTH_CACHE_LOCAL_TTL seconds
+TOKEN_AUTH_CACHE_SIZE = 10000
+TOKEN_AUTH_CACHE_TTL = 60
+TOKEN_AUTH_CACHE_LOCAL_TTL = 2
+TOKEN_AUTH_CACHE = None
+
+# per request query count and timing, see core.middleware
+QUERY_INSTRUMENTATION = False
+# requests slower than this (ms) or with more queries are logged
+QUERY_INSTRUMENTATION_SLOW_MS = 500
+QUERY_INSTRUMENTATION_MAX_QUERIES = 50
+# {view name: max queries}, exceeding a budget raises QueryBudgetExceeded
+QUERY_BUDGETS = {}
+
+# threads running the async signup and login views, which hash passwords,
+# defaults to the cpu count
+PASSWORD_HASHING_WORKERS = None
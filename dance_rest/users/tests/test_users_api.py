@@ -3,19 +3,25 @@
 # will test everything around the users management
 # create update delete users
 
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from core.models import UserDetails
+from core.authentication import TokenCache, token_cache
 
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 
 CREATE_USER_URL = reverse('users:create')
 TOKEN_URL = reverse('users:token')
 ME_URL = reverse('users:me')
 DETAILS_URL = reverse('users:details')
 CREATE_DETAILS_USER = reverse ('users:create_details')
+CREATE_USER_ASYNC_URL = reverse('users:create_async')
+TOKEN_ASYNC_URL = reverse('users:token_async')
+ME_ASYNC_URL = reverse('users:me_async')
+DETAILS_ASYNC_URL = reverse('users:details_async')
 
 
 def create_user(**param):
@@ -205,3 +211,232 @@ class PrivateUserApiTests(TestCase):
                         'marketing': user_details.marketing
                         }
                 )
+
+    def test_read_user_details_not_modified(self):
+        """ test polling user details with the etag answers 304 """
+        user, user_details = create_user_complete(email="ale@seelv.io",
+                                                  password='pwd12345')
+        self.client.force_authenticate(user=user)
+        res = self.client.get(DETAILS_URL)
+        etag = res['ETag']
+
+        res = self.client.get(DETAILS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        user_details.tel = '+39049000000'
+        user_details.save()
+        res = self.client.get(DETAILS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['user_details']['tel'], '+39049000000')
+
+    def test_retrive_profile_not_modified(self):
+        """test polling the profile with the etag answers 304 """
+        res = self.client.get(ME_URL)
+        etag = res['ETag']
+
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(ME_URL, {'email': 'new@seelv.io'})
+        res = self.client.get(ME_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], 'new@seelv.io')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """ Test the token authentication is served from the cache """
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = create_user(email='test@seelv.io', password='test123')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_token_cached(self):
+        """Test the token is resolved without queries once cached"""
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        # only the query for the etag of the profile is left
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_token_deleted(self):
+        """Test a deleted token stops working immediately"""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_deactivated(self):
+        """Test a deactivated user stops working immediately"""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'tokens': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'tokens',
+            },
+        },
+        TOKEN_AUTH_CACHE='tokens',
+    )
+    def test_invalidation_reaches_other_processes(self):
+        """Test the entries of the other processes are dropped at once"""
+        other = TokenCache()
+        other.set(self.token)
+        self.assertEqual(other.get(self.token.key, shared=False).user_id,
+                         self.user.pk)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(other.get(self.token.key, shared=False))
+
+        key = self.token.key
+        other.set(self.token)
+        self.token.delete()
+        self.assertIsNone(other.get(key))
+
+        # a process reading the token before the invalidation
+        token = Token.objects.create(user=self.user)
+        key = token.key
+        stamp = other.stamp()
+        token.delete()
+        other.set(Token(key=key, user=self.user), stamp)
+        self.assertIsNone(other.get(key))
+        self.assertIsNone(TokenCache().get(key))
+
+    def test_invalidated_while_read(self):
+        """Test a token invalidated during its lookup is not cached"""
+        stamp = token_cache.stamp()
+        key = self.token.key
+        self.token.delete()
+        token_cache.set(Token(key=key, user=self.user), stamp)
+        self.assertIsNone(token_cache.get(key))
+
+    @override_settings(TOKEN_AUTH_CACHE=None, TOKEN_AUTH_CACHE_TTL=60,
+                       TOKEN_AUTH_CACHE_LOCAL_TTL=2)
+    def test_short_ttl_without_shared_cache(self):
+        """Test the entries expire soon when no cache carries the
+        invalidations to the other processes"""
+        self.assertEqual(TokenCache().ttl, 2)
+
+
+class AsyncUserApiTests(TransactionTestCase):
+    """ Test the async user creation and token views, the views run in the
+    hashing threads which need the data committed """
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_create_user_async(self):
+        """Test creating a user with the async view"""
+        payload = {'email': 'test@seelv.io', 'password': 'Test123456!'}
+        res = self.client.post(CREATE_USER_ASYNC_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.json(), {'email': 'test@seelv.io'})
+        user = get_user_model().objects.get(email=payload['email'])
+        self.assertTrue(user.check_password(payload['password']))
+
+    def test_create_user_async_invalid(self):
+        """Test the async view validates like the sync one"""
+        create_user(email='test@seelv.io', password='test123')
+        res = self.client.post(CREATE_USER_ASYNC_URL,
+                               {'email': 'test@seelv.io',
+                                'password': 'test123'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('email', res.json())
+
+        res = self.client.post(CREATE_USER_ASYNC_URL,
+                               {'email': 'new@seelv.io', 'password': 'test'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', res.json())
+
+    def test_async_views_answer_as_sync(self):
+        """Test the async views answer errors exactly as the sync ones"""
+        create_user(email='test@seelv.io', password='test1234')
+        for url, sync_url, payload in (
+                (CREATE_USER_ASYNC_URL, CREATE_USER_URL,
+                 {'email': 'not an email', 'password': 'x'}),
+                (TOKEN_ASYNC_URL, TOKEN_URL,
+                 {'email': 'test@seelv.io', 'password': 'wrong123'}),
+        ):
+            res = self.client.post(url, payload, format='json')
+            sync = self.client.post(sync_url, payload, format='json')
+            self.assertEqual(res.status_code, sync.status_code)
+            self.assertEqual(res.json(), sync.json())
+
+            res = self.client.post(url, '{', content_type='application/json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+            res = self.client.get(url)
+            self.assertEqual(res.status_code,
+                             status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_create_token_async(self):
+        """Test the async view returns the token of the user"""
+        user = create_user(email='test@seelv.io', password='test1234')
+        res = self.client.post(TOKEN_ASYNC_URL, {'email': 'test@seelv.io',
+                                                 'password': 'test1234'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['token'],
+                         Token.objects.get(user=user).key)
+
+    def test_create_token_async_invalid_credentials(self):
+        """Test the async view does not return a token for bad credentials"""
+        create_user(email='test@seelv.io', password='test1234')
+        for payload in ({'email': 'test@seelv.io', 'password': 'wrong123'},
+                        {'email': 'nobody@seelv.io', 'password': 'test1234'},
+                        {'email': 'test@seelv.io', 'password': ''}):
+            res = self.client.post(TOKEN_ASYNC_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertNotIn('token', res.json())
+
+
+class AsyncProfileApiTests(TransactionTestCase):
+    """ Test the async profile views, the worker threads need the data
+    committed so this is a TransactionTestCase """
+
+    def setUp(self):
+        self.user, self.user_details = create_user_complete(
+            email='ale@seelv.io', password='pwd12345'
+        )
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def test_retrieve_profile_async(self):
+        """Test the async views return the profile of the sync ones"""
+        for url, sync_url in ((ME_ASYNC_URL, ME_URL),
+                              (DETAILS_ASYNC_URL, DETAILS_URL)):
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res.json(), self.client.get(sync_url).json())
+
+        res = self.client.get(DETAILS_ASYNC_URL,
+                              HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_retrieve_profile_async_unauthorized(self):
+        """Test the async views need authentication"""
+        for url in (ME_ASYNC_URL, DETAILS_ASYNC_URL):
+            res = APIClient().get(url)
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_update_profile_async_not_allowed(self):
+        """Test the async views are read only"""
+        res = self.client.patch(ME_ASYNC_URL, {'email': 'new@seelv.io'})
+        self.assertEqual(res.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -7,10 +7,14 @@ app_name = 'users'
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
+    path('create/async/', views.create_user_async, name='create_async'),
+    path('token/async/', views.create_token_async, name='token_async'),
     path('me/', views.ManageUserView.as_view(), name='me'),
     path('details/',
         views.ManageDetailsUserView.as_view({'get': 'retrieve'}),
         name='details'),
+    path('me/async/', views.manage_user_async, name='me_async'),
+    path('details/async/', views.manage_details_async, name='details_async'),
     path('create_details/',
         views.CreateDetailsUserView.as_view({'post': 'create'}),
         name='create_details'),
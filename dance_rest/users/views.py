@@ -1,12 +1,20 @@
-from rest_framework import generics, authentication, permissions, \
-                            viewsets, mixins
+from django.http import JsonResponse
+from rest_framework import generics, permissions, viewsets, mixins, \
+                            status
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from django.contrib.auth import get_user_model
 from rest_framework.settings import api_settings
 from users.serializers import UserSerializer, AuthTokenSerializer, \
                               UserDetailsSerializer
 from rest_framework.views import APIView
+from core.async_utils import run_sync_view
+from core.authentication import CachedTokenAuthentication
+from core.db.retry import retry_on_lock
+from core.hashing import run_hashing_view
+from core.mixins import ConditionalGetMixin
 from core.models import UserDetails
+from core.routers import ReplicaReadMixin
 from rest_framework.response import Response
 
 
@@ -14,15 +22,62 @@ class CreateUserView(generics.CreateAPIView):
     """Create a new user in the system """
     serializer_class = UserSerializer
 
+
+# first login of a user writes its token, retried if the database is locked
+get_or_create_token = retry_on_lock(Token.objects.get_or_create)
+
+
 class CreateTokenView(ObtainAuthToken):
     """Create a new auth token for user"""
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token, created = get_or_create_token(
+            user=serializer.validated_data['user']
+        )
+        return Response({'token': token.key})
+
+class UserConditionalGetMixin(ConditionalGetMixin):
+    """validators for the data of the authenticated user"""
+
+    def _get_modified(self):
+        """last change of the user or of its details, one cheap query"""
+        if not hasattr(self, '_modified'):
+            dates = get_user_model().objects.filter(
+                pk=self.request.user.pk
+            ).values_list('date_modified', 'user_details__date_modified')
+            self._modified = max(
+                (date for date in dates.first() or () if date is not None),
+                default=None
+            )
+        return self._modified
+
+    def get_etag_source(self, request):
+        modified = self._get_modified()
+        return '%s:%s:%s' % (self.__class__.__name__, request.user.pk,
+                             modified.isoformat() if modified else '')
+
+    def get_last_modified(self, request):
+        modified = self._get_modified()
+        return modified.timestamp() if modified else None
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            lambda: super(UserConditionalGetMixin, self).retrieve(
+                request, *args, **kwargs
+            ),
+        )
+
+
+class ManageUserView(UserConditionalGetMixin,
+                     generics.RetrieveUpdateAPIView):
     """manage the authenticated user """
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_object(self):
@@ -30,13 +85,15 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
         return self.request.user
 
 
-class ManageDetailsUserView(viewsets.ModelViewSet, mixins.RetrieveModelMixin):
+class ManageDetailsUserView(ReplicaReadMixin, UserConditionalGetMixin,
+                            viewsets.ModelViewSet,
+                            mixins.RetrieveModelMixin):
     """
     A simple ViewSet for viewing and editing the accounts
     associated with the user.
     """
     serializer_class = UserDetailsSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = [permissions.IsAuthenticated,]
     # lookup_field = 'id'
     queryset = get_user_model().objects.all()
@@ -82,3 +139,50 @@ class CreateDetailsUserView(viewsets.ModelViewSet, mixins.CreateModelMixin):
 #     def get_queryset(self):
 #         """Retrieve the recipes for the authenticated user"""
 #         return self.queryset.filter(email=self.request.user)
+
+
+# async views for ASGI, the views hashing a password run in the bounded
+# pool of core.hashing instead of blocking the worker serving the request
+
+def _method_not_allowed(request):
+    return JsonResponse(
+        {'detail': 'Method "%s" not allowed.' % request.method},
+        status=status.HTTP_405_METHOD_NOT_ALLOWED,
+    )
+
+
+create_user = CreateUserView.as_view()
+create_token = CreateTokenView.as_view()
+
+
+async def create_user_async(request):
+    """Create a new user in the system, async version of CreateUserView"""
+    return await run_hashing_view(create_user, request)
+
+
+async def create_token_async(request):
+    """Create a new auth token for user, async version of CreateTokenView"""
+    return await run_hashing_view(create_token, request)
+
+
+# the api is used by clients without a csrf token, as the DRF views
+create_user_async.csrf_exempt = True
+create_token_async.csrf_exempt = True
+
+
+manage_user = ManageUserView.as_view()
+manage_details = ManageDetailsUserView.as_view({'get': 'retrieve'})
+
+
+async def manage_user_async(request):
+    """Retrieve the authenticated user, async version of ManageUserView"""
+    if request.method not in ('GET', 'HEAD'):
+        return _method_not_allowed(request)
+    return await run_sync_view(manage_user, request)
+
+
+async def manage_details_async(request):
+    """Retrieve the user details, async version of ManageDetailsUserView"""
+    if request.method not in ('GET', 'HEAD'):
+        return _method_not_allowed(request)
+    return await run_sync_view(manage_details, request)